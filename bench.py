@@ -0,0 +1,519 @@
+# bench.py - قياس أداء بوت عرب سيد دون الاتصال بالموقع الحقيقي
+import os
+import re
+import sys
+import json
+import asyncio
+import time
+import random
+import hashlib
+import logging
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, unquote, parse_qs, quote
+from typing import Dict, List, Callable, Optional
+
+from bs4 import BeautifulSoup
+
+import bot
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+FIXTURE_BASE = "https://arabseed.example"
+
+class QuietHTTPServer(ThreadingHTTPServer):
+    """خادم لا يطبع أخطاء إغلاق العميل للاتصال (القراءة المتدفقة تتوقف مبكراً أحياناً)"""
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], (ConnectionError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+# ----------------- الصفحات المسجلة -----------------
+def load_fixture(name: str, base: str = FIXTURE_BASE, episode: int = 1, quality: str = "720", size: str = "350 MB") -> str:
+    """تحميل صفحة مسجلة مع تعبئة القيم المتغيرة"""
+    with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+        content = f.read()
+    return (
+        content.replace("__BASE__", base)
+        .replace("__N__", str(episode))
+        .replace("__QUALITY__", quality)
+        .replace("__SIZE__", size)
+    )
+
+# ----------------- التحليل القديم (BeautifulSoup + html.parser) -----------------
+def legacy_extract(html: str) -> Dict:
+    """نفس خطوات التحليل القديمة على BeautifulSoup للمقارنة"""
+    soup = BeautifulSoup(html, 'html.parser')
+    title_elem = soup.find(['h1', 'h2', 'h3', 'title'])
+    iframe = soup.find('iframe', src=True)
+    return {
+        "text": soup.get_text().lower(),
+        "anchors": [a['href'] for a in soup.find_all('a', href=True)],
+        "buttons": [
+            btn.get('onclick') for btn in
+            soup.find_all(['button', 'a'], text=re.compile(r'تحميل|تنزيل|download', re.IGNORECASE))
+            if btn.get('onclick')
+        ],
+        "scripts": [script.string for script in soup.find_all('script') if script.string],
+        "iframe": iframe['src'] if iframe else None,
+        "title": title_elem.get_text(strip=True) if title_elem else None,
+    }
+
+def engine_extract(html: str) -> Dict:
+    """نفس البيانات عبر محرك التحليل الجديد"""
+    page = bot.parse_page(html)
+    return {
+        "text": page.text,
+        "anchors": page.anchors,
+        "buttons": [
+            onclick for text, onclick in page.buttons
+            if text and re.search(r'تحميل|تنزيل|download', text, re.IGNORECASE)
+        ],
+        "scripts": page.scripts,
+        "iframe": page.iframes[0] if page.iframes else None,
+        "title": page.title,
+    }
+
+# ----------------- استخراج الروابط القديم (re.findall لكل نمط) -----------------
+LEGACY_R_LINK_PATTERNS = [
+    r'(https?://[^"\'>\s]+/category/downloadz/\?r=\d+[^"\'>\s]*)',
+    r'(https?://[^"\'>\s]+\?r=\d+[^"\'>\s]*)',
+    r'href=["\']([^"\']+downloadz[^"\']*)["\']',
+    r'window\.location\s*=\s*["\']([^"\']+)["\']',
+]
+
+LEGACY_SCRIPT_PATTERNS = [
+    r'src=["\']([^"\']+\.mp4[^"\']*)["\']',
+    r'file["\']?\s*:\s*["\']([^"\']+\.mp4[^"\']*)["\']',
+    r'url["\']?\s*:\s*["\']([^"\']+\.mp4[^"\']*)["\']',
+    r'["\']?(?:file|url|src)["\']?\s*:\s*["\']([^"\']+)["\']',
+]
+
+def legacy_r_link(html: str):
+    for pattern in LEGACY_R_LINK_PATTERNS:
+        matches = re.findall(pattern, html, re.IGNORECASE)
+        if matches:
+            return matches[0]
+    return None
+
+def legacy_script_link(script: str):
+    for pattern in LEGACY_SCRIPT_PATTERNS:
+        match = re.search(pattern, script, re.IGNORECASE)
+        if match:
+            return match.group(1)
+    return None
+
+def engine_r_link(html: str):
+    found = bot.find_r_link(html)
+    return found[1] if found else None
+
+def engine_script_link(script: str):
+    found = bot.SCRIPT_LINK_ENGINE.search(script)
+    return found[1] if found else None
+
+def bench_extract(iterations: int) -> Dict:
+    """مطابقة محرك الأنماط مع الأنماط القديمة (golden) ومقارنة الزمن
+    
+    حالات ترتيب الأولويات الإضافية في tests/test_extraction_golden.py ضمن الاختبارات.
+    """
+    pages = {name: load_fixture(name) for name in sorted(os.listdir(FIXTURES_DIR)) if name.endswith(".html")}
+
+    results = {}
+    for name, html in pages.items():
+        scripts = bot.parse_page(html).scripts
+        golden = {
+            "r_link": legacy_r_link(html),
+            "script_links": [legacy_script_link(script) for script in scripts],
+        }
+        actual = {
+            "r_link": engine_r_link(html),
+            "script_links": [engine_script_link(script) for script in scripts],
+        }
+        results[name] = {
+            "matches_golden": golden == actual,
+            "r_link": actual["r_link"],
+            "legacy_ms": round(
+                time_call(legacy_r_link, html, iterations)
+                + time_call(lambda items: [legacy_script_link(item) for item in items], scripts, iterations), 4),
+            "engine_ms": round(
+                time_call(engine_r_link, html, iterations)
+                + time_call(lambda items: [engine_script_link(item) for item in items], scripts, iterations), 4),
+        }
+        if golden != actual:
+            results[name]["golden"] = golden
+            results[name]["actual"] = actual
+    return results
+
+def time_call(func: Callable, arg, iterations: int) -> float:
+    """متوسط زمن الاستدعاء بالمللي ثانية"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(arg)
+    return (time.perf_counter() - start) * 1000 / iterations
+
+def bench_parse(iterations: int) -> Dict:
+    """مقارنة زمن التحليل القديم والجديد على كل صفحة مسجلة"""
+    results = {}
+    for name in sorted(os.listdir(FIXTURES_DIR)):
+        if not name.endswith(".html"):
+            continue
+        html = load_fixture(name)
+        legacy, engine = legacy_extract(html), engine_extract(html)
+        mismatched = [
+            field for field in legacy
+            if field != "text" and legacy[field] != engine[field]
+        ]
+        # النص يختلف في المسافات فقط بين المحللين، نقارن الكلمات
+        if legacy["text"].split() != engine["text"].split():
+            mismatched.append("text")
+
+        legacy_ms = time_call(legacy_extract, html, iterations)
+        engine_ms = time_call(engine_extract, html, iterations)
+        results[name] = {
+            "bytes": len(html.encode("utf-8")),
+            "legacy_ms": round(legacy_ms, 3),
+            "engine_ms": round(engine_ms, 3),
+            "speedup": round(legacy_ms / engine_ms, 2) if engine_ms else None,
+            "mismatched_fields": mismatched,
+        }
+    return results
+
+# ----------------- خادم محلي بديل لموقع عرب سيد -----------------
+class FixtureServer:
+    """خادم HTTP محلي يقدم الصفحات المسجلة مع تأخير وأخطاء 403/5xx قابلة للضبط"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_403: float = 0.0, error_5xx: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_403 = error_403
+        self.error_5xx = error_5xx
+        self.requests = 0
+        self.bytes_sent = 0
+        self.status_counts: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._httpd = QuietHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def episode_url(self, episode: int) -> str:
+        return self.base + quote(f"/مسلسل-العنكبوت-الحلقة-{episode}")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def reset_stats(self):
+        with self._lock:
+            self.requests = 0
+            self.bytes_sent = 0
+            self.status_counts = {}
+
+    def _record(self, status: int, size: int):
+        with self._lock:
+            self.requests += 1
+            self.bytes_sent += size
+            self.status_counts[status] = self.status_counts.get(status, 0) + 1
+
+    def route(self, path: str, query: Dict[str, List[str]]):
+        """تحديد الاستجابة: (الحالة، الهيدرات، المحتوى)"""
+        quality = (query.get("quality") or query.get("q") or ["720"])[0]
+        episode = (query.get("ep") or query.get("r") or ["1"])[0]
+
+        if path.startswith("/servers/"):
+            # رابط السيرفر يعيد التوجيه لصفحة الانتظار
+            location = f"/watch/{path.rsplit('/', 1)[-1]}?quality={quality}&ep={episode}"
+            return 302, {"Location": location}, b""
+        if path.startswith("/watch/"):
+            return 200, {}, load_fixture("server.html", self.base, int(episode), quality).encode("utf-8")
+        if path.startswith("/category/downloadz/"):
+            size = {"480": "180 MB", "720": "350 MB", "1080": "1.2 GB"}.get(quality, "350 MB")
+            return 200, {}, load_fixture("download.html", self.base, int(episode), quality, size).encode("utf-8")
+        if path.startswith("/files/"):
+            return 200, {"Content-Type": "video/mp4"}, b"\x00" * 1024
+        match = re.search(r"-(\d+)$", path.rstrip("/"))
+        if match:
+            return 200, {}, load_fixture("episode.html", self.base, int(match.group(1))).encode("utf-8")
+        return 404, {}, "الصفحة غير موجودة".encode("utf-8")
+
+    def _make_handler(self):
+        fixture_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _respond(self, send_body: bool):
+                if fixture_server.latency or fixture_server.jitter:
+                    time.sleep(fixture_server.latency + random.uniform(0, fixture_server.jitter))
+
+                roll = random.random()
+                if roll < fixture_server.error_403:
+                    status, headers, body = 403, {}, b"Forbidden"
+                elif roll < fixture_server.error_403 + fixture_server.error_5xx:
+                    status, headers, body = random.choice([500, 502, 503]), {}, b"Server Error"
+                else:
+                    parsed = urlparse(self.path)
+                    status, headers, body = fixture_server.route(unquote(parsed.path), parse_qs(parsed.query))
+                    # ETag ثابت لكل محتوى حتى يمكن قياس الطلبات الشرطية (304)
+                    if status == 200:
+                        headers["ETag"] = '"%s"' % hashlib.md5(body).hexdigest()
+                        if self.headers.get("If-None-Match") == headers["ETag"]:
+                            status, body = 304, b""
+
+                self.send_response(status)
+                headers.setdefault("Content-Type", "text/html; charset=utf-8")
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if send_body:
+                    self.wfile.write(body)
+                fixture_server._record(status, len(body) if send_body else 0)
+
+            def do_GET(self):
+                self._respond(send_body=True)
+
+            def do_HEAD(self):
+                self._respond(send_body=False)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+# ----------------- قياس المعالجة الكاملة -----------------
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """النسبة المئوية بطريقة أقرب رتبة"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+def summarize(latencies: List[float], successes: int, wall_time: float, server: FixtureServer) -> Dict:
+    count = len(latencies)
+    return {
+        "resolutions": count,
+        "success_rate": round(successes / count, 4) if count else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1) if count else None,
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1) if count else None,
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1) if count else None,
+        "throughput_per_s": round(count / wall_time, 2) if wall_time else None,
+        "requests_per_resolution": round(server.requests / count, 2) if count else None,
+        "bytes_parsed_per_resolution": int(server.bytes_sent / count) if count else None,
+        "status_counts": {str(k): v for k, v in sorted(server.status_counts.items())},
+    }
+
+def run_concurrent(func: Callable, items: List, users: int) -> (List[float], int, float):
+    """تشغيل func على العناصر بعدد مستخدمين متزامنين، وإرجاع الأزمنة وعدد النجاحات"""
+    latencies: List[float] = []
+    successes = 0
+    lock = threading.Lock()
+
+    def timed(item):
+        nonlocal successes
+        start = time.perf_counter()
+        ok = func(item)
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            successes += bool(ok)
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        list(pool.map(timed, items))
+    return latencies, successes, time.perf_counter() - wall_start
+
+def bench_e2e(resolutions: int, users: int, latency: float, jitter: float, error_403: float, error_5xx: float,
+              workers: int = 0) -> Dict:
+    """قياس process_arabseed_url و get_download_info من البداية للنهاية على الخادم المحلي"""
+    server = FixtureServer(latency, jitter, error_403, error_5xx)
+    server.start()
+    # الخادم المحلي يقدم صفحات عرب سيد فيستخدم مستخرج المضيف نفسه
+    bot.final_link_extractors.register("arabseed_download", hosts=(urlparse(server.base).netloc,))(
+        bot.extract_arabseed_download_link
+    )
+    pool = None
+    if workers > 0:
+        pool = bot.ProcessWorkerPool(workers)
+        pool.start()
+        resolve = lambda url: pool.submit(url).result()[0]
+    else:
+        resolve = lambda url: bot.process_arabseed_url(url)[0]
+    try:
+        # كل حلقة مختلفة حتى لا تؤثر أي طبقة كاش على القياس
+        episode_urls = [server.episode_url(i + 1) for i in range(resolutions)]
+        latencies, successes, wall = run_concurrent(resolve, episode_urls, users)
+        episode_report = summarize(latencies, successes, wall, server)
+
+        server.reset_stats()
+        server_links = [f"{server.base}/servers/{i % 3 + 1}?quality=720&ep={i + 1}" for i in range(resolutions)]
+        latencies, successes, wall = run_concurrent(
+            lambda link: bot.get_download_info(link, server.base + "/"), server_links, users
+        )
+        server_report = summarize(latencies, successes, wall, server)
+        if pool is not None:
+            episode_report["workers"] = pool.stats()
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        server.stop()
+
+    return {
+        "config": {
+            "resolutions": resolutions,
+            "users": users,
+            "latency_s": latency,
+            "jitter_s": jitter,
+            "error_403": error_403,
+            "error_5xx": error_5xx,
+            "workers": workers,
+        },
+        "process_arabseed_url": episode_report,
+        "get_download_info": server_report,
+    }
+
+# ----------------- قياس جدولة الرسائل الصادرة -----------------
+class FakeTelegram:
+    """محاكاة حدود Telegram: RetryAfter عند تجاوز الحد الكلي أو حد المحادثة"""
+
+    def __init__(self, latency: float, global_limit: str = "30:30", chat_limit: str = "1:5"):
+        self.latency = latency
+        self.global_bucket = bot.TokenBucket(*bot.parse_rate(global_limit))
+        self.chat_limit = bot.parse_rate(chat_limit)
+        self.chats: Dict[int, bot.TokenBucket] = {}
+        self.calls = 0
+        self.flood_errors = 0
+
+    async def call(self, endpoint: str, data: Dict):
+        self.calls += 1
+        chat = self.chats.setdefault(data["chat_id"], bot.TokenBucket(*self.chat_limit))
+        if self.global_bucket.reserve() > 0 or chat.reserve() > 0:
+            self.flood_errors += 1
+            raise bot.RetryAfter(1)
+        await asyncio.sleep(self.latency)
+        return {"ok": True}
+
+async def run_send_burst(users: int, edits: int, latency: float, scheduled: bool) -> Dict:
+    telegram = FakeTelegram(latency)
+    scheduler = bot.SendScheduler(bot.SEND_GLOBAL_RATE, bot.SEND_CHAT_RATE, bot.SEND_GROUP_RATE, bot.SEND_MAX_RETRIES)
+    if scheduled:
+        await scheduler.initialize()
+    replies: List[float] = []
+    failures = 0
+
+    async def send(endpoint: str, data: Dict, priority: int):
+        return await scheduler.process_request(
+            telegram.call, (endpoint, data), {}, endpoint, data, {"priority": priority}
+        )
+
+    async def user(chat_id: int):
+        nonlocal failures
+        # كل مستخدم: رسالة انتظار، ثم تحديثات تقدم متقاربة، ثم الرد النهائي
+        progress = []
+        try:
+            start = time.perf_counter()
+            await send("sendMessage", {"chat_id": chat_id, "text": "⏳"}, bot.SEND_INTERACTIVE)
+            replies.append(time.perf_counter() - start)
+            for i in range(edits):
+                progress.append(asyncio.ensure_future(send(
+                    "editMessageText", {"chat_id": chat_id, "message_id": 1, "text": str(i)}, bot.SEND_PROGRESS
+                )))
+                await asyncio.sleep(0.05)
+            start = time.perf_counter()
+            await send("editMessageText", {"chat_id": chat_id, "message_id": 1, "text": "done"}, bot.SEND_INTERACTIVE)
+            replies.append(time.perf_counter() - start)
+        except bot.RetryAfter:
+            failures += 1
+        finally:
+            await asyncio.gather(*progress, return_exceptions=True)
+
+    wall_start = time.perf_counter()
+    await asyncio.gather(*(user(chat_id) for chat_id in range(1, users + 1)))
+    wall = time.perf_counter() - wall_start
+    await scheduler.shutdown()
+    return {
+        "reply_p50_ms": round(percentile(replies, 50) * 1000, 1) if replies else None,
+        "reply_p95_ms": round(percentile(replies, 95) * 1000, 1) if replies else None,
+        "failed_users": failures,
+        "api_calls": telegram.calls,
+        "flood_errors": telegram.flood_errors,
+        "merged_edits": scheduler.merged,
+        "wall_s": round(wall, 2),
+    }
+
+def bench_send(users: int, edits: int, latency: float) -> Dict:
+    """مقارنة الإرسال المباشر مع SendScheduler تحت دفعة من المستخدمين على Telegram محاكى"""
+    # بدون المجدول: process_request يمرر الطلب مباشرة لأن الموزع لم يبدأ
+    direct = asyncio.run(run_send_burst(users, edits, latency, scheduled=False))
+    scheduled = asyncio.run(run_send_burst(users, edits, latency, scheduled=True))
+    return {
+        "config": {"users": users, "edits_per_user": edits, "latency_s": latency},
+        "direct": direct,
+        "scheduled": scheduled,
+    }
+
+# ----------------- التشغيل -----------------
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="قياس أداء بوت عرب سيد")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--output", help="حفظ التقرير JSON في ملف للمقارنة بين التشغيلات")
+    common.add_argument("--verbose", action="store_true", help="إظهار سجلات البوت")
+
+    parse_cmd = subparsers.add_parser("parse", parents=[common], help="مقارنة زمن تحليل الصفحات المسجلة")
+    parse_cmd.add_argument("--iterations", type=int, default=50)
+
+    extract_cmd = subparsers.add_parser("extract", parents=[common], help="مطابقة محرك الأنماط مع الأنماط القديمة")
+    extract_cmd.add_argument("--iterations", type=int, default=200)
+
+    e2e_cmd = subparsers.add_parser("e2e", parents=[common], help="قياس المعالجة الكاملة على خادم محلي")
+    e2e_cmd.add_argument("--resolutions", type=int, default=50)
+    e2e_cmd.add_argument("--users", type=int, default=8, help="عدد المستخدمين المتزامنين")
+    e2e_cmd.add_argument("--latency", type=float, default=0.05, help="تأخير كل طلب بالثواني")
+    e2e_cmd.add_argument("--jitter", type=float, default=0.0)
+    e2e_cmd.add_argument("--error-403", type=float, default=0.0, help="نسبة ردود 403")
+    e2e_cmd.add_argument("--error-5xx", type=float, default=0.0, help="نسبة ردود 5xx")
+    e2e_cmd.add_argument("--workers", type=int, default=0, help="عدد عمليات المعالجة (0 = داخل العملية)")
+
+    send_cmd = subparsers.add_parser("send", parents=[common], help="قياس جدولة الرسائل تحت دفعة مستخدمين")
+    send_cmd.add_argument("--users", type=int, default=200, help="عدد المستخدمين في الدفعة")
+    send_cmd.add_argument("--edits", type=int, default=5, help="تحديثات التقدم لكل مستخدم")
+    send_cmd.add_argument("--latency", type=float, default=0.02, help="زمن كل طلب إلى Telegram")
+
+    args = parser.parse_args(argv)
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    if args.command == "parse":
+        report = bench_parse(args.iterations)
+        failed = any(r["mismatched_fields"] for r in report.values())
+    elif args.command == "extract":
+        report = bench_extract(args.iterations)
+        failed = not all(r["matches_golden"] for r in report.values())
+    elif args.command == "e2e":
+        report = bench_e2e(args.resolutions, args.users, args.latency, args.jitter, args.error_403, args.error_5xx, args.workers)
+        failed = False
+    elif args.command == "send":
+        report = bench_send(args.users, args.edits, args.latency)
+        failed = report["scheduled"]["failed_users"] > 0
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,21 +1,38 @@
 # arabseed_telegram_bot_final.py
 import os
 import re
+import asyncio
 import sys
 import json
+import html
 import time
+import sqlite3
+import codecs
 import random
+import hashlib
+import signal
+import multiprocessing
 import logging
+import threading
 import traceback
+import queue
+import contextvars
+import heapq
+from email.utils import parsedate_to_datetime
 from urllib.parse import urlparse, unquote, urlunparse, quote, parse_qs
-from typing import Dict, List, Optional, Tuple, Any
-from datetime import datetime
+from typing import Dict, List, Optional, Tuple, Any, AsyncIterator, Callable
+from datetime import datetime, timezone
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from lxml import etree, html as lxml_html
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest, RetryAfter
 from telegram.ext import (
     Application,
+    BaseRateLimiter,
     CommandHandler,
     MessageHandler,
     CallbackQueryHandler,
@@ -24,15 +41,142 @@ from telegram.ext import (
 )
 
 # ----------------- إعدادات التسجيل -----------------
+# معرف التتبع للمعالجة الحالية، يظهر في كل سطر سجل لربط الطلبات المتزامنة
+_trace_id: contextvars.ContextVar[str] = contextvars.ContextVar("trace_id", default="-")
+
+class TraceIdFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = _trace_id.get()
+        return True
+
 logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    format='%(asctime)s - %(name)s - %(levelname)s - [%(trace_id)s] %(message)s',
     level=logging.INFO
 )
+for _handler in logging.getLogger().handlers:
+    _handler.addFilter(TraceIdFilter())
 logger = logging.getLogger(__name__)
 
 # ----------------- إعدادات البوت -----------------
 TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN", "7064549403:AAHWQsrZPekW1M9kHacqB6N19aMj_xjspf4")
 
+# الحد الأقصى لعدد الروابط التي تتم معالجتها في نفس الوقت
+RESOLVE_CONCURRENCY = int(os.environ.get("ARABSEED_RESOLVE_CONCURRENCY", "8"))
+# عدد تحديثات Telegram التي يمكن معالجتها بالتوازي
+CONCURRENT_UPDATES = int(os.environ.get("ARABSEED_CONCURRENT_UPDATES", "64"))
+# عدد السيرفرات التي تتم معالجتها لكل حلقة، والحد الأقصى للطلبات المتزامنة لكل مضيف
+# (لكل طلب على حدة، ويساوي افتراضياً حجم مجموعة الاتصالات لكل مضيف)
+SERVER_FANOUT = int(os.environ.get("ARABSEED_SERVER_FANOUT", "5"))
+PER_HOST_CONCURRENCY = int(os.environ.get("ARABSEED_PER_HOST_CONCURRENCY", "20"))
+# المهلة القصوى لانتظار سيرفرات الحلقة الواحدة (بالثواني)
+SERVER_TIMEOUT = float(os.environ.get("ARABSEED_SERVER_TIMEOUT", "45"))
+
+# مجموعة الاتصالات المشتركة: عدد المضيفين المحفوظين، وعدد الاتصالات لكل مضيف
+HTTP_POOL_HOSTS = int(os.environ.get("ARABSEED_HTTP_POOL_HOSTS", "50"))
+HTTP_POOL_SIZE = int(os.environ.get("ARABSEED_HTTP_POOL_SIZE", "20"))
+# أحجام مخصصة لبعض المضيفين بصيغة: arabseed.top=40,example.com=10
+HTTP_HOST_POOL_SIZES = os.environ.get("ARABSEED_HTTP_HOST_POOL_SIZES", "")
+
+# إعادة المحاولة: التأخير الأساسي والأقصى (بالثواني)، والمهلة الكلية لمعالجة حلقة واحدة
+RETRY_BASE_DELAY = float(os.environ.get("ARABSEED_RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.environ.get("ARABSEED_RETRY_MAX_DELAY", "8"))
+RESOLUTION_DEADLINE = float(os.environ.get("ARABSEED_RESOLUTION_DEADLINE", "40"))
+# قاطع الدائرة لكل مضيف: عدد الإخفاقات المتتالية قبل الإيقاف، ومدة الإيقاف (بالثواني)
+BREAKER_THRESHOLD = int(os.environ.get("ARABSEED_BREAKER_THRESHOLD", "5"))
+BREAKER_COOLDOWN = float(os.environ.get("ARABSEED_BREAKER_COOLDOWN", "60"))
+
+# مرايا عرب سيد المعروفة، وملف حفظ حالتها، وعدد المرايا التي نجربها لكل طلب
+MIRROR_DOMAINS = os.environ.get("ARABSEED_MIRRORS", "arabseed.top,arabseed.cam,arabseed.ink")
+MIRRORS_FILE = os.environ.get("ARABSEED_MIRRORS_FILE", "mirrors.json")
+MIRROR_MAX_ATTEMPTS = int(os.environ.get("ARABSEED_MIRROR_MAX_ATTEMPTS", "3"))
+MIRRORS_SAVE_INTERVAL = float(os.environ.get("ARABSEED_MIRRORS_SAVE_INTERVAL", "60"))
+# النطاقات المعتمدة في ARABSEED_MIRRORS فقط تعامل كمرايا لنفس الموقع؛ أي نطاق آخر يحتوي "arabseed" قد يكون منتحلاً
+KNOWN_MIRRORS = frozenset(domain.strip().lower() for domain in MIRROR_DOMAINS.split(',') if domain.strip())
+
+# حد معدل الطلبات لكل مضيف بصيغة طلبات/ثانية:سعة الدفعة، مع قواعد خاصة لبعض النطاقات
+# مثال: ARABSEED_RATE_LIMITS="arabseed=4:8,example.com=2:4"
+RATE_LIMIT_DEFAULT = os.environ.get("ARABSEED_RATE_LIMIT_DEFAULT", "10:20")
+RATE_LIMITS = os.environ.get("ARABSEED_RATE_LIMITS", "arabseed=5:10")
+
+# كاش الروابط: عدد العناصر في الذاكرة، مدة الصلاحية، مدة صلاحية الفشل، وملف SQLite اختياري
+CACHE_MAX_ENTRIES = int(os.environ.get("ARABSEED_CACHE_SIZE", "2000"))
+CACHE_TTL = float(os.environ.get("ARABSEED_CACHE_TTL", "1800"))
+CACHE_NEGATIVE_TTL = float(os.environ.get("ARABSEED_CACHE_NEGATIVE_TTL", "60"))
+CACHE_DB_PATH = os.environ.get("ARABSEED_CACHE_DB", "")
+
+# الجلب المسبق للحلقات التالية: عدد الحلقات، عدد العمليات المتزامنة الكلي،
+# وعدد العمليات المسموح بها لكل مسلسل خلال نافذة زمنية (بالثواني)
+PREFETCH_DEPTH = int(os.environ.get("ARABSEED_PREFETCH_DEPTH", "2"))
+PREFETCH_GLOBAL_BUDGET = int(os.environ.get("ARABSEED_PREFETCH_GLOBAL_BUDGET", "2"))
+PREFETCH_SERIES_BUDGET = int(os.environ.get("ARABSEED_PREFETCH_SERIES_BUDGET", "6"))
+PREFETCH_SERIES_WINDOW = float(os.environ.get("ARABSEED_PREFETCH_SERIES_WINDOW", "600"))
+# حصة الجلب المسبق: طلبات متزامنة لكل مضيف، ونسبة من حد المعدل (ضمن حدود المستخدمين لا فوقها)
+PREFETCH_HOST_CONCURRENCY = int(os.environ.get("ARABSEED_PREFETCH_HOST_CONCURRENCY", "2"))
+PREFETCH_RATE_SHARE = float(os.environ.get("ARABSEED_PREFETCH_RATE_SHARE", "0.25"))
+
+# وضع الموسم: أقصى عدد حلقات في الطلب، عدد الحلقات المعالجة بالتوازي،
+# عدد أزرار الجودة لكل حلقة، وأقل فاصل بين تعديلات رسالة التقدم (بالثواني)
+SEASON_MAX_EPISODES = int(os.environ.get("ARABSEED_SEASON_MAX_EPISODES", "30"))
+SEASON_CONCURRENCY = int(os.environ.get("ARABSEED_SEASON_CONCURRENCY", "3"))
+SEASON_BUTTONS_PER_EPISODE = int(os.environ.get("ARABSEED_SEASON_BUTTONS_PER_EPISODE", "3"))
+PROGRESS_EDIT_INTERVAL = float(os.environ.get("ARABSEED_PROGRESS_EDIT_INTERVAL", "2"))
+
+# معدلات الإرسال إلى Telegram بصيغة rate:burst (الكلي، لكل محادثة خاصة، لكل مجموعة)
+# وعدد مرات إعادة الجدولة بعد RetryAfter قبل إظهار الخطأ
+SEND_GLOBAL_RATE = os.environ.get("ARABSEED_SEND_GLOBAL_RATE", "30:30")
+SEND_CHAT_RATE = os.environ.get("ARABSEED_SEND_CHAT_RATE", "1:3")
+SEND_GROUP_RATE = os.environ.get("ARABSEED_SEND_GROUP_RATE", "0.33:3")
+SEND_MAX_RETRIES = int(os.environ.get("ARABSEED_SEND_MAX_RETRIES", "3"))
+
+# جلسات المستخدمين: مدة الخمول قبل الإخراج من الذاكرة، عدد عناصر السجل لكل مستخدم،
+# الفاصل بين عمليات التنظيف (بالثواني)، وملف SQLite اختياري لحفظ السجل بعد إعادة التشغيل
+SESSION_IDLE_TTL = float(os.environ.get("ARABSEED_SESSION_IDLE_TTL", "21600"))
+SESSION_HISTORY_SIZE = int(os.environ.get("ARABSEED_SESSION_HISTORY", "20"))
+SESSION_SWEEP_INTERVAL = float(os.environ.get("ARABSEED_SESSION_SWEEP_INTERVAL", "300"))
+SESSION_DB_PATH = os.environ.get("ARABSEED_SESSION_DB", "")
+
+# وضع التشغيل: polling (افتراضي) أو webhook. في وضع webhook: الرابط العام (إذا كان فارغاً
+# لا يتم تسجيل webhook لدى Telegram، مفيد للتجربة محلياً)، عنوان ومنفذ الاستماع، مسار التحديثات،
+# رمز سري يتحقق منه الخادم (إلزامي: بدونه يرفض البوت العمل بوضع webhook)، وأقصى مدة لانتظار انتهاء المعالجات الجارية عند الإيقاف (بالثواني)
+BOT_MODE = os.environ.get("ARABSEED_MODE", "polling").lower()
+WEBHOOK_URL = os.environ.get("ARABSEED_WEBHOOK_URL", "").rstrip("/")
+WEBHOOK_LISTEN = os.environ.get("ARABSEED_WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.environ.get("PORT", os.environ.get("ARABSEED_WEBHOOK_PORT", "8080")))
+WEBHOOK_PATH = os.environ.get("ARABSEED_WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = os.environ.get("ARABSEED_WEBHOOK_SECRET", "")
+DRAIN_TIMEOUT = float(os.environ.get("ARABSEED_DRAIN_TIMEOUT", "30"))
+
+# عدد عمليات المعالجة المنفصلة (0 = المعالجة داخل عملية البوت باستخدام الخيوط فقط)
+WORKER_PROCESSES = int(os.environ.get("ARABSEED_WORKER_PROCESSES", "0"))
+
+# نقطة /metrics بصيغة Prometheus في وضع polling (في وضع webhook تُضاف لنفس الخادم)، 0 = معطلة
+METRICS_LISTEN = os.environ.get("ARABSEED_METRICS_LISTEN", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("ARABSEED_METRICS_PORT", "9090"))
+
+# أقصى حجم يُقرأ من جسم الصفحة (بالبايت) وحجم كل جزء عند القراءة المتدفقة
+FETCH_MAX_BYTES = int(os.environ.get("ARABSEED_FETCH_MAX_BYTES", str(2 * 1024 * 1024)))
+FETCH_CHUNK_SIZE = int(os.environ.get("ARABSEED_FETCH_CHUNK_SIZE", "16384"))
+
+# التحقق من الروابط المباشرة بطلب HEAD (أو GET بنطاق bytes=0-0): تفعيل، مهلة كل فحص،
+# مدة صلاحية نتيجة الفحص (بالثواني)، وعدد النتائج المحفوظة
+VERIFY_LINKS = os.environ.get("ARABSEED_VERIFY_LINKS", "1") == "1"
+VERIFY_TIMEOUT = float(os.environ.get("ARABSEED_VERIFY_TIMEOUT", "8"))
+VERIFY_TTL = float(os.environ.get("ARABSEED_VERIFY_TTL", "600"))
+VERIFY_CACHE_SIZE = int(os.environ.get("ARABSEED_VERIFY_CACHE_SIZE", "5000"))
+
+# عدد صفحات الحلقات والسيرفرات التي نحفظ لها ETag/Last-Modified وبصمة المحتوى لإعادة التحقق
+VALIDATOR_CACHE_SIZE = int(os.environ.get("ARABSEED_VALIDATOR_CACHE_SIZE", "5000"))
+
+# فهرس المسلسلات والحلقات (SQLite + FTS5) للبحث و/latest، فارغ = في الذاكرة فقط، وعدد نتائج البحث
+INDEX_DB_PATH = os.environ.get("ARABSEED_INDEX_DB", "series_index.db")
+INDEX_SEARCH_LIMIT = int(os.environ.get("ARABSEED_INDEX_SEARCH_LIMIT", "8"))
+
+# عدد مرات الفوز المتتالية لمستخرج على نفس المضيف قبل تجربته أولاً لذلك المضيف
+EXTRACTOR_PROMOTE_AFTER = int(os.environ.get("ARABSEED_EXTRACTOR_PROMOTE_AFTER", "3"))
+
+# ملف سجل التتبع بصيغة JSON lines (سطر لكل طلب ومرحلة ونمط مطابق)، فارغ = معطل
+TRACE_LOG_PATH = os.environ.get("ARABSEED_TRACE_LOG", "")
+
 # ----------------- قائمة User-Agents -----------------
 USER_AGENTS = [
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
@@ -44,27 +188,184 @@ USER_AGENTS = [
 
 # ----------------- إدارة الجلسات -----------------
 class UserSession:
-    def __init__(self):
+    __slots__ = (
+        "processing", "auto_mode", "current_episode", "builder_func",
+        "last_url", "last_title", "history", "batch_task", "last_seen", "stored"
+    )
+    
+    def __init__(self, history_size: int = SESSION_HISTORY_SIZE):
         self.processing = False
         self.auto_mode = False
         self.current_episode = 0
         self.builder_func = None
         self.last_url = ""
         self.last_title = ""
-        self.history = []
+        self.history = deque(maxlen=history_size)
+        self.batch_task = None
+        self.last_seen = time.monotonic()
+        self.stored = False  # له صف في قاعدة البيانات (محسوب ضمن COUNT)
         
     def reset(self):
         self.processing = False
         self.auto_mode = False
         self.current_episode = 0
         self.builder_func = None
+        self.batch_task = None
+    
+    def is_busy(self) -> bool:
+        """هل توجد عملية جارية لا يجب قطعها بإخراج الجلسة"""
+        return self.processing or (self.batch_task is not None and not self.batch_task.done())
+    
+    def memory_size(self) -> int:
+        """تقدير تقريبي لحجم الجلسة في الذاكرة (بالبايت)"""
+        size = sys.getsizeof(self) + sys.getsizeof(self.history)
+        size += sys.getsizeof(self.last_url) + sys.getsizeof(self.last_title)
+        for item in self.history:
+            size += sys.getsizeof(item) + sum(sys.getsizeof(value) for value in item.values())
+        return size
+
+class SessionStore:
+    """مخزن الجلسات: إخراج الجلسات الخاملة من الذاكرة، مع حفظ السجل في SQLite اختيارياً"""
+    
+    def __init__(self, idle_ttl: float, history_size: int, sweep_interval: float, db_path: str = ""):
+        self.idle_ttl = idle_ttl
+        self.history_size = history_size
+        self.sweep_interval = sweep_interval
+        self._sessions: Dict[int, UserSession] = {}
+        self._last_sweep = time.monotonic()
+        self.evictions = 0
+        
+        self.db_path = db_path
+        self._db = None
+        # كل عمليات SQLite (القراءة والكتابة والعد) في خيط واحد منفصل بالترتيب، فلا تحجب حلقة الأحداث،
+        # والقراءة تأتي دائماً بعد أي حفظ معلق قبلها (جلسة أُخرجت ثم عاد صاحبها)
+        self._writer: Optional[ThreadPoolExecutor] = None
+        self._loading: Dict[int, asyncio.Future] = {}
+        # عدد الصفوف المحفوظة، يُحدّث في خيط الكتابة فقط
+        self._stored_count = 0
+    
+    def open(self):
+        """فتح قاعدة الجلسات (في main وليس عند الاستيراد)؛ بدونها تبقى الجلسات في الذاكرة فقط"""
+        if not self.db_path or self._db is not None:
+            return
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="arabseed-sessions")
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "user_id INTEGER PRIMARY KEY, last_url TEXT NOT NULL, last_title TEXT NOT NULL, "
+            "history TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._db.commit()
+        self._stored_count = self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+    
+    def __len__(self) -> int:
+        return len(self._sessions)
+    
+    async def get(self, user_id: int) -> UserSession:
+        now = time.monotonic()
+        if now - self._last_sweep >= self.sweep_interval:
+            self.sweep(now)
+        
+        session = self._sessions.get(user_id)
+        if session is None:
+            if self._db is None:
+                session = self._sessions[user_id] = UserSession(self.history_size)
+            else:
+                # طلبان متزامنان لنفس المستخدم ينتظران نفس التحميل
+                loading = self._loading.get(user_id)
+                if loading is None:
+                    loading = asyncio.ensure_future(self._load(user_id))
+                    self._loading[user_id] = loading
+                    loading.add_done_callback(lambda _: self._loading.pop(user_id, None))
+                session = await asyncio.shield(loading)
+        session.last_seen = now
+        return session
+    
+    def sweep(self, now: Optional[float] = None) -> int:
+        """إخراج الجلسات الخاملة، مع إبقاء الجلسات التي لديها معالجة أو موسم جارٍ"""
+        now = time.monotonic() if now is None else now
+        self._last_sweep = now
+        idle = [
+            user_id for user_id, session in self._sessions.items()
+            if now - session.last_seen > self.idle_ttl and not session.is_busy()
+        ]
+        for user_id in idle:
+            self.save(user_id, self._sessions.pop(user_id))
+        self.evictions += len(idle)
+        if idle:
+            logger.info(f"🧹 إخراج {len(idle)} جلسة خاملة")
+        return len(idle)
+    
+    def save(self, user_id: int, session: UserSession):
+        """حفظ آخر رابط والسجل في SQLite (إن كان مفعلاً) في خيط الكتابة دون انتظار"""
+        if self._db is None or not session.last_url:
+            return
+        # لقطة من الجلسة الآن، لأن السجل قد يتغير قبل أن يصل دور الكتابة
+        row = (user_id, session.last_url, session.last_title,
+               json.dumps(list(session.history), ensure_ascii=False), time.time())
+        self._writer.submit(self._write, session, row)
+    
+    def _write(self, session: UserSession, row: Tuple):
+        try:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sessions (user_id, last_url, last_title, history, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                row
+            )
+            self._db.commit()
+            if not session.stored:
+                self._stored_count += 1
+            session.stored = True
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ تعذر حفظ الجلسة {row[0]}: {e}")
+    
+    def save_all(self):
+        """حفظ كل الجلسات وانتظار انتهاء الكتابة (عند الإيقاف)"""
+        for user_id, session in self._sessions.items():
+            self.save(user_id, session)
+        if self._writer is not None:
+            self._writer.shutdown(wait=True)
+    
+    async def _load(self, user_id: int) -> UserSession:
+        session = UserSession(self.history_size)
+        row = await asyncio.get_running_loop().run_in_executor(self._writer, self._read, user_id)
+        if row:
+            session.last_url, session.last_title = row[0], row[1]
+            session.history.extend(json.loads(row[2]))
+            session.stored = True
+        self._sessions[user_id] = session
+        return session
+    
+    def _read(self, user_id: int) -> Optional[Tuple[str, str, str]]:
+        try:
+            return self._db.execute(
+                "SELECT last_url, last_title, history FROM sessions WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ تعذر تحميل الجلسة {user_id}: {e}")
+            return None
+    
+    def known_users(self) -> int:
+        """عدد المستخدمين الكلي: الصفوف المحفوظة + الجلسات التي لم تُحفظ بعد (دون قراءة القاعدة)"""
+        unsaved = sum(1 for session in self._sessions.values() if not session.stored)
+        return self._stored_count + unsaved
+    
+    def stats(self) -> Dict[str, Any]:
+        total_bytes = sum(session.memory_size() for session in self._sessions.values())
+        return {
+            "active": len(self._sessions),
+            "known": self.known_users(),
+            "evictions": self.evictions,
+            "memory_bytes": total_bytes,
+            "bytes_per_session": total_bytes / len(self._sessions) if self._sessions else 0.0,
+        }
 
-user_sessions = {}
+session_store = SessionStore(SESSION_IDLE_TTL, SESSION_HISTORY_SIZE, SESSION_SWEEP_INTERVAL, SESSION_DB_PATH)
 
-def get_user_session(user_id: int) -> UserSession:
-    if user_id not in user_sessions:
-        user_sessions[user_id] = UserSession()
-    return user_sessions[user_id]
+async def get_user_session(user_id: int) -> UserSession:
+    return await session_store.get(user_id)
 
 # ----------------- دوال المساعدة المحسنة -----------------
 def extract_base_url(url: str) -> str:
@@ -105,42 +406,702 @@ def get_random_headers() -> Dict:
         "TE": "Trailers",
     }
 
-def make_request(url: str, max_retries: int = 3, session: Optional[requests.Session] = None) -> Optional[requests.Response]:
-    """طلب محسن مع إعادة محاولة"""
-    headers = get_random_headers()
+# ----------------- المقاييس (بصيغة Prometheus) -----------------
+BOT_STARTED_AT = datetime.now()
+
+def format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class Counter:
+    """عداد تراكمي مع تسميات اختيارية"""
+    
+    kind = "counter"
+    
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+    
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+    
+    def total(self, **labels) -> float:
+        """مجموع القيم لكل التسميات، أو للقيم المطابقة للتسميات المحددة فقط"""
+        positions = [(self.labels.index(name), str(value)) for name, value in labels.items()]
+        with self._lock:
+            return sum(
+                value for key, value in self._values.items()
+                if all(key[i] == expected for i, expected in positions)
+            )
+    
+    def drain(self) -> Dict:
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+    
+    def merge(self, values: Dict):
+        with self._lock:
+            for key, amount in values.items():
+                self._values[key] = self._values.get(key, 0.0) + amount
+    
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{format_labels(self.labels, key)} {value:g}" for key, value in items]
+
+class Histogram:
+    """توزيع القيم على حدود ثابتة (مع المجموع والعدد) لكل مجموعة تسميات"""
+    
+    kind = "histogram"
+    DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0)
+    
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple[str, ...], List] = {}   # key -> [counts..., sum, count]
+        self._lock = threading.Lock()
+    
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+            entry[-2] += value
+            entry[-1] += 1
+    
+    def summary(self, **labels) -> Optional[Tuple[int, float, float]]:
+        """(العدد، المتوسط، تقدير p95 من الحدود) أو None إذا لا توجد قياسات"""
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if not entry or not entry[-1]:
+                return None
+            count, total = entry[-1], entry[-2]
+            p95 = next((bound for i, bound in enumerate(self.buckets) if entry[i] >= 0.95 * count), float("inf"))
+        return count, total / count, p95
+    
+    def drain(self) -> Dict:
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+    
+    def merge(self, values: Dict):
+        with self._lock:
+            for key, other in values.items():
+                entry = self._values.get(key)
+                if entry is None:
+                    self._values[key] = list(other)
+                else:
+                    self._values[key] = [a + b for a, b in zip(entry, other)]
+    
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(entry)) for key, entry in self._values.items())
+        lines = []
+        for key, entry in items:
+            for i, bound in enumerate(self.buckets):
+                labels = format_labels(self.labels, key, 'le="%g"' % bound)
+                lines.append(f"{self.name}_bucket{labels} {entry[i]}")
+            labels = format_labels(self.labels, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {entry[-1]}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {entry[-2]:g}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, key)} {entry[-1]}")
+        return lines
+
+class MetricsRegistry:
+    """سجل المقاييس: مقاييس مباشرة، وقيم تُقرأ عند الطلب من الكائنات الموجودة (الكاش، الطوابير...)"""
+    
+    def __init__(self):
+        self._metrics: List[Any] = []
+        self._callbacks: List[Tuple[str, str, str, Any]] = []
+    
+    def counter(self, name: str, documentation: str, labels: Tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, documentation, labels)
+        self._metrics.append(metric)
+        return metric
+    
+    def histogram(self, name: str, documentation: str, labels: Tuple[str, ...] = (), **kwargs) -> Histogram:
+        metric = Histogram(name, documentation, labels, **kwargs)
+        self._metrics.append(metric)
+        return metric
+    
+    def callback(self, name: str, kind: str, documentation: str, fn):
+        """fn() تعيد رقماً أو قاموس {(تسمية, قيمة): رقم}"""
+        self._callbacks.append((name, kind, documentation, fn))
+    
+    def drain(self) -> Dict[str, Dict]:
+        """سحب القيم المتراكمة (تستخدمه عمليات المعالجة لإرسال مقاييسها لعملية البوت)"""
+        return {metric.name: metric.drain() for metric in self._metrics}
+    
+    def merge(self, snapshot: Dict[str, Dict]):
+        for metric in self._metrics:
+            if snapshot.get(metric.name):
+                metric.merge(snapshot[metric.name])
+    
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        for name, kind, documentation, fn in self._callbacks:
+            try:
+                value = fn()
+            except Exception as e:
+                logger.warning(f"⚠️ تعذر قراءة المقياس {name}: {e}")
+                continue
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            if isinstance(value, dict):
+                for (label, label_value), item in sorted(value.items()):
+                    lines.append(f'{name}{{{label}="{label_value}"}} {item:g}')
+            else:
+                lines.append(f"{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+STAGE_SECONDS = metrics.histogram(
+    "arabseed_stage_seconds", "Time spent in each resolution stage", ("stage",)
+)
+HTTP_REQUESTS = metrics.counter(
+    "arabseed_http_requests_total", "Outbound HTTP responses by status code", ("status",)
+)
+HTTP_RETRIES = metrics.counter("arabseed_http_retries_total", "make_request attempts after the first")
+HTTP_FORBIDDEN = metrics.counter("arabseed_http_403_total", "403 responses seen by make_request")
+HTTP_EXCEPTIONS = metrics.counter(
+    "arabseed_http_exceptions_total", "Request exceptions raised in make_request", ("type",)
+)
+HTTP_TRUNCATED = metrics.counter(
+    "arabseed_http_truncated_total", "Bodies not read to the end", ("reason",)
+)
+HTTP_BODY_BYTES = metrics.counter("arabseed_http_body_bytes_total", "Response body bytes read by make_request")
+LINK_PROBES = metrics.counter(
+    "arabseed_link_probes_total", "Direct link verification results", ("result",)
+)
+REVALIDATIONS = metrics.counter(
+    "arabseed_revalidations_total", "Conditional re-fetches of known pages by outcome", ("page", "result")
+)
+REVALIDATION_SAVED = metrics.counter(
+    "arabseed_revalidation_saved_seconds_total", "Parse time skipped thanks to 304s or unchanged bodies", ("page",)
+)
+EXTRACTOR_WINS = metrics.counter(
+    "arabseed_extractor_wins_total", "Final link extractions by winning extractor and whether it ran promoted",
+    ("extractor", "promoted")
+)
+SEND_WAIT_SECONDS = metrics.histogram(
+    "arabseed_send_wait_seconds", "Time an outbound Telegram request waited in the send scheduler", ("priority",),
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+SEND_MERGED = metrics.counter("arabseed_send_merged_total", "Message edits dropped because a newer edit replaced them")
+SEND_RETRY_AFTER = metrics.counter(
+    "arabseed_send_retry_after_total", "RetryAfter flood errors returned by Telegram", ("endpoint",)
+)
+RESOLUTIONS = metrics.counter(
+    "arabseed_resolutions_total", "Finished episode resolutions", ("result",)
+)
+
+# مراحل المعالجة بالترتيب، تستخدم في /status: صفحة الحلقة، استخراج السيرفرات، تتبع التوجيه،
+# صفحة السيرفر (حتى إيجاد رابط ?r=)، صفحة ?r=، تحليل الصفحة الأخيرة، فحص الرابط، والإجمالي
+RESOLUTION_STAGES = (
+    "episode_fetch", "link_discovery", "redirect_probe",
+    "server_page_fetch", "r_page_fetch", "final_parse", "verify", "total",
+)
+
+def record_stage(stage: str, started: float):
+    """تسجيل زمن مرحلة بدأت عند started (time.monotonic)"""
+    elapsed = time.monotonic() - started
+    STAGE_SECONDS.observe(elapsed, stage=stage)
+    trace_log.emit("stage", stage=stage, duration_ms=round(elapsed * 1000, 1))
+
+# ----------------- سجل التتبع المنظم -----------------
+def new_trace_id() -> str:
+    return os.urandom(6).hex()
+
+class TraceLog:
+    """كتابة أحداث المعالجة كسطور JSON مرتبطة بمعرف التتبع (للتحليل لاحقاً عبر trace_report.py)"""
+    
+    def __init__(self, path: str = ""):
+        self.path = path
+        self._file = None
+        self._lock = threading.Lock()
+        if path:
+            try:
+                self._file = open(path, "a", encoding="utf-8", buffering=1)
+            except OSError as e:
+                logger.warning(f"⚠️ تعذر فتح سجل التتبع {path}: {e}")
+    
+    @property
+    def enabled(self) -> bool:
+        return self._file is not None
+    
+    def emit(self, event: str, **fields):
+        if self._file is None:
+            return
+        record = {"ts": round(time.time(), 3), "trace": _trace_id.get(), "event": event}
+        record.update(fields)
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            try:
+                self._file.write(line)
+            except (OSError, ValueError):
+                pass
+
+trace_log = TraceLog(TRACE_LOG_PATH)
+
+# ----------------- عميل HTTP المشترك -----------------
+def parse_host_sizes(spec: str) -> Dict[str, int]:
+    """تحليل إعداد بصيغة host=size,host2=size"""
+    sizes = {}
+    for item in spec.split(','):
+        if '=' not in item:
+            continue
+        host, size = item.split('=', 1)
+        try:
+            sizes[host.strip().lower()] = int(size)
+        except ValueError:
+            logger.warning(f"إعداد غير صالح: {item}")
+    return sizes
+
+class HttpClient:
+    """عميل HTTP مشترك لكل العملية: اتصالات دائمة (keep-alive) لكل مضيف وآمن للخيوط"""
+    
+    def __init__(self, pool_connections: int, pool_maxsize: int, host_pool_sizes: Dict[str, int]):
+        self.session = requests.Session()
+        self.session.verify = False  # إيقاف التحقق من SSL مؤقتاً
+        self._adapters = []
+        
+        default_adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self._mount("http://", default_adapter)
+        self._mount("https://", default_adapter)
+        
+        # مجموعات مخصصة لبعض المضيفين (مثل عرب سيد وسيرفرات التحميل الرئيسية)
+        for host, size in host_pool_sizes.items():
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=size)
+            self._mount(f"http://{host}/", adapter)
+            self._mount(f"https://{host}/", adapter)
+    
+    def _mount(self, prefix: str, adapter: HTTPAdapter):
+        self.session.mount(prefix, adapter)
+        if adapter not in self._adapters:
+            self._adapters.append(adapter)
+    
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.session.get(url, **kwargs)
+    
+    def head(self, url: str, **kwargs) -> requests.Response:
+        return self.session.head(url, **kwargs)
+    
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """إحصائيات إعادة استخدام الاتصالات لكل مضيف (hit = طلب على اتصال قائم)"""
+        stats = {}
+        for adapter in self._adapters:
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                host_stats = stats.setdefault(pool.host, {"requests": 0, "hits": 0, "misses": 0})
+                host_stats["requests"] += pool.num_requests
+                host_stats["misses"] += pool.num_connections
+                host_stats["hits"] += max(pool.num_requests - pool.num_connections, 0)
+        return stats
+
+http_client = HttpClient(
+    pool_connections=HTTP_POOL_HOSTS,
+    pool_maxsize=HTTP_POOL_SIZE,
+    host_pool_sizes=parse_host_sizes(HTTP_HOST_POOL_SIZES)
+)
+
+# ----------------- جدولة إعادة المحاولة -----------------
+# الموعد النهائي لمعالجة الحلقة الحالية (يُمرر للخيوط عبر copy_context)
+_resolution_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("resolution_deadline", default=None)
+# معالجة خلفية (جلب مسبق): تستخدم حصة مخفضة من حدود كل مضيف
+_background: contextvars.ContextVar[bool] = contextvars.ContextVar("background", default=False)
+
+def remaining_budget() -> Optional[float]:
+    """الوقت المتبقي من مهلة المعالجة الحالية (None إذا لم تكن هناك مهلة)"""
+    deadline = _resolution_deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+def request_timeout(timeout: float) -> float:
+    """مهلة الطلب بحيث لا تتجاوز المهلة الكلية المتبقية"""
+    remaining = remaining_budget()
+    if remaining is None:
+        return timeout
+    return max(min(timeout, remaining), 0.1)
+
+def submit_in_context(executor: ThreadPoolExecutor, fn, *args):
+    """إرسال مهمة لمجموعة خيوط مع نقل سياق الطلب (المهلة وغيرها)"""
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """تحليل هيدر Retry-After (ثوانٍ أو تاريخ HTTP)"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+def retry_delay(attempt: int, response: Optional[requests.Response] = None) -> float:
+    """تأخير إعادة المحاولة: Retry-After إن وُجد، وإلا تأخير أسي مع عشوائية"""
+    if response is not None:
+        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        if retry_after is not None:
+            return retry_after
+    ceiling = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt))
+    return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+def sleep_within_budget(delay: float) -> bool:
+    """الانتظار قبل إعادة المحاولة إذا سمحت المهلة الكلية بذلك"""
+    remaining = remaining_budget()
+    if remaining is not None and delay >= remaining:
+        return False
+    time.sleep(delay)
+    return True
+
+class CircuitBreaker:
+    """قاطع دائرة لكل مضيف: يرفض الطلبات فوراً بعد عدة إخفاقات متتالية حتى انتهاء مدة التهدئة"""
+    
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures: Dict[str, int] = {}
+        self._opened_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+    
+    def allow(self, host: str) -> bool:
+        with self._lock:
+            opened_at = self._opened_at.get(host)
+            if opened_at is None:
+                return True
+            if time.monotonic() - opened_at >= self.cooldown:
+                # نصف مفتوح: نسمح بطلب تجريبي ونعيد الفتح إذا فشل
+                self._opened_at[host] = time.monotonic()
+                return True
+            return False
+    
+    def record_success(self, host: str):
+        with self._lock:
+            self._failures.pop(host, None)
+            if self._opened_at.pop(host, None) is not None:
+                logger.info(f"🟢 عاد المضيف للعمل: {host}")
+    
+    def record_failure(self, host: str):
+        with self._lock:
+            failures = self._failures.get(host, 0) + 1
+            self._failures[host] = failures
+            if failures >= self.threshold:
+                if host not in self._opened_at:
+                    logger.warning(f"🔴 إيقاف مؤقت للمضيف بعد {failures} إخفاقات: {host}")
+                self._opened_at[host] = time.monotonic()
+    
+    def open_hosts(self) -> List[str]:
+        with self._lock:
+            return sorted(self._opened_at)
+
+host_breaker = CircuitBreaker(BREAKER_THRESHOLD, BREAKER_COOLDOWN)
+
+# ----------------- حد معدل الطلبات لكل مضيف -----------------
+def parse_rate(spec: str) -> Tuple[float, float]:
+    """تحليل المعدل بصيغة rate:burst"""
+    rate, _, burst = spec.partition(':')
+    rate = float(rate)
+    return rate, float(burst) if burst else max(rate, 1.0)
+
+class TokenBucket:
+    """دلو رموز: يسمح بدفعة حتى السعة ثم بمعدل ثابت"""
+    
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+    
+    def reserve(self) -> float:
+        """حجز رمز وإرجاع مدة الانتظار حتى يصبح متاحاً (الرصيد السالب = طابور)"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+    
+    def refund(self):
+        self.tokens = min(self.burst, self.tokens + 1)
+
+class HostRateLimiter:
+    """حد معدل مشترك لكل مضيف؛ الحجز لا يحجب ويعيد مدة الانتظار فقط"""
+    
+    def __init__(self, default_spec: str, rules_spec: str):
+        self.default = parse_rate(default_spec)
+        self.rules: Dict[str, Tuple[float, float]] = {}
+        for item in rules_spec.split(','):
+            if '=' not in item:
+                continue
+            domain, spec = item.split('=', 1)
+            try:
+                self.rules[domain.strip().lower()] = parse_rate(spec.strip())
+            except ValueError:
+                logger.warning(f"إعداد غير صالح: {item}")
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+        self.throttled = 0
+    
+    def _limits_for(self, host: str) -> Tuple[float, float]:
+        # أطول قاعدة يحتويها اسم المضيف (مثل "arabseed" لكل المرايا)
+        matches = [domain for domain in self.rules if domain in host]
+        if matches:
+            return self.rules[max(matches, key=len)]
+        return self.default
+    
+    def reserve(self, host: str) -> float:
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = self._buckets[host] = TokenBucket(*self._limits_for(host))
+            delay = bucket.reserve()
+            if delay > 0:
+                self.throttled += 1
+            return delay
+    
+    def refund(self, host: str):
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is not None:
+                bucket.refund()
+    
+    def scale(self, factor: float):
+        """تقسيم المعدلات على عدة عمليات تتشارك نفس الحد"""
+        scaled = lambda limits: (limits[0] * factor, max(limits[1] * factor, 1.0))
+        with self._lock:
+            self.default = scaled(self.default)
+            self.rules = {domain: scaled(limits) for domain, limits in self.rules.items()}
+            self._buckets.clear()
+    
+    def acquire(self, host: str) -> bool:
+        """انتظار دور الطلب ضمن المهلة الكلية؛ False إذا لم تكفِ المهلة"""
+        delay = self.reserve(host)
+        if delay <= 0:
+            return True
+        if sleep_within_budget(delay):
+            return True
+        self.refund(host)
+        return False
+
+rate_limiter = HostRateLimiter(RATE_LIMIT_DEFAULT, RATE_LIMITS)
+# حصة الجلب المسبق من المعدل: طلباته تمر بهذا الحد أيضاً فلا تأخذ أكثر من نسبتها
+prefetch_rate_limiter = HostRateLimiter(RATE_LIMIT_DEFAULT, RATE_LIMITS)
+prefetch_rate_limiter.scale(PREFETCH_RATE_SHARE)
+
+def acquire_rate(host: str) -> bool:
+    """انتظار دور الطلب في حد المعدل (وحصة الجلب المسبق إذا كان الطلب خلفياً)"""
+    if _background.get() and not prefetch_rate_limiter.acquire(host):
+        return False
+    return rate_limiter.acquire(host)
+
+# حد الطلبات المتزامنة لكل مضيف: يُحجز لمدة الطلب الواحد على المضيف الذي نتصل به فعلاً
+_host_semaphores: Dict[Tuple[str, bool], threading.BoundedSemaphore] = {}
+_host_semaphores_lock = threading.Lock()
+# نصيب هذه العملية من الحد (يُقسم بين عمليات المعالجة كما يُقسم حد المعدل)
+_host_concurrency_share = 1.0
+
+def scale_host_concurrency(factor: float):
+    """ضرب حدود التزامن لكل مضيف في factor (أقل حد 1)؛ تُنشأ السيمافورات من جديد"""
+    global _host_concurrency_share
+    with _host_semaphores_lock:
+        _host_concurrency_share = factor
+        _host_semaphores.clear()
+
+def get_host_semaphore(host: str, background: bool = False) -> threading.BoundedSemaphore:
+    """الحصول على سيمافور المضيف (ينشأ عند أول استخدام)؛ background = حصة الجلب المسبق"""
+    key = (host, background)
+    with _host_semaphores_lock:
+        if key not in _host_semaphores:
+            limit = PREFETCH_HOST_CONCURRENCY if background else PER_HOST_CONCURRENCY
+            _host_semaphores[key] = threading.BoundedSemaphore(max(int(limit * _host_concurrency_share), 1))
+        return _host_semaphores[key]
+
+def acquire_host_slot(host: str) -> Optional[Callable[[], None]]:
+    """حجز مكان لطلب واحد على المضيف دون تجاوز مهلة المعالجة؛ يعيد دالة التحرير أو None
+    
+    الطلب الخلفي يحجز أولاً من حصة الجلب المسبق ثم من حد المضيف نفسه،
+    فلا يشغل أكثر من PREFETCH_HOST_CONCURRENCY من أماكن المستخدمين.
+    """
+    semaphores = [get_host_semaphore(host)]
+    if _background.get():
+        semaphores.insert(0, get_host_semaphore(host, background=True))
+    acquired = []
+    
+    def release():
+        for semaphore in reversed(acquired):
+            semaphore.release()
+    
+    for semaphore in semaphores:
+        remaining = remaining_budget()
+        if not semaphore.acquire(timeout=max(remaining, 0.0) if remaining is not None else None):
+            release()
+            return None
+        acquired.append(semaphore)
+    return release
+
+# حالات لا فائدة من إعادة المحاولة فيها
+NON_RETRYABLE_STATUSES = {400, 401, 404, 410}
+
+def read_body(response: requests.Response, max_bytes: int,
+              stop_when: Optional[Callable[[str, int], bool]] = None) -> str:
+    """قراءة جسم الرد المتدفق على أجزاء حتى الحد الأقصى أو حتى يطلب stop_when التوقف
+    
+    stop_when(النص المقروء حتى الآن، بداية الجزء الجديد فيه) -> True للتوقف.
+    يُخزن المقروء في response حتى تعمل response.text و response.content كالمعتاد.
+    تعيد سبب الانتهاء: complete أو capped أو early.
+    """
+    chunks = []
+    total = 0
+    reason = "complete"
+    decoder = None
+    text = ""
+    if stop_when is not None:
+        decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(errors="replace")
+    
+    for chunk in response.iter_content(FETCH_CHUNK_SIZE):
+        chunks.append(chunk)
+        total += len(chunk)
+        if total >= max_bytes:
+            reason = "capped"
+            break
+        if decoder is not None:
+            new_from = len(text)
+            text += decoder.decode(chunk)
+            if stop_when(text, new_from):
+                reason = "early"
+                break
+    
+    response._content = b"".join(chunks)[:max_bytes]
+    response._content_consumed = True
+    HTTP_BODY_BYTES.inc(len(response._content))
+    if reason != "complete":
+        # بقية الجسم لن تُقرأ، لذا لا يمكن إعادة استخدام الاتصال
+        HTTP_TRUNCATED.inc(reason=reason)
+        response.close()
+    return reason
+
+def trace_fetch(url: str, host: str, started: float, attempt: int,
+                response: Optional[requests.Response] = None, error: Optional[str] = None):
+    """سطر تتبع لطلب واحد"""
+    if not trace_log.enabled:
+        return
+    trace_log.emit(
+        "fetch",
+        url=url,
+        host=host,
+        status=response.status_code if response is not None else None,
+        bytes=len(response.content) if response is not None else 0,
+        duration_ms=round((time.monotonic() - started) * 1000, 1),
+        attempt=attempt + 1,
+        error=error
+    )
+
+def make_request(url: str, max_retries: int = 3, headers: Optional[Dict] = None,
+                 allow_redirects: bool = True, timeout: int = 20,
+                 ok_statuses: Tuple[int, ...] = (200,), max_bytes: int = FETCH_MAX_BYTES,
+                 stop_when: Optional[Callable[[str, int], bool]] = None) -> Optional[requests.Response]:
+    """طلب محسن مع إعادة محاولة عبر العميل المشترك (يعيد الرد إذا كانت حالته ضمن ok_statuses)
+    
+    يُقرأ الجسم متدفقاً حتى max_bytes، ويتوقف مبكراً إذا أعاد stop_when قيمة True (للردود الناجحة فقط).
+    """
+    request_headers = get_random_headers()
+    if headers:
+        request_headers.update(headers)
+    host = urlparse(url).netloc.lower()
     
     for attempt in range(max_retries):
+        if attempt:
+            HTTP_RETRIES.inc()
+        if not host_breaker.allow(host):
+            logger.warning(f"🚫 تخطي {host}: المضيف متوقف مؤقتاً")
+            return None
+        remaining = remaining_budget()
+        if remaining is not None and remaining <= 0:
+            logger.warning(f"⏱️ انتهت مهلة المعالجة قبل طلب: {url}")
+            return None
+        if not acquire_rate(host):
+            logger.warning(f"⏱️ لا يكفي الوقت المتبقي لانتظار دور الطلب: {url}")
+            return None
+        
+        release_slot = acquire_host_slot(host)
+        if release_slot is None:
+            logger.warning(f"⏱️ انتهت المهلة قبل توفر مكان للطلب على {host}: {url}")
+            return None
+        
+        response = None
+        fetch_started = time.monotonic()
+        attempt_timeout = request_timeout(timeout)
         try:
-            if session:
-                response = session.get(
-                    url,
-                    headers=headers,
-                    timeout=20,
-                    allow_redirects=True,
-                    verify=False  # إيقاف التحقق من SSL مؤقتاً
-                )
-            else:
-                response = requests.get(
+            try:
+                response = http_client.get(
                     url,
-                    headers=headers,
-                    timeout=20,
-                    allow_redirects=True,
-                    verify=False
+                    headers=request_headers,
+                    timeout=attempt_timeout,
+                    allow_redirects=allow_redirects,
+                    stream=True
                 )
+                HTTP_REQUESTS.inc(status=response.status_code)
+                read_body(response, max_bytes, stop_when if response.status_code in ok_statuses else None)
+            finally:
+                release_slot()
+            trace_fetch(url, host, fetch_started, attempt, response=response)
             
-            if response.status_code == 200:
+            if response.status_code in ok_statuses:
+                host_breaker.record_success(host)
                 return response
             elif response.status_code == 403:
                 logger.warning(f"403 Forbidden on attempt {attempt + 1}")
-                time.sleep(2 ** attempt)  # زيادة وقت الانتظار تدريجياً
-                headers = get_random_headers()  # تغيير الهيدرات
+                HTTP_FORBIDDEN.inc()
+                request_headers = get_random_headers()  # تغيير الهيدرات
+                if headers:
+                    request_headers.update(headers)
+            elif response.status_code in NON_RETRYABLE_STATUSES:
+                logger.warning(f"Status {response.status_code}, not retrying")
+                return None
             else:
                 logger.warning(f"Status {response.status_code} on attempt {attempt + 1}")
-                time.sleep(1)
+                if response.status_code >= 500:
+                    host_breaker.record_failure(host)
                 
         except requests.exceptions.RequestException as e:
             logger.error(f"Request error on attempt {attempt + 1}: {e}")
-            time.sleep(2 ** attempt)
+            HTTP_EXCEPTIONS.inc(type=type(e).__name__)
+            trace_fetch(url, host, fetch_started, attempt, error=type(e).__name__)
+            # مهلة قصّرها الموعد النهائي للمعالجة وانتهت: السبب ضيق وقتنا وليس المضيف
+            cut_short = attempt_timeout < timeout and time.monotonic() - fetch_started >= attempt_timeout
+            if cut_short:
+                logger.info(f"⏱️ لا يحسب إخفاقاً على {host}: المهلة قُصّرت إلى {attempt_timeout:.1f} ث")
+            else:
+                host_breaker.record_failure(host)
+        
+        if attempt + 1 < max_retries and not sleep_within_budget(retry_delay(attempt, response)):
+            logger.warning(f"⏱️ لا يكفي الوقت المتبقي لإعادة المحاولة: {url}")
+            return None
     
     return None
 
@@ -152,16 +1113,24 @@ def find_last_numeric_segment_in_path(path_unquoted: str) -> Tuple[Optional[int]
             return i, parts[i]
     return None, None
 
+def split_page_extension(path_unquoted: str) -> Tuple[str, str]:
+    """فصل لاحقة الصفحة (.html أو .php) عن المسار حتى لا تخفي رقم الحلقة: (المسار، اللاحقة)"""
+    stripped = path_unquoted.rstrip('/')
+    for extension in ('.html', '.php'):
+        if stripped.lower().endswith(extension):
+            return stripped[:-len(extension)], stripped[-len(extension):]
+    return path_unquoted, ''
+
 def build_episode_url_from_any(url: str, episode_number: int) -> Optional[str]:
-    """بناء رابط الحلقة"""
+    """بناء رابط الحلقة (مع الإبقاء على لاحقة .html إن وجدت)"""
     p = urlparse(url)
-    path_unquoted = unquote(p.path)
+    path_unquoted, extension = split_page_extension(unquote(p.path))
     idx, num = find_last_numeric_segment_in_path(path_unquoted)
     if idx is None:
         return None
     parts = path_unquoted.strip('/').split('-')[:idx+1]
     parts[-1] = str(episode_number)
-    new_path = '/' + '-'.join(parts)
+    new_path = '/' + '-'.join(parts) + extension
     quoted_path = quote(new_path, safe="/%")
     new_parsed = (p.scheme, p.netloc, quoted_path, '', '', '')
     return urlunparse(new_parsed)
@@ -169,275 +1138,2261 @@ def build_episode_url_from_any(url: str, episode_number: int) -> Optional[str]:
 def extract_episode_and_base(url: str) -> Tuple[Optional[int], Optional[callable]]:
     """استخراج رقم الحلقة ودالة البناء"""
     p = urlparse(url)
-    path_unquoted = unquote(p.path)
+    path_unquoted, _ = split_page_extension(unquote(p.path))
     idx, num = find_last_numeric_segment_in_path(path_unquoted)
     if idx is None or num is None:
         return None, None
     return int(num), lambda ep: build_episode_url_from_any(url, ep)
 
+# ----------------- محرك تحليل الصفحات -----------------
+# الوسوم التي لا يدخل نصها في نص الصفحة (مثل get_text في BeautifulSoup)
+NON_TEXT_TAGS = {'script', 'style', 'template'}
+TITLE_TAGS = {'h1', 'h2', 'h3', 'title'}
+
+class ParsedPage:
+    """نتيجة تحليل الصفحة في مرور واحد: الروابط والأزرار والسكربتات والإطارات والعنوان والنص"""
+    __slots__ = ('anchors', 'buttons', 'scripts', 'iframes', 'title', 'text')
+    
+    def __init__(self):
+        self.anchors: List[str] = []                        # قيم href لكل <a href>
+        self.buttons: List[Tuple[Optional[str], str]] = []  # (النص, onclick) لكل <a>/<button> فيه onclick
+        self.scripts: List[str] = []                        # نصوص <script> غير الفارغة
+        self.iframes: List[str] = []                        # قيم src لكل <iframe src>
+        self.title: Optional[str] = None                    # نص أول h1/h2/h3/title
+        self.text = ""                                      # نص الصفحة بأحرف صغيرة
+
+def element_string(el) -> Optional[str]:
+    """مكافئ ‎.string في BeautifulSoup: نص العنصر إذا كان له ابن نصي واحد فقط"""
+    children = list(el)
+    if not children:
+        return el.text
+    if len(children) == 1 and not el.text and not children[0].tail and isinstance(children[0].tag, str):
+        return element_string(children[0])
+    return None
+
+def parse_page(html: str) -> ParsedPage:
+    """تحليل الصفحة بـ lxml وجمع كل ما نحتاجه في مرور واحد على الشجرة"""
+    page = ParsedPage()
+    if not html or not html.strip():
+        return page
+    
+    try:
+        root = lxml_html.document_fromstring(html)
+    except ValueError:
+        # lxml يرفض النصوص التي تحتوي على تعريف ترميز XML
+        root = lxml_html.document_fromstring(html.encode('utf-8'))
+    except etree.ParserError:
+        return page
+    
+    text_parts = []
+    for el in root.iter():
+        tag = el.tag
+        if not isinstance(tag, str):
+            # تعليقات وتعليمات معالجة: نأخذ النص الذي يليها فقط
+            if el.tail:
+                text_parts.append(el.tail)
+            continue
+        
+        if el.text and tag not in NON_TEXT_TAGS:
+            text_parts.append(el.text)
+        if el.tail:
+            text_parts.append(el.tail)
+        
+        if tag == 'a':
+            href = el.get('href')
+            if href is not None:
+                page.anchors.append(href)
+        elif tag == 'script':
+            if el.text:
+                page.scripts.append(el.text)
+        elif tag == 'iframe':
+            src = el.get('src')
+            if src is not None:
+                page.iframes.append(src)
+        
+        if tag in ('a', 'button'):
+            onclick = el.get('onclick')
+            if onclick:
+                page.buttons.append((element_string(el), onclick))
+        
+        if page.title is None and tag in TITLE_TAGS:
+            page.title = ''.join(part.strip() for part in el.itertext())
+    
+    page.text = ''.join(text_parts).lower()
+    return page
+
+# ----------------- محرك الأنماط المُجمّعة -----------------
+class PatternEngine:
+    """عدة أنماط مرتبة حسب الأولوية في تعبير واحد مُجمّع يمر على النص مرة واحدة"""
+    
+    def __init__(self, patterns: List[Tuple[str, str]], hint: Optional[str] = None, flags: int = re.IGNORECASE):
+        # كل نمط يحتوي على مجموعة مسماة واحدة باسمه هي القيمة المستخرجة
+        self._priority = {name: i for i, (name, _) in enumerate(patterns)}
+        # بحث أمامي (lookahead) لا يستهلك النص: عند كل موضع نحصل على أعلى نمط يطابق هناك
+        self.regex = re.compile('(?=' + '|'.join(pattern for _, pattern in patterns) + ')', flags)
+        # فحص سريع: النصوص التي لا تحتوي على أي كلمة مطلوبة لا تحتاج للبحث الكامل
+        self.hint = re.compile(hint, flags) if hint else None
+    
+    def search(self, text: str) -> Optional[Tuple[str, str]]:
+        """أعلى نمط أولوية يطابق في أي مكان، مع أول تطابق له (مثل تجربة الأنماط بالترتيب)"""
+        if self.hint is not None and not self.hint.search(text):
+            return None
+        best = None
+        best_priority = len(self._priority)
+        for match in self.regex.finditer(text):
+            name = match.lastgroup
+            priority = self._priority[name]
+            if priority < best_priority:
+                best = (name, match.group(name))
+                best_priority = priority
+                if priority == 0:
+                    break
+        return best
+
+# رابط الملف داخل سكربتات صفحة التحميل (بالترتيب)
+SCRIPT_LINK_ENGINE = PatternEngine([
+    ('script_src_mp4', r'src=["\'](?P<script_src_mp4>[^"\']+\.mp4[^"\']*)["\']'),
+    ('script_file_mp4', r'file["\']?\s*:\s*["\'](?P<script_file_mp4>[^"\']+\.mp4[^"\']*)["\']'),
+    ('script_url_mp4', r'url["\']?\s*:\s*["\'](?P<script_url_mp4>[^"\']+\.mp4[^"\']*)["\']'),
+    ('script_any', r'["\']?(?:file|url|src)["\']?\s*:\s*["\'](?P<script_any>[^"\']+)["\']'),
+], hint=r'src|file|url')
+
+# رابط صفحة التحميل في صفحة السيرفر، بالأولوية:
+# downloadz/?r= ثم أي ?r= ثم href فيه downloadz ثم window.location
+R_LINK_PATTERN_NAMES = ('downloadz_r', 'r_param', 'downloadz_href', 'window_location')
+# مُقطِّع واحد للصفحة: روابط http كاملة، وقيم href، وقيم window.location
+# (href و window.location يستهلكان البادئة فقط حتى يبقى الرابط داخلهما قابلاً للمطابقة)
+R_LINK_TOKEN_RE = re.compile(
+    r'(?=[hw])(?:(?P<url>https?://[^"\'>\s]+)'
+    r'|href=["\'](?=(?P<href>[^"\']+)["\'])'
+    r'|window\.location\s*=\s*["\'](?=(?P<location>[^"\']+)["\']))',
+    re.IGNORECASE
+)
+DOWNLOADZ_R_RE = re.compile(r'./category/downloadz/\?r=\d', re.IGNORECASE)
+R_PARAM_RE = re.compile(r'.\?r=\d', re.IGNORECASE)
+EMBEDDED_TOKEN_RE = re.compile(r'href=|window\.location', re.IGNORECASE)
+
+def find_r_link(html: str, complete_top_only: bool = False) -> Optional[Tuple[str, str]]:
+    """البحث عن رابط ?r= بمرور واحد على الصفحة مع الحفاظ على أولوية الأنماط
+    
+    complete_top_only: لجزء من الصفحة أثناء القراءة؛ يعيد فقط تطابق النمط الأول إذا اكتمل الرابط
+    (نتيجة لن تتغير بقراءة بقية الصفحة)، وإلا None.
+    """
+    first_matches: List[Optional[str]] = [None] * len(R_LINK_PATTERN_NAMES)
+    pos = 0
+    while True:
+        match = R_LINK_TOKEN_RE.search(html, pos)
+        if not match:
+            break
+        pos = match.end()
+        kind = match.lastgroup
+        
+        if kind == 'url':
+            url = match.group('url')
+            body = url.split('://', 1)[1]
+            # الرابط الكامل هو نفسه نتيجة النمطين الأولين (الجزء الأخير [^...]* يأخذ بقية الرابط)
+            if DOWNLOADZ_R_RE.search(body):
+                if complete_top_only and match.end() >= len(html):
+                    return None
+                return R_LINK_PATTERN_NAMES[0], url
+            if first_matches[1] is None and R_PARAM_RE.search(body):
+                first_matches[1] = url
+            # حالة نادرة: href= أو window.location ملتصق داخل الرابط
+            embedded = EMBEDDED_TOKEN_RE.search(url)
+            if embedded:
+                pos = match.start() + embedded.start()
+        elif kind == 'href':
+            if first_matches[2] is None and match.group('href').lower().find('downloadz', 1) != -1:
+                first_matches[2] = match.group('href')
+        elif first_matches[3] is None:
+            first_matches[3] = match.group('location')
+    
+    if complete_top_only:
+        return None
+    for name, value in zip(R_LINK_PATTERN_NAMES, first_matches):
+        if value is not None:
+            return name, value
+    return None
+
+def r_link_stopper() -> Callable[[str, int], bool]:
+    """شرط التوقف المبكر لصفحة السيرفر: بعد اكتمال أول رابط downloadz/?r= (أعلى الأنماط أولوية)"""
+    seen = False
+    
+    def stop(text: str, new_from: int) -> bool:
+        nonlocal seen
+        # فحص سريع للجزء الجديد فقط قبل تشغيل find_r_link على المقروء كاملاً
+        if not seen:
+            seen = DOWNLOADZ_R_RE.search(text, max(0, new_from - 64)) is not None
+        return seen and find_r_link(text, complete_top_only=True) is not None
+    
+    return stop
+
+MEDIA_EXT_RE = re.compile(r'\.(mp4|m3u8|mkv|avi)$', re.IGNORECASE)
+FILE_SIZE_RE = re.compile(r'(\d+(?:\.\d+)?)\s*(MB|GB|KB)', re.IGNORECASE)
+DOWNLOAD_TEXT_RE = re.compile(r'تحميل|تنزيل|download', re.IGNORECASE)
+ONCLICK_HREF_RE = re.compile(r"location\.href=['\"]([^'\"]+)['\"]")
+DOWNLOAD_PATH_RE = re.compile(r'/download/', re.IGNORECASE)
+
+# ----------------- إعادة التحقق الشرطية من الصفحات -----------------
+class PageValidators:
+    """حفظ ETag/Last-Modified وبصمة جسم كل صفحة مع نتيجة تحليلها، لتخطي التحليل عند عدم التغيير"""
+    
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def lookup(self, url: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                self._entries.move_to_end(url)
+            return entry
+    
+    @staticmethod
+    def conditional_headers(entry: Optional[Dict[str, Any]]) -> Dict[str, str]:
+        headers = {}
+        if entry is not None:
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+    
+    def reuse(self, page: str, entry: Optional[Dict[str, Any]], response: requests.Response) -> Optional[Any]:
+        """نتيجة التحليل المحفوظة إذا لم تتغير الصفحة (304 أو نفس البصمة)، وإلا None"""
+        if entry is None:
+            REVALIDATIONS.inc(page=page, result="new")
+            return None
+        if response.status_code == 304:
+            result = "not_modified"
+        elif response.status_code == 200 and body_hash(response.content) == entry["hash"]:
+            result = "same_body"
+        else:
+            REVALIDATIONS.inc(page=page, result="changed")
+            return None
+        REVALIDATIONS.inc(page=page, result=result)
+        REVALIDATION_SAVED.inc(entry["parse_seconds"], page=page)
+        logger.info(f"♻️ الصفحة لم تتغير ({result})، تخطي التحليل")
+        return entry["value"]
+    
+    def store(self, url: str, response: requests.Response, value: Any, parse_seconds: float):
+        entry = {
+            "etag": response.headers.get("etag"),
+            "last_modified": response.headers.get("last-modified"),
+            "hash": body_hash(response.content),
+            "value": value,
+            "parse_seconds": parse_seconds,
+        }
+        with self._lock:
+            self._entries[url] = entry
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+def body_hash(content: bytes) -> str:
+    return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+page_validators = PageValidators(VALIDATOR_CACHE_SIZE)
+
+# ----------------- مستخرجات الرابط النهائي -----------------
+class ExtractorRegistry:
+    """مستخرجات الرابط النهائي من صفحة التحميل
+    
+    المستخرجات الخاصة بمضيف معين تمر مرة واحدة على HTML الخام بنمط موجه لصفحات ذلك المضيف،
+    وتُجرب أولاً، ثم المستخرجات العامة على الصفحة المحللة بترتيب أولوية ثابت
+    (الروابط ثم السكربتات ثم الإطارات) حتى لا يسبق نمط واسع رابطاً أدق.
+    المستخرج (خاص أو عام) الذي يفوز EXTRACTOR_PROMOTE_AFTER مرات متتالية لمضيف يُجرب أولاً له،
+    ويُلغى ذلك عند أول مرة لا يفوز فيها.
+    مستخرج المضيف: fn(html, base_url)، والعام: fn(page, base_url)، وكلاهما يعيد رابطاً مطلقاً أو None.
+    """
+    
+    def __init__(self, promote_after: int):
+        self.promote_after = promote_after
+        self._host_extractors: List[Tuple[str, str, Callable]] = []
+        self._generic: List[Tuple[str, Callable]] = []
+        self._streaks: Dict[str, Tuple[str, int]] = {}
+        self._promoted: Dict[str, str] = {}
+        self._lock = threading.Lock()
+    
+    def register(self, name: str, hosts: Tuple[str, ...] = ()):
+        """مزخرف لتسجيل مستخرج؛ hosts نطاقات المضيف (تطابق النطاق نفسه ونطاقاته الفرعية)، فارغة = مستخرج عام"""
+        def decorator(fn):
+            if hosts:
+                self._host_extractors.extend((host, name, fn) for host in hosts)
+            else:
+                self._generic.append((name, fn))
+            return fn
+        return decorator
+    
+    def _order_for(self, host: str) -> Tuple[List[Tuple[str, Callable, bool]], Optional[str]]:
+        """ترتيب المستخرجات للمضيف: (الاسم، الدالة، هل يعمل على HTML الخام)، والمستخرج المُقدَّم"""
+        # لقطة من المستخرج المُقدَّم تحت القفل، فلا يتغير الترتيب أثناء المحاولة
+        with self._lock:
+            promoted = self._promoted.get(host)
+        order = [(name, fn, True) for domain, name, fn in self._host_extractors
+                 if host == domain or host.endswith('.' + domain)]
+        order += [(name, fn, False) for name, fn in self._generic]
+        # sorted مستقر: المُقدَّم أولاً والباقي بترتيب الأولوية
+        order.sort(key=lambda item: item[0] != promoted)
+        return order, promoted
+    
+    def extract(self, html: str, page: ParsedPage, base_url: str, host: str) -> Optional[Tuple[str, str]]:
+        """(اسم المستخرج، الرابط) لأول مستخرج ينجح، أو None"""
+        order, promoted = self._order_for(host)
+        for name, fn, raw_html in order:
+            link = fn(html, base_url) if raw_html else fn(page, base_url)
+            if link:
+                self._record(host, name, promoted)
+                return name, link
+        self._record(host, None, promoted)
+        return None
+    
+    def _record(self, host: str, winner: Optional[str], promoted: Optional[str]):
+        """تحديث سلسلة الفوز للمضيف وتقديم المستخرج أو إلغاء تقديمه"""
+        EXTRACTOR_WINS.inc(extractor=winner or "none", promoted=str(winner is not None and winner == promoted).lower())
+        with self._lock:
+            if promoted is not None and winner != promoted:
+                # المستخرج المُقدَّم لم يعد يفوز لهذا المضيف (قد يكون خيط آخر ألغاه قبلنا)
+                if self._promoted.pop(host, None) is not None:
+                    logger.info(f"🧭 إلغاء تقديم المستخرج {promoted} للمضيف {host}")
+            if winner is None:
+                self._streaks.pop(host, None)
+                return
+            name, streak = self._streaks.get(host, (winner, 0))
+            streak = streak + 1 if name == winner else 1
+            self._streaks[host] = (winner, streak)
+            if streak >= self.promote_after and self._promoted.get(host) != winner:
+                self._promoted[host] = winner
+                logger.info(f"🧭 تقديم المستخرج {winner} للمضيف {host}")
+    
+    def promoted(self) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._promoted)
+
+final_link_extractors = ExtractorRegistry(EXTRACTOR_PROMOTE_AFTER)
+
+def absolute_link(link: str, base_url: str) -> str:
+    return link if link.startswith('http') else base_url + link
+
+# زر التحميل في صفحات downloadz على مرايا عرب سيد (السمات بأي ترتيب داخل الوسم)
+ARABSEED_DOWNLOAD_BTN_RE = re.compile(
+    r'<a\s(?=[^>]*\bclass=["\'][^"\']*\bdownload-btn\b)[^>]*\bhref=["\']([^"\']+)["\']', re.IGNORECASE
+)
+
+# مطابقة المرايا المعتمدة فقط، وليس أي نطاق يحتوي "arabseed"
+@final_link_extractors.register("arabseed_download", hosts=tuple(sorted(KNOWN_MIRRORS)))
+def extract_arabseed_download_link(html: str, base_url: str) -> Optional[str]:
+    """رابط زر التحميل المباشر (download-btn) في صفحة التحميل"""
+    match = ARABSEED_DOWNLOAD_BTN_RE.search(html)
+    if match:
+        return absolute_link(match.group(1), base_url)
+    return None
+
+@final_link_extractors.register("anchor")
+def extract_anchor_link(page: ParsedPage, base_url: str) -> Optional[str]:
+    """أول رابط MP4 أو direct أو download في الصفحة"""
+    for href in page.anchors:
+        if MEDIA_EXT_RE.search(href) or 'direct' in href.lower() or 'download' in href.lower():
+            return absolute_link(href, base_url)
+    return None
+
+@final_link_extractors.register("script")
+def extract_script_link(page: ParsedPage, base_url: str) -> Optional[str]:
+    """أول رابط في النصوص البرمجية حسب أولوية أنماط SCRIPT_LINK_ENGINE"""
+    for script in page.scripts:
+        found = SCRIPT_LINK_ENGINE.search(script)
+        if found:
+            return absolute_link(found[1], base_url)
+    return None
+
+@final_link_extractors.register("iframe")
+def extract_iframe_link(page: ParsedPage, base_url: str) -> Optional[str]:
+    """مصدر أول iframe"""
+    if page.iframes:
+        return absolute_link(page.iframes[0], base_url)
+    return None
+
 # ----------------- دالة استخراج معلومات التحميل المحسنة -----------------
 def get_download_info(server_href: str, referer: str) -> Optional[Dict]:
     """استخراج معلومات التحميل من رابط السيرفر"""
     try:
-        session = requests.Session()
-        headers = get_random_headers()
-        headers["Referer"] = referer
-        session.headers.update(headers)
+        referer_headers = {"Referer": referer}
         
         logger.info(f"🔍 جاري معالجة: {server_href}")
         
         # الخطوة 1: تتبع إعادة التوجيه
-        try:
-            response = session.get(server_href, timeout=15, allow_redirects=False)
-            if response.status_code in [301, 302, 303, 307, 308] and 'location' in response.headers:
-                redirected_url = response.headers['location']
-                if not redirected_url.startswith('http'):
-                    base = extract_base_url(server_href)
-                    redirected_url = base + redirected_url
-                logger.info(f"↪️ تم التوجيه إلى: {redirected_url}")
-                server_href = redirected_url
-        except:
-            pass
+        started = time.monotonic()
+        probe_host = urlparse(server_href).netloc.lower()
+        release_slot = None
+        if host_breaker.allow(probe_host) and acquire_rate(probe_host):
+            release_slot = acquire_host_slot(probe_host)
+        if release_slot is not None:
+            try:
+                headers = get_random_headers()
+                headers.update(referer_headers)
+                probe_started = time.monotonic()
+                try:
+                    response = http_client.get(server_href, headers=headers, timeout=request_timeout(15), allow_redirects=False)
+                finally:
+                    release_slot()
+                trace_fetch(server_href, probe_host, probe_started, 0, response=response)
+                if response.status_code in [301, 302, 303, 307, 308] and 'location' in response.headers:
+                    redirected_url = response.headers['location']
+                    if not redirected_url.startswith('http'):
+                        base = extract_base_url(server_href)
+                        redirected_url = base + redirected_url
+                    logger.info(f"↪️ تم التوجيه إلى: {redirected_url}")
+                    server_href = redirected_url
+            except:
+                pass
+        record_stage("redirect_probe", started)
         
-        # الخطوة 2: الحصول على الصفحة الرئيسية
-        response = make_request(server_href, session=session)
+        # الخطوة 2: الحصول على الصفحة الرئيسية (طلب شرطي إذا كانت الصفحة معروفة)
+        started = time.monotonic()
+        validator = page_validators.lookup(server_href)
+        response = make_request(
+            server_href,
+            headers={**referer_headers, **page_validators.conditional_headers(validator)},
+            ok_statuses=(200, 304),
+            stop_when=r_link_stopper()
+        )
         if not response:
             return None
         
-        html_content = response.text
-        
-        # البحث عن رابط ?r= أو downloadz
-        r_link = None
-        patterns = [
-            r'(https?://[^"\'>\s]+/category/downloadz/\?r=\d+[^"\'>\s]*)',
-            r'(https?://[^"\'>\s]+\?r=\d+[^"\'>\s]*)',
-            r'href=["\']([^"\']+downloadz[^"\']*)["\']',
-            r'window\.location\s*=\s*["\']([^"\']+)["\']',
-        ]
-        
-        for pattern in patterns:
-            matches = re.findall(pattern, html_content, re.IGNORECASE)
-            if matches:
-                r_link = matches[0]
+        r_link = page_validators.reuse("server", validator, response)
+        if r_link is None:
+            if response.status_code != 200:
+                return None
+            parse_started = time.monotonic()
+            html_content = response.text
+            
+            # البحث عن رابط ?r= أو downloadz
+            found = find_r_link(html_content)
+            if found:
+                pattern_name, r_link = found
+                logger.info(f"🧩 النمط المطابق: {pattern_name}")
+                trace_log.emit("match", step="r_link", pattern=pattern_name, url=server_href)
                 if r_link.startswith('//'):
                     r_link = 'https:' + r_link
                 elif not r_link.startswith('http'):
                     r_link = extract_base_url(server_href) + r_link
+            
+            if not r_link:
+                # إذا لم نجد، استخدم الرابط الحالي
+                r_link = response.url
+                trace_log.emit("match", step="r_link", pattern=None, url=server_href)
+            page_validators.store(server_href, response, r_link, time.monotonic() - parse_started)
+        
+        logger.info(f"✅ وجدت رابط التحميل: {r_link}")
+        record_stage("server_page_fetch", started)
+        
+        # الخطوة 3: جلب صفحة التحميل ?r= (التباعد بين الطلبات يتولاه rate_limiter)
+        started = time.monotonic()
+        response = make_request(r_link, headers=referer_headers)
+        if not response:
+            return None
+        record_stage("r_page_fetch", started)
+        
+        started = time.monotonic()
+        page = parse_page(response.text)
+        
+        # البحث عن رابط التحميل النهائي: مستخرجات المضيف ثم المستخرجات العامة
+        final_source, final_link = final_link_extractors.extract(
+            response.text, page, extract_base_url(r_link), urlparse(r_link).netloc.lower()
+        ) or (None, None)
+        
+        record_stage("final_parse", started)
+        trace_log.emit("match", step="final_link", pattern=final_source, url=r_link)
+        
+        if not final_link:
+            logger.error("❌ لم أتمكن من استخراج رابط التحميل")
+            return None
+        
+        logger.info(f"🎯 رابط التحميل النهائي: {final_link}")
+        
+        # استخراج معلومات الملف
+        file_name = None
+        file_size = None
+        
+        # البحث عن العنوان والحجم
+        if page.title is not None:
+            title_text = page.title
+            # استخراج حجم الملف من النص
+            size_match = FILE_SIZE_RE.search(title_text)
+            if size_match:
+                file_size = f"{size_match.group(1)} {size_match.group(2).upper()}"
+            
+            # استخدام العنوان كاسم ملف
+            file_name = title_text[:50]  # تقليل الطول
+        
+        # إذا لم نجد اسماً، نستخدم اسم الملف من الرابط
+        if not file_name:
+            file_name = os.path.basename(final_link).split('?')[0] or "ملف_تحميل"
+        
+        # إذا لم نجد حجماً، نستخدم قيمة افتراضية
+        if not file_size:
+            file_size = "غير معروف"
+        
+        # تنظيف الرابط
+        final_link = final_link.replace(" ", "%20")
+        
+        return {
+            'direct_link': final_link,
+            'file_name': file_name,
+            'file_size': file_size
+        }
+        
+    except Exception as e:
+        logger.error(f"❌ خطأ في استخراج معلومات التحميل: {e}")
+        return None
+
+# ----------------- التحقق من الروابط المباشرة -----------------
+CONTENT_RANGE_RE = re.compile(r'/\s*(\d+)\s*$')
+# حالات تعني أن الرابط لا يعمل للمستخدم (5xx والأخطاء المؤقتة لا تُسقط الرابط)
+DEAD_LINK_STATUSES = {401, 403, 404, 410, 451}
+# بعض المضيفين يرفضون HEAD، فنعيد الفحص بـ GET لبايت واحد
+HEAD_FALLBACK_STATUSES = {403, 405, 501}
+QUALITY_RANK = {"1080p": 4, "720p": 3, "480p": 2, "360p": 1}
+
+def format_file_size(size: int) -> str:
+    if size >= 1024 ** 3:
+        return f"{size / 1024 ** 3:.2f} GB"
+    if size >= 1024 ** 2:
+        return f"{size / 1024 ** 2:.0f} MB"
+    return f"{max(size, 1) / 1024:.0f} KB"
+
+class TTLCache:
+    """كاش صغير بمدة صلاحية وحد أقصى للعناصر (الأقل استخداماً يخرج أولاً)"""
+    
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+    
+    def set(self, key: str, value: Any):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+probe_cache = TTLCache(VERIFY_CACHE_SIZE, VERIFY_TTL)
+
+def probe_direct_link(url: str, referer: Optional[str] = None) -> Dict[str, Any]:
+    """فحص الرابط المباشر دون تحميله: HEAD أولاً ثم GET بنطاق bytes=0-0 إذا لزم
+    
+    alive: True يعمل، False لا يعمل، None غير معروف (خطأ مؤقت، لا يُحفظ في الكاش)
+    """
+    cached = probe_cache.get(url)
+    if cached is not None:
+        return cached
+    
+    result = {"alive": None, "status": None, "size": None, "content_type": ""}
+    host = urlparse(url).netloc.lower()
+    release_slot = None
+    if host_breaker.allow(host) and acquire_rate(host):
+        release_slot = acquire_host_slot(host)
+    if release_slot is None:
+        LINK_PROBES.inc(result="unknown")
+        return result
+    
+    headers = get_random_headers()
+    if referer:
+        headers["Referer"] = referer
+    started = time.monotonic()
+    method = "HEAD"
+    try:
+        response = http_client.head(url, headers=headers, timeout=request_timeout(VERIFY_TIMEOUT), allow_redirects=True)
+        status = response.status_code
+        length = response.headers.get("content-length")
+        content_type = response.headers.get("content-type", "")
+        
+        if status in HEAD_FALLBACK_STATUSES or (status == 200 and not length):
+            method = "RANGE"
+            headers["Range"] = "bytes=0-0"
+            # الجسم لا يُقرأ: إذا تجاهل الخادم Range فقد يكون الملف كاملاً
+            response = http_client.get(url, headers=headers, timeout=request_timeout(VERIFY_TIMEOUT), stream=True)
+            response.close()
+            status = response.status_code
+            content_type = response.headers.get("content-type", content_type)
+            match = CONTENT_RANGE_RE.search(response.headers.get("content-range", ""))
+            length = match.group(1) if match else (response.headers.get("content-length") if status == 200 else None)
+        
+        alive = None if status >= 500 else (status not in DEAD_LINK_STATUSES and status < 400)
+        result = {
+            "alive": alive,
+            "status": status,
+            "size": int(length) if length and length.isdigit() else None,
+            "content_type": content_type.split(";")[0].strip().lower(),
+        }
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"⚠️ تعذر فحص الرابط {url}: {e}")
+    finally:
+        release_slot()
+    
+    trace_log.emit(
+        "probe", url=url, host=host, method=method, status=result["status"], size=result["size"],
+        alive=result["alive"], duration_ms=round((time.monotonic() - started) * 1000, 1)
+    )
+    LINK_PROBES.inc(result={True: "alive", False: "dead", None: "unknown"}[result["alive"]])
+    if result["alive"] is not None:
+        probe_cache.set(url, result)
+    return result
+
+def verify_download_info(info: Dict, referer: Optional[str] = None) -> Optional[Dict]:
+    """التحقق من الرابط النهائي وتحديث الحجم الحقيقي؛ None إذا كان الرابط لا يعمل"""
+    started = time.monotonic()
+    probe = probe_direct_link(info['direct_link'], referer)
+    record_stage("verify", started)
+    if probe["alive"] is False:
+        logger.warning(f"🗑️ تم استبعاد رابط لا يعمل (رمز {probe['status']}): {info['direct_link']}")
+        return None
+    
+    info = dict(info)
+    info['verified'] = probe["alive"] is True
+    if probe["size"]:
+        info['size_bytes'] = probe["size"]
+        info['file_size'] = format_file_size(probe["size"])
+    return info
+
+def result_rank(link: str, info: Dict) -> Tuple[int, int, int]:
+    """ترتيب الأزرار: الجودة الأعلى، ثم الروابط التي تم التحقق منها، ثم الحجم الأكبر"""
+    quality = detect_quality(link, info['file_name'])
+    return (
+        -QUALITY_RANK.get(quality, 0),
+        -int(bool(info.get('verified'))),
+        -(info.get('size_bytes') or 0),
+    )
+
+# ----------------- مرايا عرب سيد -----------------
+def is_known_mirror(host: str) -> bool:
+    """هل النطاق من المرايا المعتمدة (مع تجاهل www.)"""
+    host = host.lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    return host in KNOWN_MIRRORS
+
+class MirrorRegistry:
+    """تتبع صحة مرايا عرب سيد المعتمدة (نسبة النجاح وزمن الاستجابة) وترتيبها، مع الحفظ بين التشغيلات
+    
+    النطاقات غير المعتمدة لا تدخل السجل ولا الترتيب ولا ملف الحفظ أبداً.
+    """
+    
+    # وزن القياس الجديد في متوسط زمن الاستجابة المتحرك
+    LATENCY_ALPHA = 0.3
+    
+    def __init__(self, domains: List[str], path: str, save_interval: float):
+        self.path = path
+        self.save_interval = save_interval
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+        self._last_save = time.monotonic()
+        self._dirty = False
+        self._allowed = set(domains)
+        for domain in domains:
+            self._ensure(domain)
+        self._load()
+    
+    def _ensure(self, domain: str) -> Dict[str, float]:
+        if domain not in self._stats:
+            self._stats[domain] = {"successes": 0, "failures": 0, "consecutive_failures": 0, "latency": 0.0}
+        return self._stats[domain]
+    
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                saved = json.load(f)
+            for domain, stats in saved.items():
+                # نطاقات حذفت من ARABSEED_MIRRORS (أو أضيفت بالخطأ سابقاً) لا تعود من الملف
+                if domain in self._allowed:
+                    self._ensure(domain).update(stats)
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️ تعذر تحميل حالة المرايا: {e}")
+    
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            snapshot = json.dumps(self._stats, indent=2)
+            self._dirty = False
+            self._last_save = time.monotonic()
+        try:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(snapshot)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"⚠️ تعذر حفظ حالة المرايا: {e}")
+    
+    def record(self, domain: str, ok: bool, latency: float):
+        if domain not in self._allowed:
+            return
+        with self._lock:
+            stats = self._ensure(domain)
+            if ok:
+                stats["successes"] += 1
+                stats["consecutive_failures"] = 0
+                if stats["latency"]:
+                    stats["latency"] += self.LATENCY_ALPHA * (latency - stats["latency"])
+                else:
+                    stats["latency"] = latency
+            else:
+                stats["failures"] += 1
+                stats["consecutive_failures"] += 1
+            self._dirty = True
+            should_save = time.monotonic() - self._last_save >= self.save_interval
+        if should_save:
+            self.save()
+    
+    def _score(self, stats: Dict[str, float]) -> float:
+        # نسبة نجاح مع افتراض مبدئي (1 نجاح من 2)، مقسومة على زمن الاستجابة
+        success_rate = (stats["successes"] + 1) / (stats["successes"] + stats["failures"] + 2)
+        success_rate /= 1 + stats["consecutive_failures"]
+        return success_rate / (1 + stats["latency"])
+    
+    def ranked(self) -> List[str]:
+        with self._lock:
+            return sorted(self._stats, key=lambda domain: self._score(self._stats[domain]), reverse=True)
+    
+    def candidate_urls(self, url: str) -> List[str]:
+        """رابط المستخدم منقولاً إلى أفضل المرايا بالترتيب (المسار نفسه في كل المرايا)
+        
+        نطاق المستخدم يبقى دائماً ضمن المحاولات: إذا لم يكن بين الأفضل يأخذ المحاولة الأخيرة،
+        لأنه قد يكون النطاق الجديد الوحيد الذي يعمل بعد تغيير النطاقات. النطاق غير المعتمد
+        يجرب لهذا الطلب فقط ولا يضاف إلى السجل.
+        """
+        p = urlparse(url)
+        domain = p.netloc.lower()
+        if 'arabseed' not in domain:
+            return [url]
+        if domain.startswith('www.') and domain[4:] in self._allowed:
+            domain = domain[4:]
+        mirrors = self.ranked()[:max(MIRROR_MAX_ATTEMPTS, 1)]
+        if domain not in mirrors:
+            mirrors = mirrors[:max(MIRROR_MAX_ATTEMPTS, 1) - 1] + [domain]
+        return [url if mirror == domain else urlunparse(p._replace(netloc=mirror)) for mirror in mirrors]
+    
+    def summary(self) -> List[Tuple[str, float, float]]:
+        """(النطاق، نسبة النجاح، زمن الاستجابة بالمللي ثانية) مرتبة من الأفضل"""
+        result = []
+        for domain in self.ranked():
+            with self._lock:
+                stats = dict(self._stats[domain])
+            total = stats["successes"] + stats["failures"]
+            result.append((domain, stats["successes"] / total if total else 0.0, stats["latency"] * 1000))
+        return result
+
+mirror_registry = MirrorRegistry(
+    [domain.strip().lower() for domain in MIRROR_DOMAINS.split(',') if domain.strip()],
+    MIRRORS_FILE,
+    MIRRORS_SAVE_INTERVAL
+)
+
+# ----------------- دالة المعالجة الرئيسية -----------------
+def detect_quality(link: str, file_name: str) -> str:
+    """تحديد الجودة من الرابط أو اسم الملف"""
+    if '360' in link or '360' in file_name:
+        return "360p"
+    elif '480' in link or '480' in file_name:
+        return "480p"
+    elif '720' in link or '720' in file_name:
+        return "720p"
+    elif '1080' in link or '1080' in file_name:
+        return "1080p"
+    return "جودة عالية"
+
+def resolve_server_link(server_href: str, referer: str) -> Optional[Dict]:
+    """استخراج معلومات التحميل ثم فحص الرابط المباشر (حد التزامن يطبق لكل طلب داخل make_request)"""
+    info = get_download_info(server_href, referer)
+    if info and VERIFY_LINKS:
+        return verify_download_info(info, referer)
+    return info
+
+def extract_server_links(html: str) -> Tuple[Optional[str], List[str]]:
+    """تحليل صفحة الحلقة واستخراج روابط السيرفرات كما وردت في الصفحة (رسالة الخطأ، الروابط)"""
+    page = parse_page(html)
+    
+    # التحقق من وجود الحلقة
+    error_indicators = [
+        'لم يتم العثور',
+        'صفحة غير موجودة',
+        'not found',
+        '404',
+        'error',
+        'عذراً'
+    ]
+    
+    if any(indicator in page.text for indicator in error_indicators):
+        return "❌ الحلقة غير موجودة أو الرابط غير صحيح", []
+    
+    # الخطوة 2: البحث عن روابط التحميل
+    download_links = []
+    
+    # البحث في الروابط
+    for href in page.anchors:
+        if any(keyword in href.lower() for keyword in ['download', 'تحميل', 'server', 'سيرفر', 'جودة', 'quality']):
+            download_links.append(href)
+    
+    # إذا لم نجد، نبحث في الأزرار
+    if not download_links:
+        for text, onclick in page.buttons:
+            if text and DOWNLOAD_TEXT_RE.search(text):
+                # استخراج الرابط من onclick
+                match = ONCLICK_HREF_RE.search(onclick)
+                if match:
+                    download_links.append(match.group(1))
+    
+    # إذا لم نجد بعد، نستخدم بعض الروابط الشائعة
+    if not download_links:
+        # البحث عن أي رابط يحتوي على /download/
+        for href in page.anchors:
+            if DOWNLOAD_PATH_RE.search(href):
+                download_links.append(href)
+    
+    if not download_links:
+        return "❌ لم أتمكن من العثور على روابط التحميل في الصفحة", []
+    return None, download_links
+
+def discover_server_links(url: str) -> Tuple[Optional[str], List[str], str]:
+    """الخطوتان 1 و2: جلب صفحة الحلقة واستخراج روابط السيرفرات (رسالة الخطأ، الروابط، الرابط المستخدم)"""
+    logger.info(f"🚀 بدء معالجة الرابط: {url}")
+    
+    # الخطوة 1: جلب صفحة الحلقة من أفضل مرآة (طلب شرطي إذا كانت الصفحة معروفة)، والانتقال للتالية عند الفشل
+    fetch_started = time.monotonic()
+    response = None
+    validator = None
+    # رد 404/410 نحتفظ به لرسالة "غير موجودة" فقط إذا لم تنجح أي مرآة أخرى
+    not_found = None
+    for candidate in mirror_registry.candidate_urls(url):
+        started = time.monotonic()
+        candidate_validator = page_validators.lookup(candidate)
+        candidate_response = make_request(
+            candidate,
+            headers=page_validators.conditional_headers(candidate_validator),
+            ok_statuses=(200, 304, 404, 410)
+        )
+        missing = candidate_response is not None and candidate_response.status_code in (404, 410)
+        # مرآة فقدت الصفحة (أو نطاق متوقف يعيد 404) تُحسب فشلاً؛ 404 على رابط المستخدم نفسه قد يكون رابطاً خاطئاً
+        reachable = candidate_response is not None and not (missing and candidate != url)
+        mirror_registry.record(urlparse(candidate).netloc.lower(), reachable, time.monotonic() - started)
+        if missing:
+            if not_found is None or candidate == url:
+                not_found = (candidate, candidate_validator, candidate_response)
+            continue
+        if candidate_response is not None:
+            if candidate != url:
+                logger.info(f"🌐 استخدام المرآة: {candidate}")
+            url, validator, response = candidate, candidate_validator, candidate_response
+            break
+    if response is None and not_found is not None:
+        url, validator, response = not_found
+    record_stage("episode_fetch", fetch_started)
+    if not response:
+        return "❌ تعذر الوصول إلى الرابط، تأكد من صحته", [], url
+    
+    extracted = page_validators.reuse("episode", validator, response)
+    if extracted is None:
+        # التحقق من أن الصفحة موجودة
+        if response.status_code != 200:
+            return f"❌ خطأ في جلب الصفحة (رمز: {response.status_code})", [], url
+        
+        discovery_started = time.monotonic()
+        extracted = extract_server_links(response.text)
+        page_validators.store(url, response, extracted, time.monotonic() - discovery_started)
+        record_stage("link_discovery", discovery_started)
+    
+    error, download_links = extracted
+    if error:
+        return error, [], url
+    logger.info(f"🔗 وجدت {len(download_links)} روابط تحميل")
+    
+    # أول SERVER_FANOUT روابط فقط
+    base_url = extract_base_url(url)
+    server_links = []
+    for i, link in enumerate(download_links[:SERVER_FANOUT]):
+        if not link.startswith('http'):
+            link = base_url + link
+        logger.info(f"⚙️ معالجة الرابط {i+1}: {link}")
+        server_links.append(link)
+    return None, server_links, url
+
+def build_server_button(link: str, info: Optional[Dict], referer: Optional[str] = None) -> Optional[List[Dict]]:
+    """صف الزر الخاص بسيرفر واحد (None إذا لم ينجح استخراج الرابط)
+    
+    referer يحفظ مع الزر لأن بعض المضيفين يرفضون فحص الرابط بدونه عند إعادة التحقق من الكاش.
+    """
+    if not info or not info.get('direct_link'):
+        return None
+    quality = detect_quality(link, info['file_name'])
+    
+    # إنشاء زر
+    btn_text = f"📥 {quality} - {info['file_size']}"
+    logger.info(f"✅ تم إضافة {quality}")
+    button = {"text": btn_text, "url": info['direct_link']}
+    if referer:
+        button["referer"] = referer
+    return [button]
+
+def finish_resolution(url: str, entries: List[Tuple[str, Dict, List[Dict]]]) -> Tuple[bool, str, List[List[Dict]]]:
+    """النتيجة النهائية بعد انتهاء السيرفرات: (رابط السيرفر، المعلومات، صف الزر) بترتيب الصفحة"""
+    # sorted مستقر، فالأزرار المتساوية تبقى بترتيب الصفحة
+    buttons_data = [row for _, _, row in sorted(entries, key=lambda entry: result_rank(entry[0], entry[1]))]
+    if not buttons_data:
+        return False, "❌ لم أتمكن من استخراج روابط تحميل صالحة", []
+    
+    # استخراج العنوان
+    title = extract_title_from_url(url)
+    
+    logger.info(f"🎉 تمت المعالجة بنجاح: {title}")
+    return True, title, buttons_data
+
+def process_arabseed_url(url: str) -> Tuple[bool, str, List[List[Dict]]]:
+    """معالجة رابط عرب سيد ضمن مهلة كلية محددة"""
+    started = time.monotonic()
+    deadline_token = _resolution_deadline.set(started + RESOLUTION_DEADLINE)
+    trace_token = _trace_id.set(new_trace_id())
+    trace_log.emit("resolution_start", url=url)
+    result = (False, "", [])
+    try:
+        result = resolve_servers(url)
+        return result
+    finally:
+        record_stage("total", started)
+        RESOLUTIONS.inc(result="success" if result[0] else "failure")
+        trace_log.emit("resolution_end", url=url, success=result[0], buttons=len(result[2]))
+        _trace_id.reset(trace_token)
+        _resolution_deadline.reset(deadline_token)
+
+def resolve_servers(url: str) -> Tuple[bool, str, List[List[Dict]]]:
+    """الخطوات 1-3 بشكل متزامن (الموعد النهائي مُعيّن مسبقاً في السياق)"""
+    try:
+        error, server_links, url = discover_server_links(url)
+        if error:
+            return False, error, []
+        
+        # الخطوة 3: معالجة الروابط بالتوازي
+        referer = extract_base_url(url) + "/"
+        executor = prefetch_server_executor if _background.get() else server_executor
+        futures = [
+            submit_in_context(executor, resolve_server_link, link, referer)
+            for link in server_links
+        ]
+        
+        # ننتظر حتى أبطأ سيرفر ضمن المهلة، ونحتفظ بما انتهى
+        done, not_done = wait(futures, timeout=request_timeout(SERVER_TIMEOUT))
+        for future in not_done:
+            future.cancel()
+        if not_done:
+            logger.warning(f"⏱️ تجاوز {len(not_done)} سيرفر المهلة ({SERVER_TIMEOUT} ث)")
+        
+        # النتائج حسب ترتيب الروابط في الصفحة
+        entries = []
+        for link, future in zip(server_links, futures):
+            if future not in done or future.exception():
+                continue
+            info = future.result()
+            row = build_server_button(link, info, referer)
+            if row:
+                entries.append((link, info, row))
+        
+        return finish_resolution(url, entries)
+        
+    except Exception as e:
+        logger.error(f"❌ خطأ في معالجة الرابط: {e}")
+        return False, f"❌ حدث خطأ غير متوقع: {str(e)}", []
+
+# ----------------- كاش الروابط -----------------
+def normalize_episode_url(url: str) -> str:
+    """مفتاح موحد للحلقة يتجاهل نطاق المرآة المعتمدة ولاحقة .html والترميز"""
+    p = urlparse(url.strip())
+    host = p.netloc.lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    # المرايا المعتمدة فقط تشترك في نفس المسار؛ أي نطاق آخر يبقى كاملاً في المفتاح حتى لا يشارك نتائجها
+    if is_known_mirror(host):
+        host = 'arabseed'
+    
+    path = unquote(p.path)
+    # بعض الروابط مرمزة مرتين
+    while '%' in path and unquote(path) != path:
+        path = unquote(path)
+    path = path.rstrip('/').lower()
+    for suffix in ('.html', '.php'):
+        if path.endswith(suffix):
+            path = path[:-len(suffix)]
+    
+    key = host + path
+    if p.query:
+        key += '?' + unquote(p.query)
+    return key
+
+class ResultCache:
+    """كاش النتائج: طبقة LRU في الذاكرة مع TTL، وطبقة SQLite اختيارية تبقى بعد إعادة التشغيل
+    
+    البحث في الذاكرة فقط يتم على حلقة الأحداث؛ القراءة والكتابة في SQLite تتم في خيط واحد منفصل.
+    """
+    
+    def __init__(self, max_entries: int, ttl: float, negative_ttl: float, db_path: str = ""):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries: "OrderedDict[str, Tuple[float, Tuple]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        
+        self.db_path = db_path
+        self._db = None
+        # كل عمليات SQLite في هذا الخيط بالترتيب، فلا تحتاج قفلاً خاصاً بها
+        self._io: Optional[ThreadPoolExecutor] = None
+    
+    def open(self):
+        """فتح طبقة SQLite وحذف المنتهي منها (في main وليس عند الاستيراد)؛ بدونها الكاش في الذاكرة فقط"""
+        if not self.db_path or self._db is not None:
+            return
+        self._io = ThreadPoolExecutor(max_workers=1, thread_name_prefix="arabseed-cache")
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._db.execute("DELETE FROM results WHERE expires_at < ?", (time.time(),))
+        self._db.commit()
+    
+    async def get(self, key: str, record_stats: bool = True) -> Optional[Tuple[bool, str, List[List[Dict]]]]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += record_stats
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+        
+        if self._db is not None:
+            row = await asyncio.get_running_loop().run_in_executor(self._io, self._read, key)
+            if row and row[1] > now:
+                success, message, buttons = json.loads(row[0])
+                value = (success, message, buttons)
+                with self._lock:
+                    self._store_memory(key, value, row[1])
+                    self.hits += record_stats
+                    self.disk_hits += record_stats
+                return value
+        
+        with self._lock:
+            self.misses += record_stats
+        return None
+    
+    def set(self, key: str, value: Tuple[bool, str, List[List[Dict]]]):
+        ttl = self.ttl if value[0] else self.negative_ttl
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._store_memory(key, value, expires_at)
+        # نتائج الفشل قصيرة العمر، لا داعي لحفظها على القرص؛ الكتابة في خيط SQLite دون انتظار
+        if self._db is not None and value[0]:
+            self._io.submit(self._write, key, json.dumps(list(value), ensure_ascii=False), expires_at)
+    
+    def _read(self, key: str) -> Optional[Tuple[str, float]]:
+        try:
+            return self._db.execute(
+                "SELECT value, expires_at FROM results WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ تعذر قراءة الكاش: {e}")
+            return None
+    
+    def _write(self, key: str, value: str, expires_at: float):
+        try:
+            self._db.execute(
+                "INSERT OR REPLACE INTO results (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at)
+            )
+            self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ تعذر حفظ الكاش: {e}")
+    
+    def close(self):
+        """انتظار انتهاء الكتابة المعلقة (عند الإيقاف)"""
+        if self._io is not None:
+            self._io.shutdown(wait=True)
+    
+    def _store_memory(self, key: str, value: Tuple, expires_at: float):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+link_cache = ResultCache(CACHE_MAX_ENTRIES, CACHE_TTL, CACHE_NEGATIVE_TTL, CACHE_DB_PATH)
+
+# ----------------- فهرس المسلسلات -----------------
+EPISODE_WORDS = {'الحلقة', 'حلقة', 'episode', 'ep'}
+
+def series_identity(url: str) -> Tuple[str, str, Optional[int], str]:
+    """(مفتاح المسلسل، الاسم، رقم الحلقة، قالب الرابط) من رابط الحلقة
+    
+    المفتاح هو المسار قبل رقم الحلقة بدون النطاق، حتى تشترك كل مرايا عرب سيد في نفس المسلسل.
+    """
+    p = urlparse(url)
+    path_unquoted = unquote(p.path).replace('.html', '').replace('.php', '')
+    parts = path_unquoted.strip('/').split('-')
+    idx, num = find_last_numeric_segment_in_path(path_unquoted)
+    # رقم بدون كلمة "الحلقة" قبله غالباً سنة فيلم وليس رقم حلقة
+    if idx is None or idx == 0 or parts[idx - 1].lower() not in EPISODE_WORDS:
+        name_parts, episode, template = parts, None, url
+    else:
+        name_parts, episode = parts[:idx], int(num)
+        template_parts = parts[:idx + 1]
+        template_parts[-1] = '{episode}'
+        template_path = quote('/' + '-'.join(template_parts), safe="/%{}")
+        template = urlunparse((p.scheme, p.netloc, template_path, '', '', ''))
+    while name_parts and name_parts[-1].lower() in EPISODE_WORDS:
+        name_parts = name_parts[:-1]
+    key = '-'.join(name_parts).lower() or path_unquoted.strip('/').lower()
+    name = ' '.join(name_parts).title() or extract_title_from_url(url)
+    return key, name, episode, template
+
+class SeriesIndex:
+    """فهرس محلي للمسلسلات والحلقات التي تمت معالجتها، مع بحث نصي كامل (FTS5)
+    
+    قاعدة البيانات تفتح عند أول استخدام (أو في main) وليس عند استيراد الوحدة،
+    حتى لا تنشئ عمليات المعالجة والاختبارات الملف.
+    """
+    
+    def __init__(self, db_path: str = ""):
+        self.db_path = db_path
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.trigram = True
+    
+    def open(self) -> sqlite3.Connection:
+        """فتح قاعدة البيانات وإنشاء الجداول مرة واحدة"""
+        with self._lock:
+            if self._db is None:
+                self._db = self._connect()
+            return self._db
+    
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.db_path or ":memory:", check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS series ("
+            "id INTEGER PRIMARY KEY, key TEXT UNIQUE NOT NULL, name TEXT NOT NULL, "
+            "url_template TEXT NOT NULL, latest_episode INTEGER, updated_at REAL NOT NULL)"
+        )
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS episodes ("
+            "series_id INTEGER NOT NULL, episode INTEGER NOT NULL, url TEXT NOT NULL, title TEXT NOT NULL, "
+            "buttons TEXT NOT NULL, resolved_at REAL NOT NULL, PRIMARY KEY (series_id, episode))"
+        )
+        # trigram يطابق أي جزء من الكلمة (مثل "عنكبوت" داخل "العنكبوت")، وإلا unicode61 مع البادئات
+        self.trigram = True
+        try:
+            db.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS series_fts USING fts5(name, tokenize='trigram')"
+            )
+        except sqlite3.OperationalError:
+            self.trigram = False
+            db.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS series_fts USING fts5(name, tokenize='unicode61 remove_diacritics 2')"
+            )
+        db.commit()
+        return db
+    
+    def record(self, url: str, result: Tuple[bool, str, List[List[Dict]]]):
+        """إضافة حلقة تمت معالجتها بنجاح مع روابطها (من المرايا المعتمدة فقط)
+        
+        تحجب حتى ينتهي commit، لذلك تستدعى من خارج حلقة الأحداث.
+        """
+        success, title, buttons_data = result
+        # نتائج نطاق غير معتمد لا تظهر لباقي المستخدمين في /search و /latest
+        if not success or not is_known_mirror(urlparse(url).netloc):
+            return
+        key, name, episode, template = series_identity(url)
+        now = time.time()
+        try:
+            db = self.open()
+            with self._lock:
+                row = db.execute("SELECT id, latest_episode FROM series WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    series_id = db.execute(
+                        "INSERT INTO series (key, name, url_template, latest_episode, updated_at) VALUES (?, ?, ?, ?, ?)",
+                        (key, name, template, episode, now)
+                    ).lastrowid
+                    db.execute("INSERT INTO series_fts (rowid, name) VALUES (?, ?)", (series_id, name))
+                else:
+                    series_id, latest = row
+                    if episode is not None and (latest is None or episode > latest):
+                        latest = episode
+                    db.execute(
+                        "UPDATE series SET url_template = ?, latest_episode = ?, updated_at = ? WHERE id = ?",
+                        (template, latest, now, series_id)
+                    )
+                db.execute(
+                    "INSERT OR REPLACE INTO episodes (series_id, episode, url, title, buttons, resolved_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (series_id, episode if episode is not None else 0, url, title,
+                     json.dumps(buttons_data, ensure_ascii=False), now)
+                )
+                db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ تعذر تحديث فهرس المسلسلات: {e}")
+    
+    def _match_query(self, text: str) -> Optional[str]:
+        words = [word.replace('"', '') for word in text.split()]
+        if self.trigram:
+            # trigram يحتاج 3 أحرف على الأقل لكل كلمة
+            words = [word for word in words if len(word) >= 3]
+            return " ".join(f'"{word}"' for word in words) or None
+        words = [word for word in words if word]
+        return " ".join(f'"{word}"*' for word in words) or None
+    
+    def search(self, text: str, limit: int = INDEX_SEARCH_LIMIT) -> List[Dict[str, Any]]:
+        """المسلسلات المطابقة للاسم، الأقرب أولاً"""
+        db = self.open()
+        match = self._match_query(text)
+        with self._lock:
+            if match is not None:
+                rows = db.execute(
+                    "SELECT s.id, s.name, s.latest_episode, s.updated_at FROM series_fts f "
+                    "JOIN series s ON s.id = f.rowid WHERE series_fts MATCH ? "
+                    "ORDER BY bm25(series_fts), s.updated_at DESC LIMIT ?",
+                    (match, limit)
+                ).fetchall()
+            else:
+                # كلمات قصيرة جداً للبحث النصي: مطابقة جزئية بسيطة
+                rows = db.execute(
+                    "SELECT id, name, latest_episode, updated_at FROM series WHERE name LIKE ? "
+                    "ORDER BY updated_at DESC LIMIT ?",
+                    (f"%{text.strip()}%", limit)
+                ).fetchall()
+        return [
+            {"id": row[0], "name": row[1], "latest_episode": row[2], "updated_at": row[3]}
+            for row in rows
+        ]
+    
+    def latest_episode(self, series_id: int) -> Optional[Dict[str, Any]]:
+        """آخر حلقة مفهرسة للمسلسل مع روابطها المحفوظة"""
+        db = self.open()
+        with self._lock:
+            row = db.execute(
+                "SELECT s.name, e.episode, e.url, e.title, e.buttons, e.resolved_at FROM episodes e "
+                "JOIN series s ON s.id = e.series_id WHERE e.series_id = ? "
+                "ORDER BY e.episode DESC LIMIT 1",
+                (series_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "series": row[0], "episode": row[1], "url": row[2], "title": row[3],
+            "buttons": json.loads(row[4]), "resolved_at": row[5],
+        }
+    
+    def stats(self) -> Dict[str, int]:
+        db = self.open()
+        with self._lock:
+            series = db.execute("SELECT COUNT(*) FROM series").fetchone()[0]
+            episodes = db.execute("SELECT COUNT(*) FROM episodes").fetchone()[0]
+        return {"series": series, "episodes": episodes}
+
+series_index = SeriesIndex(INDEX_DB_PATH)
+
+# ----------------- التنفيذ خارج حلقة الأحداث -----------------
+# عمليات الجلب والتحليل متزامنة (requests + time.sleep)، لذلك تعمل في مجموعة
+# خيوط محدودة حتى لا تتجمد حلقة الأحداث أثناء معالجة رابط مستخدم آخر
+resolve_executor = ThreadPoolExecutor(
+    max_workers=RESOLVE_CONCURRENCY,
+    thread_name_prefix="arabseed-resolver"
+)
+
+# مجموعة منفصلة لسيرفرات الحلقة حتى لا تنتظر مهام المعالجة نفسها (تجنب الاختناق)
+server_executor = ThreadPoolExecutor(
+    max_workers=RESOLVE_CONCURRENCY * SERVER_FANOUT,
+    thread_name_prefix="arabseed-server"
+)
+
+# مجموعة صغيرة منفصلة للجلب المسبق حتى لا يزاحم طلبات المستخدمين
+prefetch_executor = ThreadPoolExecutor(
+    max_workers=max(PREFETCH_GLOBAL_BUDGET, 1),
+    thread_name_prefix="arabseed-prefetch"
+)
+# وسيرفرات الجلب المسبق في مجموعة منفصلة أيضاً، لا في server_executor المشتركة
+prefetch_server_executor = ThreadPoolExecutor(
+    max_workers=max(PREFETCH_GLOBAL_BUDGET, 1) * SERVER_FANOUT,
+    thread_name_prefix="arabseed-prefetch-server"
+)
+
+def run_in_background(fn, *args):
+    """تشغيل المعالجة كطلب خلفي (يُستدعى داخل نسخة من السياق)"""
+    _background.set(True)
+    return fn(*args)
+
+def has_idle_capacity() -> bool:
+    """هل توجد سعة فارغة للجلب المسبق دون تأخير طلبات المستخدمين؟"""
+    if worker_pool is not None:
+        workers = worker_pool.stats()
+        return workers["queue_depth"] == 0 and workers["in_progress"] < workers["alive"]
+    return len(resolution_flight) < max(RESOLVE_CONCURRENCY // 2, 1)
+
+async def process_arabseed_url_async(url: str, executor: Optional[ThreadPoolExecutor] = None,
+                                     background: bool = False) -> Tuple[bool, str, List[List[Dict]]]:
+    """معالجة رابط عرب سيد في مجموعة الخيوط (أو عمليات المعالجة إن كانت مفعلة) دون حجب حلقة الأحداث
+    
+    background: طلب خلفي (جلب مسبق) بحصة مخفضة من حدود المضيفين
+    """
+    if worker_pool is not None:
+        try:
+            return await asyncio.wait_for(
+                asyncio.wrap_future(worker_pool.submit(url, background)), timeout=RESOLUTION_DEADLINE + SERVER_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            return False, "⏱️ انتهت مهلة المعالجة، حاول مرة أخرى", []
+    loop = asyncio.get_running_loop()
+    if background:
+        return await loop.run_in_executor(
+            executor or prefetch_executor, contextvars.copy_context().run, run_in_background, process_arabseed_url, url
+        )
+    return await loop.run_in_executor(executor or resolve_executor, process_arabseed_url, url)
+
+def run_with_deadline(deadline: float, trace_id: str, fn, *args):
+    """تشغيل دالة مع تعيين موعد المعالجة النهائي ومعرف التتبع في سياقها"""
+    _resolution_deadline.set(deadline)
+    _trace_id.set(trace_id)
+    return fn(*args)
+
+def submit_with_deadline(executor: ThreadPoolExecutor, deadline: float, trace_id: str, fn, *args) -> asyncio.Future:
+    """إرسال مهمة لمجموعة خيوط بسياق مستقل يحمل الموعد النهائي، وإرجاع Future قابل للانتظار"""
+    return asyncio.wrap_future(
+        executor.submit(contextvars.copy_context().run, run_with_deadline, deadline, trace_id, fn, *args)
+    )
+
+async def stream_arabseed_url(url: str, executor: Optional[ThreadPoolExecutor] = None) -> AsyncIterator[Tuple[str, Any]]:
+    """معالجة رابط عرب سيد مع إرجاع كل زر فور جاهزيته: ("button", صف) لكل سيرفر ثم ("done", النتيجة)"""
+    started = time.monotonic()
+    deadline = started + RESOLUTION_DEADLINE
+    trace_id = new_trace_id()
+    # سياق مستقل يحمل معرف التتبع لأحداث البداية والنهاية، دون تغيير سياق المستدعي
+    trace_context = contextvars.copy_context()
+    trace_context.run(_trace_id.set, trace_id)
+    trace_context.run(trace_log.emit, "resolution_start", url=url)
+    try:
+        error, server_links, url = await submit_with_deadline(
+            executor or resolve_executor, deadline, trace_id, discover_server_links, url
+        )
+        if error:
+            result = (False, error, [])
+        else:
+            referer = extract_base_url(url) + "/"
+            pending = {
+                submit_with_deadline(server_executor, deadline, trace_id, resolve_server_link, link, referer): i
+                for i, link in enumerate(server_links)
+            }
+            entries: List[Optional[Tuple[str, Dict, List[Dict]]]] = [None] * len(server_links)
+            servers_deadline = min(deadline, time.monotonic() + SERVER_TIMEOUT)
+            
+            while pending:
+                done, _ = await asyncio.wait(
+                    pending,
+                    timeout=max(servers_deadline - time.monotonic(), 0),
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    logger.warning(f"⏱️ تجاوز {len(pending)} سيرفر المهلة ({SERVER_TIMEOUT} ث)")
+                    break
+                for future in done:
+                    i = pending.pop(future)
+                    if future.exception():
+                        continue
+                    info = future.result()
+                    row = build_server_button(server_links[i], info, referer)
+                    if row:
+                        entries[i] = (server_links[i], info, row)
+                        yield "button", row
+            for future in pending:
+                future.cancel()
+            
+            # النتيجة النهائية بترتيب الروابط في الصفحة
+            result = finish_resolution(url, [entry for entry in entries if entry])
+        
+    except Exception as e:
+        logger.error(f"❌ خطأ في معالجة الرابط: {e}")
+        result = (False, f"❌ حدث خطأ غير متوقع: {str(e)}", [])
+    
+    trace_context.run(record_stage, "total", started)
+    RESOLUTIONS.inc(result="success" if result[0] else "failure")
+    trace_context.run(trace_log.emit, "resolution_end", url=url, success=result[0], buttons=len(result[2]))
+    yield "done", result
+
+class SingleFlight:
+    """دمج الطلبات المتطابقة الجارية: أول طلب ينفذ العمل والباقي ينتظرون نفس النتيجة"""
+    
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[asyncio.Task, int] = {}
+        self.coalesced = 0
+    
+    async def do(self, key: str, factory):
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            self._waiters[task] = 0
+            task.add_done_callback(lambda t: self._forget(key, t))
+        else:
+            self.coalesced += 1
+            logger.info(f"🔗 انضمام لمعالجة جارية: {key}")
+        self._waiters[task] += 1
+        try:
+            # shield: إلغاء أحد المنتظرين لا يلغي العمل المشترك ما دام غيره ينتظره
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            # آخر منتظر أُلغي: لا أحد يحتاج النتيجة فيُلغى العمل (ويسقط من طابور المنفذ إن لم يبدأ)
+            if self._waiters.get(task) == 1 and not task.done():
+                logger.info(f"⛔ إلغاء معالجة لم يعد أحد ينتظرها: {key}")
+                task.cancel()
+            raise
+        finally:
+            if task in self._waiters:
+                self._waiters[task] -= 1
+    
+    def _forget(self, key: str, task: asyncio.Task):
+        self._waiters.pop(task, None)
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+    
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+resolution_flight = SingleFlight()
+# إعادة التحقق من نفس نتيجة الكاش تتم مرة واحدة مهما كان عدد الطلبات المتزامنة
+revalidation_flight = SingleFlight()
+
+async def revalidate_cached(key: str, cached: Tuple[bool, str, List[List[Dict]]]) -> Optional[Tuple[bool, str, List[List[Dict]]]]:
+    """إعادة فحص روابط نتيجة من الكاش (بطلبات HEAD فقط) وحذف ما توقف منها
+    
+    تعيد None إذا توقفت كل الروابط، فتتم معالجة الحلقة من جديد.
+    """
+    success, title, buttons_data = cached
+    loop = asyncio.get_running_loop()
+    probes = await asyncio.gather(*(
+        loop.run_in_executor(server_executor, probe_direct_link, row[0]["url"], row[0].get("referer"))
+        for row in buttons_data
+    ))
+    alive_rows = [row for row, probe in zip(buttons_data, probes) if probe["alive"] is not False]
+    if len(alive_rows) == len(buttons_data):
+        return cached
+    if not alive_rows:
+        logger.info(f"♻️ كل روابط الكاش توقفت، إعادة المعالجة: {key}")
+        return None
+    logger.info(f"♻️ حذف {len(buttons_data) - len(alive_rows)} رابط متوقف من الكاش: {key}")
+    refreshed = (success, title, alive_rows)
+    link_cache.set(key, refreshed)
+    return refreshed
+
+async def resolve_episode(url: str, executor: Optional[ThreadPoolExecutor] = None,
+                          on_button=None, background: bool = False) -> Tuple[bool, str, List[List[Dict]]]:
+    """معالجة رابط الحلقة مع المرور على كاش الروابط ودمج الطلبات المتطابقة
+    
+    on_button: دالة async تُستدعى لكل زر فور جاهزيته (عندما يكون هذا الطلب هو المنفذ الفعلي)
+    background: جلب مسبق بحصة مخفضة من حدود المضيفين
+    """
+    key = normalize_episode_url(url)
+    cached = await link_cache.get(key)
+    if cached is not None and VERIFY_LINKS and cached[0]:
+        cached = await revalidation_flight.do(key, lambda hit=cached: revalidate_cached(key, hit))
+    if cached is not None:
+        logger.info(f"⚡ من الكاش: {key}")
+        return cached
+    
+    async def resolve_and_cache():
+        # البث التدريجي يعمل داخل عملية البوت فقط
+        if on_button is None or worker_pool is not None:
+            result = await process_arabseed_url_async(url, executor, background)
+        else:
+            result = None
+            async for event, payload in stream_arabseed_url(url, executor):
+                if event == "done":
+                    result = payload
+                    continue
+                try:
+                    await on_button(payload)
+                except Exception as e:
+                    logger.warning(f"⚠️ تعذر عرض الزر: {e}")
+        link_cache.set(key, result)
+        # الفهرس يكتب في SQLite، فيعمل في الخلفية دون انتظار
+        asyncio.get_running_loop().run_in_executor(None, series_index.record, url, result)
+        return result
+    
+    return await resolution_flight.do(key, resolve_and_cache)
+
+# ----------------- عمليات المعالجة المنفصلة -----------------
+def configure_worker_process(processes: int):
+    """تهيئة عملية المعالجة: تقسيم حد المعدل وحد التزامن لكل مضيف بين العمليات وترك حفظ المرايا لعملية البوت"""
+    rate_limiter.scale(1.0 / processes)
+    prefetch_rate_limiter.scale(1.0 / processes)
+    scale_host_concurrency(1.0 / processes)
+    mirror_registry.path = ""
+
+def worker_process_main(worker_id: int, processes: int, jobs, results):
+    """حلقة عملية المعالجة: استلام رابط، معالجته، وإرجاع النتيجة"""
+    configure_worker_process(processes)
+    logger.info(f"👷 عملية المعالجة {worker_id} جاهزة (pid {os.getpid()})")
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        job_id, url, background = job
+        results.put(("start", job_id, worker_id, None))
+        started = time.monotonic()
+        try:
+            if background:
+                result = contextvars.copy_context().run(run_in_background, process_arabseed_url, url)
+            else:
+                result = process_arabseed_url(url)
+        except Exception as e:
+            result = (False, f"❌ حدث خطأ غير متوقع: {str(e)}", [])
+        # مقاييس العملية تُرسل مع كل نتيجة وتُدمج في عملية البوت
+        results.put(("done", job_id, worker_id, (result, time.monotonic() - started, metrics.drain())))
+
+class ProcessWorkerPool:
+    """مجموعة عمليات للمعالجة: طابور مهام مشترك وخيط يجمع النتائج ويكمل الـ Futures"""
+    
+    # فحص العمليات المتوقفة كل هذه المدة، حتى تحت حمل مستمر
+    CHECK_INTERVAL = 1.0
+    
+    def __init__(self, processes: int):
+        self.processes = processes
+        self._ctx = multiprocessing.get_context("spawn")
+        self._jobs = self._ctx.Queue()
+        self._results = self._ctx.Queue()
+        self._workers: Dict[int, Any] = {}
+        self._pending: Dict[int, Any] = {}
+        self._running: Dict[int, int] = {}   # worker_id -> job_id
+        self._worker_stats: Dict[int, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._closed = False
+        self.submitted = 0
+        self.completed = 0
+        self.restarts = 0
+        self._collector = threading.Thread(target=self._collect, name="worker-pool-collector", daemon=True)
+    
+    def start(self):
+        for worker_id in range(self.processes):
+            self._spawn(worker_id)
+        self._collector.start()
+        logger.info(f"🏭 تم تشغيل {self.processes} عملية معالجة")
+    
+    def _spawn(self, worker_id: int):
+        process = self._ctx.Process(
+            target=worker_process_main,
+            args=(worker_id, self.processes, self._jobs, self._results),
+            name=f"arabseed-worker-{worker_id}",
+            daemon=True
+        )
+        process.start()
+        self._workers[worker_id] = process
+        self._worker_stats.setdefault(worker_id, {"jobs": 0, "busy_seconds": 0.0})
+    
+    def submit(self, url: str, background: bool = False):
+        future = Future()
+        with self._lock:
+            job_id = self._next_id
+            self._next_id += 1
+            self._pending[job_id] = future
+            self.submitted += 1
+        self._jobs.put((job_id, url, background))
+        return future
+    
+    def _collect(self):
+        next_check = time.monotonic() + self.CHECK_INTERVAL
+        while not self._closed:
+            now = time.monotonic()
+            if now >= next_check:
+                self._check_workers()
+                next_check = now + self.CHECK_INTERVAL
+            try:
+                kind, job_id, worker_id, payload = self._results.get(timeout=max(next_check - now, 0.01))
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
                 break
+            with self._lock:
+                if kind == "start":
+                    self._running[worker_id] = job_id
+                    continue
+                self._running.pop(worker_id, None)
+                future = self._pending.pop(job_id, None)
+                result, elapsed, snapshot = payload
+                metrics.merge(snapshot)
+                stats = self._worker_stats[worker_id]
+                stats["jobs"] += 1
+                stats["busy_seconds"] += elapsed
+                self.completed += 1
+            if future is not None and not future.done():
+                future.set_result(result)
+    
+    def _check_workers(self):
+        """إعادة تشغيل العمليات المتوقفة وإفشال المهمة التي كانت تعالجها"""
+        for worker_id, process in list(self._workers.items()):
+            if process.is_alive() or self._closed:
+                continue
+            logger.warning(f"⚠️ توقفت عملية المعالجة {worker_id} (رمز {process.exitcode})، إعادة التشغيل")
+            with self._lock:
+                job_id = self._running.pop(worker_id, None)
+                future = self._pending.pop(job_id, None) if job_id is not None else None
+                self.restarts += 1
+            if future is not None and not future.done():
+                future.set_result((False, "❌ توقفت عملية المعالجة، حاول مرة أخرى", []))
+            self._spawn(worker_id)
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            in_progress = len(self._running)
+            return {
+                "workers": self.processes,
+                "alive": sum(process.is_alive() for process in self._workers.values()),
+                "queue_depth": len(self._pending) - in_progress,
+                "in_progress": in_progress,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "restarts": self.restarts,
+                "per_worker": {
+                    worker_id: {
+                        "jobs": int(stats["jobs"]),
+                        "avg_ms": stats["busy_seconds"] * 1000 / stats["jobs"] if stats["jobs"] else 0.0,
+                        "busy": worker_id in self._running,
+                    }
+                    for worker_id, stats in self._worker_stats.items()
+                },
+            }
+    
+    def shutdown(self, timeout: float = 5.0):
+        self._closed = True
+        for _ in self._workers:
+            self._jobs.put(None)
+        for process in self._workers.values():
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        with self._lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+        for future in pending:
+            if not future.done():
+                future.cancel()
+
+# تُنشأ في main() فقط، حتى لا تنشئ عمليات المعالجة نفسها مجموعات أخرى عند استيراد الملف
+worker_pool: Optional[ProcessWorkerPool] = None
+
+# ----------------- الجلب المسبق للحلقات التالية -----------------
+class Prefetcher:
+    """بعد حل الحلقة N، يجلب الحلقات N+1..N+k إلى الكاش بأولوية منخفضة"""
+    
+    def __init__(self, depth: int, global_budget: int, series_budget: int, series_window: float):
+        self.depth = depth
+        self.series_budget = series_budget
+        self.series_window = series_window
+        self._global = asyncio.Semaphore(max(global_budget, 1))
+        self._active_series = set()
+        self._series_usage: Dict[str, deque] = {}
+        self._last_prune = time.monotonic()
+        self._tasks = set()
+        self.resolved = 0
+        self.stopped = 0
+        self.skipped_busy = 0
+    
+    def schedule(self, url: str):
+        """جدولة الجلب المسبق بعد نجاح حل الرابط"""
+        if self.depth <= 0:
+            return
+        episode, builder = extract_episode_and_base(url)
+        if episode is None:
+            return
         
-        if not r_link:
-            # إذا لم نجد، استخدم الرابط الحالي
-            r_link = response.url
-        
-        logger.info(f"✅ وجدت رابط التحميل: {r_link}")
-        
-        # الخطوة 3: جلب صفحة التحميل
-        time.sleep(0.5)  # تأخير بسيط
-        response = make_request(r_link, session=session)
-        if not response:
-            return None
-        
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # البحث عن رابط التحميل النهائي
-        final_link = None
-        
-        # البحث في جميع الروابط
-        for a in soup.find_all('a', href=True):
-            href = a['href']
-            # البحث عن روابط MP4 أو direct
-            if re.search(r'\.(mp4|m3u8|mkv|avi)$', href, re.IGNORECASE) or 'direct' in href.lower() or 'download' in href.lower():
-                final_link = href
-                if not final_link.startswith('http'):
-                    final_link = extract_base_url(r_link) + final_link
-                break
+        # مفتاح المسلسل: رابط الحلقة بعد حذف رقمها
+        series = normalize_episode_url(builder(0))
+        if series in self._active_series:
+            return
+        self._active_series.add(series)
         
-        # إذا لم نجد، نبحث في النصوص البرمجية
-        if not final_link:
-            script_tags = soup.find_all('script')
-            for script in script_tags:
-                if script.string:
-                    # البحث في JavaScript
-                    patterns = [
-                        r'src=["\']([^"\']+\.mp4[^"\']*)["\']',
-                        r'file["\']?\s*:\s*["\']([^"\']+\.mp4[^"\']*)["\']',
-                        r'url["\']?\s*:\s*["\']([^"\']+\.mp4[^"\']*)["\']',
-                        r'["\']?(?:file|url|src)["\']?\s*:\s*["\']([^"\']+)["\']',
-                    ]
-                    for pattern in patterns:
-                        match = re.search(pattern, script.string, re.IGNORECASE)
-                        if match:
-                            final_link = match.group(1)
-                            if not final_link.startswith('http'):
-                                final_link = extract_base_url(r_link) + final_link
-                            break
-                if final_link:
+        task = asyncio.ensure_future(self._run(series, episode, builder))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    def _prune_series_usage(self, now: float):
+        """حذف سجلات المسلسلات التي لم يُجلب لها شيء خلال النافذة"""
+        if now - self._last_prune < self.series_window:
+            return
+        self._last_prune = now
+        for series in [series for series, usage in self._series_usage.items()
+                       if not usage or now - usage[-1] > self.series_window]:
+            del self._series_usage[series]
+    
+    def _take_series_budget(self, series: str) -> bool:
+        now = time.monotonic()
+        self._prune_series_usage(now)
+        usage = self._series_usage.setdefault(series, deque())
+        while usage and now - usage[0] > self.series_window:
+            usage.popleft()
+        if len(usage) >= self.series_budget:
+            return False
+        usage.append(now)
+        return True
+    
+    async def _run(self, series: str, episode: int, builder):
+        try:
+            for next_episode in range(episode + 1, episode + 1 + self.depth):
+                next_url = builder(next_episode)
+                if not next_url:
                     break
+                
+                cached = await link_cache.get(normalize_episode_url(next_url), record_stats=False)
+                if cached is not None:
+                    if not cached[0]:
+                        break
+                    continue
+                
+                # الجلب المسبق يستخدم السعة الفارغة فقط
+                if not has_idle_capacity():
+                    self.skipped_busy += 1
+                    logger.info(f"⏸️ تخطي الجلب المسبق: لا توجد سعة فارغة ({series})")
+                    break
+                
+                if not self._take_series_budget(series):
+                    logger.info(f"⏸️ انتهت ميزانية الجلب المسبق للمسلسل: {series}")
+                    break
+                
+                async with self._global:
+                    success, _, _ = await resolve_episode(next_url, executor=prefetch_executor, background=True)
+                
+                # نتوقف عند أول حلقة غير موجودة (نهاية المسلسل حالياً)
+                if not success:
+                    self.stopped += 1
+                    break
+                self.resolved += 1
+                logger.info(f"📦 تم جلب الحلقة {next_episode} مسبقاً")
+        except Exception as e:
+            logger.error(f"❌ خطأ في الجلب المسبق: {e}")
+        finally:
+            self._active_series.discard(series)
+
+prefetcher = Prefetcher(PREFETCH_DEPTH, PREFETCH_GLOBAL_BUDGET, PREFETCH_SERIES_BUDGET, PREFETCH_SERIES_WINDOW)
+
+# ----------------- جدولة الرسائل الصادرة -----------------
+# أولوية الإرسال: الرد على المستخدم أولاً، ثم تحديثات التقدم، ثم الرسائل الجماعية (وضع الموسم)
+SEND_INTERACTIVE, SEND_PROGRESS, SEND_BULK = 0, 1, 2
+SEND_PRIORITY_NAMES = {SEND_INTERACTIVE: "interactive", SEND_PROGRESS: "progress", SEND_BULK: "bulk"}
+# الطلبات التي تحسبها حدود Telegram (getUpdates و answerCallbackQuery وغيرها تمر مباشرة)
+RATE_LIMITED_PREFIXES = ("send", "edit", "copy", "forward", "delete")
+MERGEABLE_ENDPOINTS = {"editMessageText", "editMessageReplyMarkup", "editMessageCaption"}
+
+# أولوية الإرسال الحالية؛ تُضبط حول الاستدعاء لأن اختصارات Message لا تمرر rate_limit_args
+_send_priority: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("send_priority", default=None)
+
+class SendJob:
+    __slots__ = ("priority", "seq", "chat_id", "merge_key", "turn", "result", "superseded_by", "queued_at")
+    
+    def __init__(self, priority: int, seq: int, chat_id, merge_key):
+        loop = asyncio.get_running_loop()
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.merge_key = merge_key
+        self.turn = loop.create_future()
+        self.result = loop.create_future()
+        # نتيجة الخطأ قد لا ينتظرها أحد (تعديل استُبدل)، فنعلّمها كمقروءة لتجنب تحذيرات asyncio
+        self.result.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self.superseded_by: Optional["SendJob"] = None
+        self.queued_at = time.monotonic()
+
+class SendScheduler(BaseRateLimiter):
+    """طابور إرسال مشترك لكل طلبات البوت إلى Telegram
+    
+    يطبق حداً كلياً وحداً لكل محادثة، ويعطي الأولوية للردود التفاعلية، ويدمج التعديلات
+    المتتالية لنفس الرسالة في تعديل واحد، ويعيد الجدولة بعد RetryAfter بدل إظهار الخطأ.
+    """
+    
+    MAX_CHAT_BUCKETS = 4096
+    
+    def __init__(self, global_spec: str, chat_spec: str, group_spec: str, max_retries: int):
+        self._global = TokenBucket(*parse_rate(global_spec))
+        self.chat_limits = parse_rate(chat_spec)
+        self.group_limits = parse_rate(group_spec)
+        self.max_retries = max_retries
+        self._chats: Dict[Any, TokenBucket] = {}
+        self._ready: List[Tuple[int, int, SendJob]] = []      # (الأولوية، الترتيب، المهمة)
+        self._delayed: List[Tuple[float, int, SendJob]] = []  # (وقت الجاهزية، الترتيب، المهمة)
+        self._edits: Dict[Tuple, SendJob] = {}
+        self._paused_until = 0.0
+        self._seq = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.merged = 0
+        self.retry_after = 0
+    
+    async def initialize(self):
+        self._wakeup = asyncio.Event()
+        self._dispatcher = asyncio.create_task(self._dispatch())
+    
+    async def shutdown(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+    
+    def __len__(self) -> int:
+        return len(self._ready) + len(self._delayed)
+    
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.MAX_CHAT_BUCKETS:
+                # حذف دلاء المحادثات الخاملة (الممتلئة بالكامل) فقط
+                now = time.monotonic()
+                for key in [key for key, item in self._chats.items()
+                            if item.tokens + (now - item.updated) * item.rate >= item.burst]:
+                    del self._chats[key]
+            is_group = isinstance(chat_id, str) or (isinstance(chat_id, int) and chat_id < 0)
+            bucket = TokenBucket(*(self.group_limits if is_group else self.chat_limits))
+            self._chats[chat_id] = bucket
+        return bucket
+    
+    def _submit(self, priority: int, chat_id, merge_key, not_before: float = 0.0) -> SendJob:
+        self._seq += 1
+        job = SendJob(priority, self._seq, chat_id, merge_key)
         
-        # إذا لم نجد بعد، نستخدم بعض الاستراتيجيات البديلة
-        if not final_link:
-            # محاولة استخراج من iframe
-            iframe = soup.find('iframe', src=True)
-            if iframe:
-                final_link = iframe['src']
-                if not final_link.startswith('http'):
-                    final_link = extract_base_url(r_link) + final_link
-        
-        if not final_link:
-            logger.error("❌ لم أتمكن من استخراج رابط التحميل")
-            return None
-        
-        logger.info(f"🎯 رابط التحميل النهائي: {final_link}")
-        
-        # استخراج معلومات الملف
-        file_name = None
-        file_size = None
+        if merge_key is not None:
+            previous = self._edits.get(merge_key)
+            if previous is not None and not previous.turn.done():
+                # التعديل الأقدم لم يُرسل بعد: يأخذ مكانه في الدور ويرث أولويته إن كانت أعلى
+                previous.superseded_by = job
+                previous.turn.set_result(None)
+                job.priority = min(job.priority, previous.priority)
+                job.queued_at = previous.queued_at
+                if chat_id is not None:
+                    self._chat_bucket(chat_id).refund()
+            self._edits[merge_key] = job
         
-        # البحث عن العنوان والحجم
-        title_elem = soup.find(['h1', 'h2', 'h3', 'title'])
-        if title_elem:
-            title_text = title_elem.get_text(strip=True)
-            # استخراج حجم الملف من النص
-            size_match = re.search(r'(\d+(?:\.\d+)?)\s*(MB|GB|KB)', title_text, re.IGNORECASE)
-            if size_match:
-                file_size = f"{size_match.group(1)} {size_match.group(2).upper()}"
+        delay = self._chat_bucket(chat_id).reserve() if chat_id is not None else 0.0
+        ready_at = max(time.monotonic() + delay, not_before)
+        if ready_at > time.monotonic():
+            heapq.heappush(self._delayed, (ready_at, job.seq, job))
+        else:
+            heapq.heappush(self._ready, (job.priority, job.seq, job))
+        self._wakeup.set()
+        return job
+    
+    async def _dispatch(self):
+        """منح الأدوار بترتيب الأولوية ضمن الحد الكلي"""
+        while True:
+            now = time.monotonic()
+            while self._delayed and self._delayed[0][0] <= now:
+                _, _, job = heapq.heappop(self._delayed)
+                heapq.heappush(self._ready, (job.priority, job.seq, job))
+            # التعديلات المستبدلة أُخرجت من الدور مسبقاً
+            while self._ready and self._ready[0][2].turn.done():
+                heapq.heappop(self._ready)
             
-            # استخدام العنوان كاسم ملف
-            file_name = title_text[:50]  # تقليل الطول
-        
-        # إذا لم نجد اسماً، نستخدم اسم الملف من الرابط
-        if not file_name:
-            file_name = os.path.basename(final_link).split('?')[0] or "ملف_تحميل"
-        
-        # إذا لم نجد حجماً، نستخدم قيمة افتراضية
-        if not file_size:
-            file_size = "غير معروف"
+            timeout = None
+            if self._ready and now >= self._paused_until:
+                wait = self._global.reserve()
+                if wait <= 0:
+                    _, _, job = heapq.heappop(self._ready)
+                    job.turn.set_result(None)
+                    continue
+                self._global.refund()
+                timeout = wait
+            elif self._ready:
+                timeout = self._paused_until - now
+            if self._delayed:
+                until_delayed = self._delayed[0][0] - now
+                timeout = until_delayed if timeout is None else min(timeout, until_delayed)
+            
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+    
+    def _pause(self, chat_id, seconds: float):
+        """إيقاف المحادثة (أو كل الإرسال إن لم تُعرف المحادثة) حتى انتهاء مدة RetryAfter"""
+        if chat_id is not None:
+            bucket = self._chat_bucket(chat_id)
+            bucket.reserve()
+            bucket.tokens = min(bucket.tokens, 0.0) - seconds * bucket.rate
+        else:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._wakeup.set()
+    
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        if not endpoint.startswith(RATE_LIMITED_PREFIXES) or self._dispatcher is None:
+            return await callback(*args, **kwargs)
         
-        # تنظيف الرابط
-        final_link = final_link.replace(" ", "%20")
+        chat_id = data.get("chat_id")
+        if isinstance(rate_limit_args, dict) and "priority" in rate_limit_args:
+            priority = rate_limit_args["priority"]
+        elif _send_priority.get() is not None:
+            priority = _send_priority.get()
+        else:
+            priority = SEND_PROGRESS if endpoint.startswith("edit") else SEND_INTERACTIVE
+        merge_key = None
+        if endpoint in MERGEABLE_ENDPOINTS:
+            if data.get("inline_message_id"):
+                merge_key = (endpoint, data["inline_message_id"])
+            elif data.get("message_id") is not None:
+                merge_key = (endpoint, chat_id, data["message_id"])
         
+        attempts: List[SendJob] = []
+        try:
+            result = await self._run(callback, args, kwargs, endpoint, priority, chat_id, merge_key, attempts)
+        except BaseException as e:
+            for job in attempts:
+                if not job.result.done():
+                    job.result.set_exception(e)
+            raise
+        # التعديلات المستبدلة قد تنتظر نتيجة أي محاولة سابقة
+        for job in attempts:
+            if not job.result.done():
+                job.result.set_result(result)
+        return result
+    
+    async def _run(self, callback, args, kwargs, endpoint: str, priority: int, chat_id, merge_key, attempts: List[SendJob]):
+        not_before = 0.0
+        for attempt in range(self.max_retries + 1):
+            newer = self._edits.get(merge_key)
+            if attempt > 0 and newer is not None and not newer.turn.done():
+                # وصل تعديل أحدث أثناء الانتظار بعد RetryAfter؛ لا نعيد إرسال النسخة القديمة
+                self.merged += 1
+                SEND_MERGED.inc()
+                return await asyncio.shield(newer.result)
+            
+            job = self._submit(priority, chat_id, merge_key, not_before)
+            attempts.append(job)
+            await job.turn
+            if job.superseded_by is not None:
+                # تعديل أحدث لنفس الرسالة سيُرسل مكانه؛ نعيد نتيجته
+                self.merged += 1
+                SEND_MERGED.inc()
+                return await asyncio.shield(job.superseded_by.result)
+            if self._edits.get(merge_key) is job:
+                del self._edits[merge_key]
+            SEND_WAIT_SECONDS.observe(
+                time.monotonic() - job.queued_at, priority=SEND_PRIORITY_NAMES.get(priority, str(priority))
+            )
+            
+            try:
+                result = await callback(*args, **kwargs)
+            except RetryAfter as e:
+                self.retry_after += 1
+                SEND_RETRY_AFTER.inc(endpoint=endpoint)
+                self._pause(chat_id, float(e.retry_after))
+                if attempt == self.max_retries:
+                    raise
+                logger.warning(f"⏳ Telegram طلب الانتظار {e.retry_after} ث ({endpoint})، إعادة الجدولة")
+                not_before = time.monotonic() + float(e.retry_after)
+                continue
+            self.sent += 1
+            return result
+    
+    def stats(self) -> Dict[str, int]:
         return {
-            'direct_link': final_link,
-            'file_name': file_name,
-            'file_size': file_size
+            "queued": len(self),
+            "sent": self.sent,
+            "merged": self.merged,
+            "retry_after": self.retry_after,
+            "chats": len(self._chats),
         }
+
+send_scheduler = SendScheduler(SEND_GLOBAL_RATE, SEND_CHAT_RATE, SEND_GROUP_RATE, SEND_MAX_RETRIES)
+
+# ----------------- وضع الموسم (معالجة مجموعة حلقات) -----------------
+class DebouncedEditor:
+    """تعديل رسالة واحدة مع تجميع التحديثات المتقاربة لتجنب حدود Telegram"""
+    
+    def __init__(self, message, interval: float, priority: int = SEND_PROGRESS, parse_mode: str = 'Markdown'):
+        self.message = message
+        self.parse_mode = parse_mode
+        self.interval = interval
+        self.priority = priority
+        self._last_edit = 0.0
+        self._pending = None
+        self._last_sent = None
+        self._flush_task = None
+    
+    async def edit(self, text: str, reply_markup: Optional[InlineKeyboardMarkup] = None, force: bool = False):
+        """طلب تعديل؛ يُرسل فوراً أو بعد انتهاء الفاصل الزمني مع الاحتفاظ بآخر نسخة فقط"""
+        self._pending = (text, reply_markup)
+        delay = self.interval - (time.monotonic() - self._last_edit)
+        if force or delay <= 0:
+            if self._flush_task is not None:
+                self._flush_task.cancel()
+                self._flush_task = None
+            # التعديل النهائي (force) هو الرد الفعلي للمستخدم فيُرسل بأولوية تفاعلية
+            await self._flush(SEND_INTERACTIVE if force else self.priority)
+        elif self._flush_task is None:
+            self._flush_task = asyncio.ensure_future(self._delayed_flush(delay))
+    
+    async def _delayed_flush(self, delay: float):
+        await asyncio.sleep(delay)
+        self._flush_task = None
+        await self._flush(self.priority)
+    
+    async def _flush(self, priority: int):
+        if self._pending is None:
+            return
+        text, reply_markup = self._pending
+        self._pending = None
         
-    except Exception as e:
-        logger.error(f"❌ خطأ في استخراج معلومات التحميل: {e}")
+        payload = (text, reply_markup.to_json() if reply_markup else None)
+        if payload == self._last_sent:
+            return
+        self._last_sent = payload
+        self._last_edit = time.monotonic()
+        
+        token = _send_priority.set(priority)
+        try:
+            await self.message.edit_text(text, reply_markup=reply_markup, parse_mode=self.parse_mode)
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                logger.warning(f"⚠️ تعذر تعديل الرسالة: {e}")
+        finally:
+            _send_priority.reset(token)
+
+def parse_episode_range(spec: str) -> Optional[Tuple[int, int]]:
+    """تحليل نطاق الحلقات بصيغة 1-10"""
+    match = re.fullmatch(r'\s*(\d+)\s*-\s*(\d+)\s*', spec)
+    if not match:
         return None
+    first, last = int(match.group(1)), int(match.group(2))
+    if first > last:
+        first, last = last, first
+    return first, last
 
-# ----------------- دالة المعالجة الرئيسية -----------------
-def process_arabseed_url(url: str) -> Tuple[bool, str, List[List[Dict]]]:
-    """معالجة رابط عرب سيد"""
-    session = requests.Session()
-    headers = get_random_headers()
-    session.headers.update(headers)
+def render_season_progress(title: str, episodes: List[int], results: Dict[int, Tuple], running: bool) -> Tuple[str, InlineKeyboardMarkup]:
+    """نص وأزرار رسالة تقدم الموسم (HTML لأن العنوان مأخوذ من الرابط وقد يحوي رموز Markdown)"""
+    succeeded = [ep for ep in episodes if ep in results and results[ep][0]]
+    failed = [ep for ep in episodes if ep in results and not results[ep][0]]
+    
+    state = "⏳ جاري المعالجة" if running else "✅ انتهت المعالجة"
+    text = f"🎬 <b>{html.escape(title)}</b>\n\n{state}: {len(results)}/{len(episodes)}"
+    if succeeded:
+        text += f"\n📥 جاهزة: {len(succeeded)}"
+    if failed:
+        text += "\n❌ تعذرت: " + "، ".join(str(ep) for ep in failed)
+    
+    keyboard = []
+    for ep in succeeded:
+        row = []
+        for button_row in results[ep][2][:SEASON_BUTTONS_PER_EPISODE]:
+            button = button_row[0]
+            label = button["text"].replace("📥", "").replace("[", "").replace("]", "").strip()
+            row.append(InlineKeyboardButton(f"{ep} • {label}", url=button["url"]))
+        keyboard.append(row)
+    if running:
+        keyboard.append([InlineKeyboardButton("⛔ إلغاء", callback_data="cancel_season")])
+    return text, InlineKeyboardMarkup(keyboard)
+
+async def run_season(session: UserSession, editor: DebouncedEditor, title: str, episode_urls: Dict[int, str]):
+    """معالجة حلقات الموسم عبر خط معالجة محدود مع تحديث رسالة التقدم عند انتهاء كل حلقة"""
+    episodes = sorted(episode_urls)
+    results: Dict[int, Tuple] = {}
+    semaphore = asyncio.Semaphore(SEASON_CONCURRENCY)
+    
+    async def resolve_one(ep: int):
+        async with semaphore:
+            results[ep] = await resolve_episode(episode_urls[ep])
+        text, markup = render_season_progress(title, episodes, results, running=True)
+        await editor.edit(text, markup)
     
+    tasks = [asyncio.ensure_future(resolve_one(ep)) for ep in episodes]
     try:
-        logger.info(f"🚀 بدء معالجة الرابط: {url}")
-        
-        # الخطوة 1: جلب صفحة الحلقة
-        response = make_request(url, session=session)
-        if not response:
-            return False, "❌ تعذر الوصول إلى الرابط، تأكد من صحته", []
-        
-        # التحقق من أن الصفحة موجودة
-        if response.status_code != 200:
-            return False, f"❌ خطأ في جلب الصفحة (رمز: {response.status_code})", []
-        
-        html_content = response.text
-        soup = BeautifulSoup(html_content, 'html.parser')
-        
-        # التحقق من وجود الحلقة
-        error_indicators = [
-            'لم يتم العثور',
-            'صفحة غير موجودة',
-            'not found',
-            '404',
-            'error',
-            'عذراً'
-        ]
-        
-        page_text = soup.get_text().lower()
-        if any(indicator in page_text for indicator in error_indicators):
-            return False, "❌ الحلقة غير موجودة أو الرابط غير صحيح", []
-        
-        # الخطوة 2: البحث عن روابط التحميل
-        download_links = []
-        
-        # البحث في الروابط
-        for a in soup.find_all('a', href=True):
-            href = a['href'].lower()
-            if any(keyword in href for keyword in ['download', 'تحميل', 'server', 'سيرفر', 'جودة', 'quality']):
-                download_links.append(a['href'])
-        
-        # إذا لم نجد، نبحث في الأزرار
-        if not download_links:
-            buttons = soup.find_all(['button', 'a'], text=re.compile(r'تحميل|تنزيل|download', re.IGNORECASE))
-            for btn in buttons:
-                if btn.get('onclick'):
-                    # استخراج الرابط من onclick
-                    match = re.search(r"location\.href=['\"]([^'\"]+)['\"]", btn.get('onclick', ''))
-                    if match:
-                        download_links.append(match.group(1))
-        
-        # إذا لم نجد بعد، نستخدم بعض الروابط الشائعة
-        if not download_links:
-            # البحث عن أي رابط يحتوي على /download/
-            for a in soup.find_all('a', href=re.compile(r'/download/', re.IGNORECASE)):
-                download_links.append(a['href'])
-        
-        if not download_links:
-            return False, "❌ لم أتمكن من العثور على روابط التحميل في الصفحة", []
-        
-        logger.info(f"🔗 وجدت {len(download_links)} روابط تحميل")
-        
-        # الخطوة 3: معالجة كل رابط
-        buttons_data = []
-        base_url = extract_base_url(url)
-        
-        for i, link in enumerate(download_links[:5]):  # نأخذ أول 5 روابط فقط
-            if not link.startswith('http'):
-                link = base_url + link
-            
-            logger.info(f"⚙️ معالجة الرابط {i+1}: {link}")
-            
-            # استخراج معلومات التحميل
-            info = get_download_info(link, base_url + "/")
-            
-            if info and info.get('direct_link'):
-                # تحديد الجودة
-                quality = "جودة عالية"
-                if '360' in link or '360' in info['file_name']:
-                    quality = "360p"
-                elif '480' in link or '480' in info['file_name']:
-                    quality = "480p"
-                elif '720' in link or '720' in info['file_name']:
-                    quality = "720p"
-                elif '1080' in link or '1080' in info['file_name']:
-                    quality = "1080p"
-                
-                # إنشاء زر
-                btn_text = f"📥 {quality} - {info['file_size']}"
-                buttons_data.append([{"text": btn_text, "url": info['direct_link']}])
-                
-                logger.info(f"✅ تم إضافة {quality}")
-            
-            # تأخير بسيط بين الطلبات
-            time.sleep(0.3)
-        
-        if not buttons_data:
-            return False, "❌ لم أتمكن من استخراج روابط تحميل صالحة", []
-        
-        # استخراج العنوان
-        title = extract_title_from_url(url)
-        
-        logger.info(f"🎉 تمت المعالجة بنجاح: {title}")
-        return True, title, buttons_data
-        
+        await asyncio.gather(*tasks)
+        text, markup = render_season_progress(title, episodes, results, running=False)
+        await editor.edit(text, markup, force=True)
+    except asyncio.CancelledError:
+        for task in tasks:
+            task.cancel()
+        text, markup = render_season_progress(title, episodes, results, running=False)
+        await editor.edit(text + "\n\n⛔ تم إلغاء المعالجة", markup, force=True)
     except Exception as e:
-        logger.error(f"❌ خطأ في معالجة الرابط: {e}")
-        return False, f"❌ حدث خطأ غير متوقع: {str(e)}", []
+        logger.error(f"❌ خطأ في وضع الموسم: {e}\n{traceback.format_exc()}")
+        await editor.edit("❌ حدث خطأ أثناء معالجة الموسم", force=True)
+    finally:
+        session.batch_task = None
+
+async def season_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """أمر /season <الرابط> <من>-<إلى>"""
+    session = await get_user_session(update.effective_user.id)
+    args = context.args or []
+    
+    if not args:
+        await update.message.reply_text(
+            "📚 *وضع الموسم:*\n`/season <رابط الحلقة> <من>-<إلى>`\n\nمثال:\n`/season https://arabseed.top/مسلسل-العنكبوت-الحلقة-1 1-10`",
+            parse_mode='Markdown'
+        )
+        return
+    
+    if session.batch_task is not None:
+        await update.message.reply_text("⏳ جاري معالجة موسم آخر، انتظر أو اضغط إلغاء...")
+        return
+    
+    url = args[0].strip()
+    if not url.startswith(('http://', 'https://')) or 'arabseed' not in url.lower():
+        await update.message.reply_text("❌ يرجى إرسال رابط حلقة صالح من موقع عرب سيد")
+        return
+    
+    episode, builder = extract_episode_and_base(url)
+    if episode is None:
+        await update.message.reply_text("❌ لم أتمكن من تحديد رقم الحلقة من الرابط")
+        return
+    
+    # بدون نطاق: من الحلقة الأولى حتى الحلقة الموجودة في الرابط
+    episode_range = parse_episode_range(args[1]) if len(args) > 1 else (1, episode)
+    if episode_range is None:
+        await update.message.reply_text("❌ صيغة النطاق غير صحيحة، مثال: 1-10")
+        return
+    
+    first, last = episode_range
+    if last - first + 1 > SEASON_MAX_EPISODES:
+        await update.message.reply_text(f"⚠️ الحد الأقصى {SEASON_MAX_EPISODES} حلقة في الطلب الواحد")
+        return
+    
+    episode_urls = {ep: builder(ep) for ep in range(first, last + 1)}
+    title = extract_title_from_url(url)
+    
+    text, markup = render_season_progress(title, sorted(episode_urls), {}, running=True)
+    progress_msg = await update.message.reply_text(text, reply_markup=markup, parse_mode='HTML')
+    editor = DebouncedEditor(progress_msg, PROGRESS_EDIT_INTERVAL, priority=SEND_BULK, parse_mode='HTML')
+    
+    session.batch_task = context.application.create_task(
+        run_season(session, editor, title, episode_urls)
+    )
+
+# ----------------- البحث في الفهرس -----------------
+def format_age(seconds: float) -> str:
+    """عرض مختصر لعمر البيانات المحفوظة"""
+    if seconds < 60:
+        return "الآن"
+    if seconds < 3600:
+        return f"منذ {int(seconds // 60)} دقيقة"
+    if seconds < 86400:
+        return f"منذ {int(seconds // 3600)} ساعة"
+    return f"منذ {int(seconds // 86400)} يوم"
+
+def render_indexed_episode(entry: Dict[str, Any]) -> Tuple[str, InlineKeyboardMarkup]:
+    """رسالة آخر حلقة من الفهرس مع أزرارها المحفوظة (نص عادي لأن الأسماء تأتي من الروابط)"""
+    keyboard = build_buttons_keyboard(entry["buttons"])
+    keyboard.append([InlineKeyboardButton("🔄 معالجة رابط آخر", callback_data="new_link")])
+    text = (
+        f"🎬 {entry['title']}\n\n"
+        + (f"📺 آخر حلقة مفهرسة: {entry['episode']}\n" if entry['episode'] else "")
+        + f"🕒 الروابط محفوظة {format_age(time.time() - entry['resolved_at'])}\n\n"
+        + f"🔗 لتحديث الروابط أرسل رابط الحلقة:\n{entry['url']}"
+    )
+    return text, InlineKeyboardMarkup(keyboard)
+
+async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """أمر /search <الاسم>"""
+    query_text = " ".join(context.args or []).strip()
+    if not query_text:
+        await update.message.reply_text(
+            "🔎 *البحث في المسلسلات المفهرسة:*\n`/search <اسم المسلسل>`\n\nمثال:\n`/search العنكبوت`",
+            parse_mode='Markdown'
+        )
+        return
+    
+    matches = await asyncio.get_running_loop().run_in_executor(None, series_index.search, query_text)
+    if not matches:
+        await update.message.reply_text(
+            "🔍 لا يوجد مسلسل مطابق في الفهرس بعد.\nأرسل رابط أي حلقة منه ليُضاف تلقائياً."
+        )
+        return
+    
+    keyboard = [
+        [InlineKeyboardButton(
+            f"📺 {item['name']} • الحلقة {item['latest_episode']}" if item['latest_episode'] is not None else f"📺 {item['name']}",
+            callback_data=f"idx:{item['id']}"
+        )]
+        for item in matches
+    ]
+    await update.message.reply_text(
+        f"🔎 نتائج البحث عن: {query_text}\nاختر المسلسل لعرض روابط آخر حلقة:",
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+
+async def latest_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """أمر /latest <الاسم>: روابط آخر حلقة مباشرة من الفهرس دون أي طلب للموقع"""
+    query_text = " ".join(context.args or []).strip()
+    if not query_text:
+        await update.message.reply_text(
+            "📺 *آخر حلقة:*\n`/latest <اسم المسلسل>`\n\nمثال:\n`/latest العنكبوت`",
+            parse_mode='Markdown'
+        )
+        return
+    
+    loop = asyncio.get_running_loop()
+    matches = await loop.run_in_executor(None, series_index.search, query_text, 1)
+    entry = await loop.run_in_executor(None, series_index.latest_episode, matches[0]["id"]) if matches else None
+    if entry is None:
+        await update.message.reply_text(
+            "🔍 لا يوجد مسلسل مطابق في الفهرس بعد.\nأرسل رابط أي حلقة منه ليُضاف تلقائياً."
+        )
+        return
+    
+    text, markup = render_indexed_episode(entry)
+    await update.message.reply_text(text, reply_markup=markup)
 
 # ----------------- دوال Telegram -----------------
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -486,6 +3441,13 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 4. ⏳ انتظر قليلاً (10-20 ثانية)
 5. 📥 اختر جودة التحميل المناسبة
 
+📚 *لتحميل موسم كامل:*
+`/season <رابط الحلقة> <من>-<إلى>`
+
+🔎 *البحث في المسلسلات التي سبقت معالجتها:*
+`/search <اسم المسلسل>`
+`/latest <اسم المسلسل>` لروابط آخر حلقة فوراً
+
 ⚠️ *ملاحظات مهمة:*
 • البوت لا يخزن أي ملفات
 • الجودة تعتمد على المصدر الأصلي
@@ -506,10 +3468,22 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     await update.message.reply_text(help_text, parse_mode='Markdown')
 
+def build_buttons_keyboard(buttons_data: List[List[Dict]]) -> List[List[InlineKeyboardButton]]:
+    """تحويل بيانات الأزرار إلى أزرار Telegram"""
+    keyboard = []
+    for button_row in buttons_data:
+        row = []
+        for button in button_row:
+            # تنظيف نص الزر
+            clean_text = button["text"].replace("[", "").replace("]", "").strip()
+            row.append(InlineKeyboardButton(clean_text, url=button["url"]))
+        keyboard.append(row)
+    return keyboard
+
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """معالجة الرسائل"""
     user_id = update.effective_user.id
-    session = get_user_session(user_id)
+    session = await get_user_session(user_id)
     
     if session.processing:
         await update.message.reply_text("⏳ جاري معالجة طلبك السابق، انتظر قليلاً...")
@@ -531,25 +3505,24 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             session.processing = False
             return
         
-        # إرسال رسالة الانتظار
-        wait_msg = await update.message.reply_text("⏳ جاري معالجة الرابط، يرجى الانتظار 10-20 ثانية...")
+        # إرسال رسالة الانتظار، ثم تعديلها بإضافة كل جودة فور جاهزيتها
+        wait_msg = await update.message.reply_text("⏳ جاري معالجة الرابط، ستظهر الجودات هنا فور جاهزيتها...")
+        editor = DebouncedEditor(wait_msg, PROGRESS_EDIT_INTERVAL)
+        arrived = []
+        
+        async def on_button(button_row):
+            arrived.append(button_row)
+            await editor.edit(
+                f"⏳ جاري المعالجة... جاهز {len(arrived)} حتى الآن",
+                InlineKeyboardMarkup(build_buttons_keyboard(arrived))
+            )
         
         # معالجة الرابط
-        success, title_or_msg, buttons_data = process_arabseed_url(url)
+        success, title_or_msg, buttons_data = await resolve_episode(url, on_button=on_button)
         
         if success:
-            # حذف رسالة الانتظار
-            await wait_msg.delete()
-            
             # تحويل البيانات إلى أزرار Telegram
-            keyboard = []
-            for button_row in buttons_data:
-                row = []
-                for button in button_row:
-                    # تنظيف نص الزر
-                    clean_text = button["text"].replace("[", "").replace("]", "").strip()
-                    row.append(InlineKeyboardButton(clean_text, url=button["url"]))
-                keyboard.append(row)
+            keyboard = build_buttons_keyboard(buttons_data)
             
             # إضافة أزرار إضافية
             keyboard.append([
@@ -559,7 +3532,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             
             reply_markup = InlineKeyboardMarkup(keyboard)
             
-            # إرسال الرسالة مع الأزرار
+            # تعديل رسالة الانتظار إلى الرسالة النهائية مع الأزرار
             message_text = f"""
 🎬 *{title_or_msg}*
 
@@ -569,11 +3542,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 🔔 *ملاحظة:* الروابط مباشرة من سيرفرات عرب سيد
             """
             
-            await update.message.reply_text(
-                message_text,
-                reply_markup=reply_markup,
-                parse_mode='Markdown'
-            )
+            await editor.edit(message_text, reply_markup, force=True)
             
             # حفظ في التاريخ
             session.history.append({
@@ -581,10 +3550,18 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 'title': title_or_msg,
                 'time': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             })
+            session.last_url = url
+            session.last_title = title_or_msg
+            session_store.save(user_id, session)
             
-        else:
-            await wait_msg.delete()
+            # تجهيز الحلقات التالية مسبقاً
+            episode, builder = extract_episode_and_base(url)
+            if episode is not None:
+                session.current_episode = episode
+                session.builder_func = builder
+                prefetcher.schedule(url)
             
+        else:
             # رسالة خطأ أكثر وصفية
             error_text = f"""
 {title_or_msg}
@@ -604,7 +3581,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             ]
             reply_markup = InlineKeyboardMarkup(keyboard)
             
-            await update.message.reply_text(error_text, reply_markup=reply_markup, parse_mode='Markdown')
+            await editor.edit(error_text, reply_markup, force=True)
             
     except Exception as e:
         logger.error(f"❌ خطأ في handle_message: {e}\n{traceback.format_exc()}")
@@ -620,21 +3597,119 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     if query.data == "new_link":
         await query.edit_message_text("🔄 *أرسل رابط الحلقة الجديدة...*\n\nتأكد من أن الرابط من موقع عرب سيد ويبدأ بـ https://", parse_mode='Markdown')
+    elif query.data == "cancel_season":
+        session = await get_user_session(query.from_user.id)
+        if session.batch_task is not None:
+            session.batch_task.cancel()
+    elif query.data.startswith("idx:"):
+        entry = await asyncio.get_running_loop().run_in_executor(
+            None, series_index.latest_episode, int(query.data[4:])
+        )
+        if entry is None:
+            await query.edit_message_text("🔍 لم تعد هذه الحلقة موجودة في الفهرس، أرسل رابطها مباشرة.")
+            return
+        text, markup = render_indexed_episode(entry)
+        await query.edit_message_text(text, reply_markup=markup)
 
 async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """فحص حالة البوت"""
+    pool_stats = http_client.stats()
+    pool_hits = sum(host["hits"] for host in pool_stats.values())
+    pool_misses = sum(host["misses"] for host in pool_stats.values())
+    cache_stats = link_cache.stats()
+    session_stats = session_store.stats()
+    index_stats = series_index.stats()
+    send_stats = send_scheduler.stats()
+    send_wait = SEND_WAIT_SECONDS.summary(priority="interactive")
+    send_wait_text = f"{send_wait[2]:g} ث" if send_wait else "-"
+    mirrors_text = "\n".join(
+        f"• {domain}: نجاح {success_rate:.0%} • {latency_ms:.0f} ms"
+        for domain, success_rate, latency_ms in mirror_registry.summary()[:MIRROR_MAX_ATTEMPTS]
+    )
+    
+    uptime = datetime.now() - BOT_STARTED_AT
+    stage_lines = []
+    for stage in RESOLUTION_STAGES:
+        summary = STAGE_SECONDS.summary(stage=stage)
+        if summary:
+            count, mean, p95 = summary
+            stage_lines.append(f"• `{stage}`: متوسط {mean:.2f} ث • p95 ≤ {p95:g} ث ({count})")
+    stages_text = "\n".join(stage_lines) or "• لا توجد قياسات بعد"
+    revalidation_text = "{:.0f} صفحة دون تغيير من {:.0f} • وفر ~{:.2f} ث تحليل".format(
+        REVALIDATIONS.total() - REVALIDATIONS.total(result="new") - REVALIDATIONS.total(result="changed"),
+        REVALIDATIONS.total() - REVALIDATIONS.total(result="new"),
+        REVALIDATION_SAVED.total()
+    )
+    http_text = "{:.0f} طلب • {:.0f} إعادة • {:.0f} رد 403 • {:.0f} استثناء".format(
+        HTTP_REQUESTS.total(),
+        HTTP_RETRIES.total(),
+        HTTP_FORBIDDEN.total(),
+        HTTP_EXCEPTIONS.total()
+    )
+    
+    workers_text = ""
+    if worker_pool is not None:
+        workers = worker_pool.stats()
+        workers_text = "\n🏭 *عمليات المعالجة:* {}/{} تعمل • في الطابور {} • قيد المعالجة {}\n".format(
+            workers["alive"], workers["workers"], workers["queue_depth"], workers["in_progress"]
+        ) + "\n".join(
+            f"• #{worker_id}: {item['jobs']} مهمة • {item['avg_ms']:.0f} ms"
+            for worker_id, item in workers["per_worker"].items()
+        ) + "\n"
+    
     status_text = """
 ✅ *البوت يعمل بشكل طبيعي*
 
 🤖 *معلومات البوت:*
 • الحالة: 🟢 نشط
 • المستخدمين: {}
-• يعمل منذ: {}
+• يعمل منذ: {} ({} ساعة و{} دقيقة)
+
+👥 *الجلسات:* {} في الذاكرة • ~{:.1f} KB لكل جلسة • إخراج {}
+
+🔌 *الاتصالات:* {} إعادة استخدام / {} اتصال جديد
+🗂 *الكاش:* {} عنصر • إصابة {:.0%} • إخراج {}
+🔗 *طلبات مدمجة:* {} • جارية الآن: {}
+📡 *HTTP:* {}
+♻️ *إعادة التحقق:* {}
+🧭 *مستخرجات مقدَّمة:* {} مضيف
+📇 *الفهرس:* {} مسلسل • {} حلقة
+📤 *الإرسال:* في الطابور {} • مدمج {} • RetryAfter {} • انتظار الردود p95 ≤ {}
+{}
+⏱ *زمن المراحل:*
+{}
+
+🌐 *المرايا:*
+{}
 
 ⚡ *آخر تحديث:* {}
     """.format(
-        len(user_sessions),
-        datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        session_stats["known"],
+        BOT_STARTED_AT.strftime("%Y-%m-%d %H:%M:%S"),
+        int(uptime.total_seconds() // 3600),
+        int(uptime.total_seconds() % 3600 // 60),
+        session_stats["active"],
+        session_stats["bytes_per_session"] / 1024,
+        session_stats["evictions"],
+        pool_hits,
+        pool_misses,
+        cache_stats["size"],
+        cache_stats["hit_ratio"],
+        cache_stats["evictions"],
+        resolution_flight.coalesced,
+        len(resolution_flight),
+        http_text,
+        revalidation_text,
+        len(final_link_extractors.promoted()),
+        index_stats["series"],
+        index_stats["episodes"],
+        send_stats["queued"],
+        send_stats["merged"],
+        send_stats["retry_after"],
+        send_wait_text,
+        workers_text,
+        stages_text,
+        mirrors_text,
         datetime.now().strftime("%H:%M:%S")
     )
     
@@ -644,12 +3719,275 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """معالج الأخطاء"""
     logger.error(f"❌ خطأ: {context.error}")
     
+    # بعد استنفاد إعادة الجدولة: أي رسالة إضافية تزيد الحظر سوءاً
+    if isinstance(context.error, RetryAfter):
+        return
+    
     try:
         if update and update.effective_message:
             await update.effective_message.reply_text("❌ حدث خطأ، جاري إعادة المحاولة...")
     except:
         pass
 
+# ----------------- ربط مقاييس المكونات -----------------
+metrics.callback("arabseed_cache_lookups_total", "counter", "Link cache lookups by result",
+                 lambda: {("result", "hit"): link_cache.hits, ("result", "miss"): link_cache.misses})
+metrics.callback("arabseed_cache_entries", "gauge", "Entries in the in-memory link cache",
+                 lambda: link_cache.stats()["size"])
+metrics.callback("arabseed_cache_hit_ratio", "gauge", "Link cache hit ratio since start",
+                 lambda: link_cache.stats()["hit_ratio"])
+metrics.callback("arabseed_probe_cache_entries", "gauge", "Direct link probe results held in memory",
+                 lambda: len(probe_cache))
+metrics.callback("arabseed_inflight_resolutions", "gauge", "Resolutions currently running in this process",
+                 lambda: len(resolution_flight))
+metrics.callback("arabseed_coalesced_total", "counter", "Requests that joined an in-flight resolution",
+                 lambda: resolution_flight.coalesced)
+metrics.callback("arabseed_worker_queue_depth", "gauge", "Jobs waiting for a worker process",
+                 lambda: worker_pool.stats()["queue_depth"] if worker_pool is not None else 0)
+metrics.callback("arabseed_worker_jobs_in_progress", "gauge", "Jobs running in worker processes",
+                 lambda: worker_pool.stats()["in_progress"] if worker_pool is not None else 0)
+metrics.callback("arabseed_rate_limited_total", "counter", "Requests delayed by the per-host rate limiter",
+                 lambda: rate_limiter.throttled)
+metrics.callback("arabseed_sessions", "gauge", "User sessions held in memory",
+                 lambda: len(session_store))
+metrics.callback("arabseed_index_series", "gauge", "Series held in the local search index",
+                 lambda: series_index.stats()["series"])
+metrics.callback("arabseed_send_queue_depth", "gauge", "Outbound Telegram requests waiting in the send scheduler",
+                 lambda: len(send_scheduler))
+metrics.callback("arabseed_uptime_seconds", "gauge", "Seconds since the bot started",
+                 lambda: (datetime.now() - BOT_STARTED_AT).total_seconds())
+
+async def handle_metrics(body: bytes, headers: Dict[str, str]) -> Tuple[int, str, bytes]:
+    return 200, "text/plain; version=0.0.4; charset=utf-8", metrics.render().encode("utf-8")
+
+# ----------------- خادم HTTP خفيف (webhook وفحص الصحة) -----------------
+HTTP_REASONS = {
+    200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+    405: "Method Not Allowed", 408: "Request Timeout", 413: "Payload Too Large", 500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+class HttpRequestError(Exception):
+    """طلب HTTP غير صالح: يُرد عليه بالرمز المحدد ثم يُغلق الاتصال"""
+    
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+class HttpServer:
+    """خادم HTTP/1.1 بسيط فوق asyncio: كل مسار يُربط بدالة async تعيد (الرمز، نوع المحتوى، الجسم)"""
+    
+    MAX_BODY = 1024 * 1024
+    MAX_HEADERS = 100
+    # أقصى مدة لقراءة طلب كامل (السطر الأول والهيدرات والجسم)، وانتظار الطلب التالي على نفس الاتصال
+    READ_TIMEOUT = 30.0
+    
+    def __init__(self):
+        self._routes: Dict[Tuple[str, str], Any] = {}
+        self._server = None
+        self.requests = 0
+    
+    def route(self, method: str, path: str, handler):
+        """handler(body: bytes, headers: Dict[str, str]) -> (status, content_type, body)"""
+        self._routes[(method.upper(), path)] = handler
+    
+    async def start(self, host: str, port: int):
+        self._server = await asyncio.start_server(self._serve, host, port)
+        logger.info(f"🌍 خادم HTTP يستمع على {host}:{port}")
+    
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+    
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+        """قراءة طلب واحد: (الطريقة، الهدف، الهيدرات، الجسم)، أو None إذا أغلق العميل الاتصال"""
+        try:
+            request_line = await reader.readline()
+            if not request_line:
+                return None
+            try:
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+            except ValueError:
+                raise HttpRequestError(400, "bad request line")
+            
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                if len(headers) >= self.MAX_HEADERS:
+                    raise HttpRequestError(400, "too many headers")
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+        except ValueError:
+            # سطر أطول من حد StreamReader
+            raise HttpRequestError(400, "line too long")
+        
+        length_header = headers.get("content-length") or "0"
+        if not length_header.isdigit():
+            raise HttpRequestError(400, "invalid content-length")
+        length = int(length_header)
+        if length > self.MAX_BODY:
+            raise HttpRequestError(413, "payload too large")
+        body = await reader.readexactly(length) if length else b""
+        return method, target, headers, body
+    
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            # اتصال واحد قد يحمل عدة طلبات (keep-alive)
+            while True:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader), self.READ_TIMEOUT)
+                except HttpRequestError as e:
+                    await self._respond(writer, e.status, "text/plain", e.message.encode("latin-1"), False)
+                    break
+                except asyncio.TimeoutError:
+                    # عميل بطيء أو اتصال خامل: لا نترك الاتصال مفتوحاً
+                    await self._respond(writer, 408, "text/plain", b"request timeout", False)
+                    break
+                if request is None:
+                    break
+                method, target, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                
+                self.requests += 1
+                path = urlparse(target).path
+                handler = self._routes.get((method.upper(), path))
+                if handler is None:
+                    allowed = any(route_path == path for _, route_path in self._routes)
+                    status, content_type, payload = (405, "text/plain", b"method not allowed") if allowed \
+                        else (404, "text/plain", b"not found")
+                else:
+                    try:
+                        status, content_type, payload = await handler(body, headers)
+                    except Exception as e:
+                        logger.error(f"❌ خطأ في معالجة طلب HTTP {path}: {e}")
+                        status, content_type, payload = 500, "text/plain", b"internal error"
+                
+                await self._respond(writer, status, content_type, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+    
+    @staticmethod
+    async def _respond(writer: asyncio.StreamWriter, status: int, content_type: str, payload: bytes, keep_alive: bool):
+        head = (
+            f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + payload)
+        await writer.drain()
+
+def json_response(status: int, data: Dict) -> Tuple[int, str, bytes]:
+    return status, "application/json", json.dumps(data, ensure_ascii=False).encode("utf-8")
+
+class WebhookServer:
+    """استقبال تحديثات Telegram عبر webhook وتمريرها لطابور التطبيق، مع /healthz وإيقاف متدرج
+    
+    الرمز السري إلزامي، وإلا يستطيع أي أحد يعرف المسار إرسال تحديثات مزيفة.
+    """
+    
+    def __init__(self, application: Application, path: str, secret: str):
+        if not secret:
+            raise ValueError("ARABSEED_WEBHOOK_SECRET مطلوب في وضع webhook")
+        self.application = application
+        self.path = path
+        self.secret = secret
+        self.draining = False
+        self.received = 0
+        self.http = HttpServer()
+        self.http.route("POST", path, self.handle_update)
+        self.http.route("GET", "/healthz", self.handle_health)
+        self.http.route("GET", "/metrics", handle_metrics)
+    
+    async def handle_update(self, body: bytes, headers: Dict[str, str]) -> Tuple[int, str, bytes]:
+        if headers.get("x-telegram-bot-api-secret-token") != self.secret:
+            return json_response(403, {"ok": False, "error": "invalid secret token"})
+        # أثناء الإيقاف نرفض التحديثات ليعيد Telegram إرسالها للنسخة الجديدة
+        if self.draining:
+            return json_response(503, {"ok": False, "error": "draining"})
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            return json_response(400, {"ok": False, "error": f"invalid update: {e}"})
+        if update is None:
+            return json_response(400, {"ok": False, "error": "empty update"})
+        self.received += 1
+        await self.application.update_queue.put(update)
+        return json_response(200, {"ok": True})
+    
+    async def handle_health(self, body: bytes, headers: Dict[str, str]) -> Tuple[int, str, bytes]:
+        data = {
+            "status": "draining" if self.draining else "ok",
+            "in_flight": len(resolution_flight),
+            "updates_received": self.received,
+            "queued_updates": self.application.update_queue.qsize(),
+        }
+        return json_response(503 if self.draining else 200, data)
+    
+    async def run(self, listen: str, port: int, public_url: str, drain_timeout: float):
+        """تشغيل التطبيق حتى وصول SIGINT/SIGTERM، ثم انتظار المعالجات الجارية قبل الإغلاق"""
+        application = self.application
+        await application.initialize()
+        if public_url:
+            await application.bot.set_webhook(
+                url=public_url + self.path,
+                secret_token=self.secret,
+                allowed_updates=Update.ALL_TYPES,
+                drop_pending_updates=True
+            )
+            logger.info(f"🔗 تم تسجيل webhook: {public_url + self.path}")
+        else:
+            logger.info("🧪 لم يتم تحديد ARABSEED_WEBHOOK_URL، الخادم يستقبل التحديثات محلياً فقط")
+        await application.start()
+        await self.http.start(listen, port)
+        
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop_event.set)
+            except (NotImplementedError, RuntimeError):
+                signal.signal(sig, lambda *_: loop.call_soon_threadsafe(stop_event.set))
+        await stop_event.wait()
+        
+        # إيقاف متدرج: نرفض التحديثات الجديدة وننتظر انتهاء المعالجات الجارية والمواسم
+        self.draining = True
+        logger.info(f"🛑 إيقاف متدرج، بانتظار {len(resolution_flight)} معالجة جارية...")
+        try:
+            await asyncio.wait_for(application.stop(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⏱️ لم تنتهِ المعالجات خلال {drain_timeout} ث، سيتم الإغلاق")
+        await self.http.stop()
+        await application.shutdown()
+
+metrics_server: Optional[HttpServer] = None
+
+async def start_metrics_server(application: Application):
+    """تشغيل نقطة /metrics في وضع polling (تُستدعى من post_init)"""
+    global metrics_server
+    if not METRICS_PORT:
+        return
+    metrics_server = HttpServer()
+    metrics_server.route("GET", "/metrics", handle_metrics)
+    try:
+        await metrics_server.start(METRICS_LISTEN, METRICS_PORT)
+    except OSError as e:
+        logger.warning(f"⚠️ تعذر تشغيل نقطة /metrics: {e}")
+        metrics_server = None
+
+async def stop_metrics_server(application: Application):
+    if metrics_server is not None:
+        await metrics_server.stop()
+
 # ----------------- التشغيل الرئيسي -----------------
 def main():
     """الدالة الرئيسية"""
@@ -657,14 +3995,42 @@ def main():
     print("🎬 بدء تشغيل بوت عرب سيد Telegram")
     print("=" * 50)
     
+    global worker_pool
+    
+    if BOT_MODE == "webhook" and not WEBHOOK_SECRET:
+        print("❌ وضع webhook يتطلب ARABSEED_WEBHOOK_SECRET، لن يتم التشغيل")
+        logger.error("وضع webhook بدون ARABSEED_WEBHOOK_SECRET: رفض التشغيل")
+        return
+    
     try:
+        if WORKER_PROCESSES > 0:
+            worker_pool = ProcessWorkerPool(WORKER_PROCESSES)
+            worker_pool.start()
+        
+        # فتح قواعد البيانات هنا (وليس عند الاستيراد) حتى لا تفتحها عمليات المعالجة
+        session_store.open()
+        link_cache.open()
+        series_index.open()
+        
         # إنشاء التطبيق
-        application = Application.builder().token(TOKEN).build()
+        # تفعيل المعالجة المتوازية للتحديثات حتى لا ينتظر /start انتهاء معالجة رابط
+        application = (
+            Application.builder()
+            .token(TOKEN)
+            .concurrent_updates(CONCURRENT_UPDATES)
+            .rate_limiter(send_scheduler)
+            .post_init(start_metrics_server)
+            .post_shutdown(stop_metrics_server)
+            .build()
+        )
         
         # إضافة المعالجات
         application.add_handler(CommandHandler("start", start_command))
         application.add_handler(CommandHandler("help", help_command))
         application.add_handler(CommandHandler("status", status_command))
+        application.add_handler(CommandHandler("season", season_command))
+        application.add_handler(CommandHandler("search", search_command))
+        application.add_handler(CommandHandler("latest", latest_command))
         application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
         application.add_handler(CallbackQueryHandler(handle_callback))
         
@@ -676,11 +4042,25 @@ def main():
         print("📱 افتح Telegram وابحث عن البوت")
         print("⚡ أرسل /start للبدء")
         
-        application.run_polling(
-            allowed_updates=Update.ALL_TYPES,
-            drop_pending_updates=True,
-            close_loop=False
-        )
+        if BOT_MODE == "webhook":
+            webhook = WebhookServer(application, WEBHOOK_PATH, WEBHOOK_SECRET)
+            asyncio.run(webhook.run(WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_URL, DRAIN_TIMEOUT))
+        else:
+            application.run_polling(
+                allowed_updates=Update.ALL_TYPES,
+                drop_pending_updates=True,
+                close_loop=False
+            )
+        
+        resolve_executor.shutdown(wait=False, cancel_futures=True)
+        server_executor.shutdown(wait=False, cancel_futures=True)
+        prefetch_executor.shutdown(wait=False, cancel_futures=True)
+        prefetch_server_executor.shutdown(wait=False, cancel_futures=True)
+        if worker_pool is not None:
+            worker_pool.shutdown()
+        mirror_registry.save()
+        session_store.save_all()
+        link_cache.close()
         
     except Exception as e:
         print(f"❌ فشل تشغيل البوت: {e}")
@@ -0,0 +1,49 @@
+# test_breaker.py - مهلة قصّرها الموعد النهائي لا تحسب إخفاقاً على المضيف
+import os
+import sys
+import time
+import unittest
+from unittest import mock
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot
+
+URL = "https://cdn.example/page"
+HOST = "cdn.example"
+
+def timing_out_get(url, timeout=None, **kwargs):
+    time.sleep(timeout)
+    raise requests.exceptions.ReadTimeout(f"Read timed out. (read timeout={timeout})")
+
+def refused_get(url, timeout=None, **kwargs):
+    raise requests.exceptions.ConnectionError("Connection refused")
+
+class DeadlineTimeoutTest(unittest.TestCase):
+    def setUp(self):
+        self.breaker = bot.CircuitBreaker(threshold=1, cooldown=60)
+        patcher = mock.patch.object(bot, "host_breaker", self.breaker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def request_with_deadline(self, get, budget):
+        token = bot._resolution_deadline.set(time.monotonic() + budget)
+        try:
+            with mock.patch.object(bot.http_client, "get", get):
+                return bot.make_request(URL, max_retries=1, timeout=20)
+        finally:
+            bot._resolution_deadline.reset(token)
+
+    def test_timeout_cut_short_by_deadline_is_not_a_host_failure(self):
+        self.assertIsNone(self.request_with_deadline(timing_out_get, 0.2))
+        self.assertTrue(self.breaker.allow(HOST))
+        self.assertEqual(self.breaker.open_hosts(), [])
+
+    def test_real_host_errors_still_open_the_breaker(self):
+        self.assertIsNone(self.request_with_deadline(refused_get, 5))
+        self.assertEqual(self.breaker.open_hosts(), [HOST])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+# test_cache_keys.py - توحيد مفاتيح كاش الحلقات بين المرايا المعتمدة فقط، وطبقة SQLite خارج حلقة الأحداث
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot
+
+EPISODE_PATH = "/مسلسل-العنكبوت-الحلقة-1"
+
+class NormalizeEpisodeUrlTest(unittest.TestCase):
+    def test_known_mirrors_share_one_key(self):
+        keys = {
+            bot.normalize_episode_url(f"https://{mirror}{EPISODE_PATH}.html")
+            for mirror in bot.KNOWN_MIRRORS
+        }
+        keys.add(bot.normalize_episode_url(f"https://www.arabseed.top{EPISODE_PATH}/"))
+        self.assertEqual(len(keys), 1)
+
+    def test_encoding_and_suffix_are_ignored(self):
+        plain = bot.normalize_episode_url(f"https://arabseed.top{EPISODE_PATH}")
+        encoded = bot.normalize_episode_url("https://arabseed.top" + bot.quote(EPISODE_PATH) + ".php")
+        double = bot.normalize_episode_url("https://arabseed.top" + bot.quote(bot.quote(EPISODE_PATH)))
+        self.assertEqual(plain, encoded)
+        self.assertEqual(plain, double)
+
+    def test_unknown_arabseed_host_keeps_its_own_key(self):
+        real = bot.normalize_episode_url(f"https://arabseed.top{EPISODE_PATH}.html")
+        spoofed = bot.normalize_episode_url(f"https://arabseed.evil.example{EPISODE_PATH}")
+        self.assertNotEqual(real, spoofed)
+        self.assertTrue(spoofed.startswith("arabseed.evil.example/"))
+
+class ResultCacheDiskTest(unittest.IsolatedAsyncioTestCase):
+    async def test_sqlite_runs_off_the_event_loop_and_survives_restart(self):
+        loop_thread = threading.get_ident()
+        sqlite_threads = set()
+        real_connect = bot.sqlite3.connect
+
+        class TracingConnection:
+            def __init__(self, *args, **kwargs):
+                self._conn = real_connect(*args, **kwargs)
+
+            def execute(self, sql, *args):
+                if "results" in sql and not sql.startswith(("CREATE", "DELETE")):
+                    sqlite_threads.add(threading.get_ident())
+                return self._conn.execute(sql, *args)
+
+            def commit(self):
+                return self._conn.commit()
+
+        value = (True, "العنكبوت 1", [[{"text": "📥 1080p", "url": "https://cdn.example/1.mp4"}]])
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "cache.db")
+            with mock.patch.object(bot.sqlite3, "connect", TracingConnection):
+                cache = bot.ResultCache(16, 60, 60, path)
+                cache.open()
+                cache.set("arabseed/مسلسل-العنكبوت-الحلقة-1", value)
+                cache.close()
+
+                restarted = bot.ResultCache(16, 60, 60, path)
+                restarted.open()
+                self.assertEqual(await restarted.get("arabseed/مسلسل-العنكبوت-الحلقة-1"), value)
+                self.assertIsNone(await restarted.get("arabseed/غير-موجود"))
+                restarted.close()
+
+        self.assertEqual(restarted.disk_hits, 1)
+        self.assertEqual(restarted.misses, 1)
+        self.assertTrue(sqlite_threads)
+        self.assertNotIn(loop_thread, sqlite_threads)
+
+if __name__ == "__main__":
+    unittest.main()
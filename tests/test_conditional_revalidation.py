@@ -0,0 +1,62 @@
+# test_conditional_revalidation.py - إعادة استخدام تحليل الصفحة عند 304 أو عند عدم تغير المحتوى
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot
+import bench
+
+class EpisodeRevalidationTest(unittest.TestCase):
+    def setUp(self):
+        self.server = bench.FixtureServer()
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        patcher = mock.patch.object(bot, "page_validators", bot.PageValidators(16))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def discover(self):
+        with mock.patch.object(bot, "extract_server_links", wraps=bot.extract_server_links) as parse:
+            result = bot.discover_server_links(self.server.episode_url(1))
+        return result, parse.call_count
+
+    def test_not_modified_page_skips_parsing(self):
+        first, first_parses = self.discover()
+        self.server.reset_stats()
+        second, second_parses = self.discover()
+
+        self.assertIsNone(first[0])
+        self.assertTrue(first[1])
+        self.assertEqual(second, first)
+        self.assertEqual((first_parses, second_parses), (1, 0))
+        self.assertEqual(self.server.status_counts, {304: 1})
+
+class PageValidatorsTest(unittest.TestCase):
+    def response(self, status, body=b"", headers=None):
+        response = bot.requests.Response()
+        response.status_code = status
+        response._content = body
+        response.headers.update(headers or {})
+        return response
+
+    def test_reuse_by_status_and_body_hash(self):
+        validators = bot.PageValidators(4)
+        url = "https://arabseed.top/مسلسل-العنكبوت-الحلقة-1"
+        self.assertIsNone(validators.reuse("episode", validators.lookup(url), self.response(200, b"v1")))
+        validators.store(url, self.response(200, b"v1", {"ETag": '"abc"', "Last-Modified": "Sat, 17 Oct 2026 10:00:00 GMT"}),
+                         ["links"], 0.01)
+
+        entry = validators.lookup(url)
+        self.assertEqual(validators.conditional_headers(entry), {
+            "If-None-Match": '"abc"', "If-Modified-Since": "Sat, 17 Oct 2026 10:00:00 GMT",
+        })
+        self.assertEqual(validators.reuse("episode", entry, self.response(304)), ["links"])
+        # خادم يتجاهل الطلب الشرطي لكن المحتوى نفسه
+        self.assertEqual(validators.reuse("episode", entry, self.response(200, b"v1")), ["links"])
+        self.assertIsNone(validators.reuse("episode", entry, self.response(200, b"v2")))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,28 @@
+# test_episode_urls.py - التأكد من قبول روابط الحلقات بلاحقة .html أو .php في /season
+import os
+import sys
+import unittest
+from urllib.parse import unquote
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot
+
+class EpisodeUrlTest(unittest.TestCase):
+    def test_html_suffix_keeps_episode_number(self):
+        url = "https://arabseed.cam/مسلسل-العنكبوت-الحلقة-1.html"
+        number, build = bot.extract_episode_and_base(url)
+        self.assertEqual(number, 1)
+        self.assertEqual(unquote(build(2)), "https://arabseed.cam/مسلسل-العنكبوت-الحلقة-2.html")
+
+    def test_php_and_plain_links(self):
+        number, build = bot.extract_episode_and_base("https://arabseed.top/مسلسل-اختبار-الحلقة-12.php")
+        self.assertEqual(number, 12)
+        self.assertTrue(unquote(build(13)).endswith("-الحلقة-13.php"))
+
+        number, build = bot.extract_episode_and_base("https://arabseed.top/مسلسل-اختبار-الحلقة-7/")
+        self.assertEqual(number, 7)
+        self.assertEqual(unquote(build(8)), "https://arabseed.top/مسلسل-اختبار-الحلقة-8")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+# test_extraction_golden.py - مطابقة محرك الأنماط مع الأنماط القديمة (golden) على الصفحات المسجلة
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot
+import bench
+
+# حالات إضافية تختبر ترتيب الأولويات (نمط أقل أولوية يظهر أولاً في النص)
+GOLDEN_EXTRA_PAGES = [
+    '<a href="/go/downloadz/x">x</a> https://a.example/category/downloadz/?r=5&q=1',
+    "<script>window.location = '/next';</script> <a href='https://b.example/page?r=77'>b</a>",
+    '<script>var p = {url: "https://c.example/v.mp4", file: "https://c.example/f.mp4"};</script>',
+    '<script>jwplayer().setup({src: "https://d.example/stream.m3u8"});</script>',
+    '<p>لا يوجد رابط هنا</p>',
+    '<a data-x=http://x.example/go?href="/files/downloadz/9">x</a> <a href="DOWNLOADZ/1">y</a>',
+    "<script>window.location='https://e.example/w';</script> <a href=\"https://e.example/a/downloadz\">z</a>",
+]
+
+def golden_pages():
+    pages = {
+        name: bench.load_fixture(name)
+        for name in sorted(os.listdir(bench.FIXTURES_DIR)) if name.endswith(".html")
+    }
+    for i, html in enumerate(GOLDEN_EXTRA_PAGES):
+        pages[f"extra_{i}"] = html
+    return pages
+
+class ExtractionGoldenTest(unittest.TestCase):
+    def test_fixtures_are_present(self):
+        self.assertTrue(any(name.endswith(".html") for name in os.listdir(bench.FIXTURES_DIR)))
+
+    def test_r_link_matches_legacy_patterns(self):
+        for name, html in golden_pages().items():
+            with self.subTest(page=name):
+                self.assertEqual(bench.engine_r_link(html), bench.legacy_r_link(html))
+
+    def test_script_links_match_legacy_patterns(self):
+        for name, html in golden_pages().items():
+            for script in bot.parse_page(html).scripts:
+                with self.subTest(page=name, script=script[:60]):
+                    self.assertEqual(bench.engine_script_link(script), bench.legacy_script_link(script))
+
+if __name__ == "__main__":
+    unittest.main()
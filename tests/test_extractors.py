@@ -0,0 +1,81 @@
+# test_extractors.py - تقديم المستخرج الفائز لكل مضيف، وإلغاء التقديم من عدة خيوط دون أخطاء
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot
+
+HOST = "cdn.example"
+OTHER_HOST = "files.example"
+PROMOTE_AFTER = 3
+
+def make_registry(calls):
+    registry = bot.ExtractorRegistry(PROMOTE_AFTER)
+
+    @registry.register("anchor")
+    def anchor(page, base_url):
+        calls.append("anchor")
+        return "https://cdn.example/anchor.mp4" if base_url == "anchor" else None
+
+    @registry.register("script")
+    def script(page, base_url):
+        calls.append("script")
+        return "https://cdn.example/script.mp4" if base_url in ("script", "anchor") else None
+
+    return registry
+
+class ExtractorPromotionTest(unittest.TestCase):
+    def test_winner_is_promoted_per_host_and_demoted_on_failure(self):
+        calls = []
+        registry = make_registry(calls)
+        page = bot.parse_page("<html></html>")
+
+        for _ in range(PROMOTE_AFTER):
+            self.assertEqual(registry.extract("", page, "script", HOST)[0], "script")
+        self.assertEqual(registry.promoted(), {HOST: "script"})
+        self.assertEqual([name for name, _, _ in registry._order_for(HOST)[0]], ["script", "anchor"])
+        self.assertEqual([name for name, _, _ in registry._order_for(OTHER_HOST)[0]], ["anchor", "script"])
+
+        # بعد التقديم يُجرب الفائز أولاً دون المرور على ما قبله
+        calls.clear()
+        self.assertEqual(registry.extract("", page, "script", HOST)[0], "script")
+        self.assertEqual(calls, ["script"])
+
+        # المُقدَّم لم يفز: يُلغى تقديمه ويعود الترتيب الأصلي
+        self.assertEqual(registry.extract("", page, "none", HOST), None)
+        self.assertEqual(registry.promoted(), {})
+        self.assertEqual([name for name, _, _ in registry._order_for(HOST)[0]], ["anchor", "script"])
+
+    def test_host_extractors_match_domains_only(self):
+        registry = bot.ExtractorRegistry(PROMOTE_AFTER)
+        registry.register("arabseed_download", hosts=("arabseed.top",))(bot.extract_arabseed_download_link)
+        html = '<a class="btn download-btn" href="/get/1.mp4">تحميل</a>'
+        page = bot.parse_page(html)
+        self.assertEqual(registry.extract(html, page, "https://arabseed.top", "arabseed.top"),
+                         ("arabseed_download", "https://arabseed.top/get/1.mp4"))
+        self.assertIsNone(registry.extract(html, page, "https://arabseed.top", "arabseed.top.evil.example"))
+
+    def test_concurrent_demotion_does_not_raise(self):
+        registry = make_registry([])
+        page = bot.parse_page("<html></html>")
+        errors = []
+
+        def worker(outcomes):
+            try:
+                for outcome in outcomes * 200:
+                    registry.extract("", page, outcome, HOST)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(["script"] * PROMOTE_AFTER + ["none"],)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+if __name__ == "__main__":
+    unittest.main()
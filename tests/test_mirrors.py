@@ -0,0 +1,50 @@
+# test_mirrors.py - ترتيب المرايا المعتمدة فقط وتجربة نطاق المستخدم غير المعتمد لطلبه وحده
+import os
+import sys
+import json
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot
+
+MIRRORS = ["arabseed.top", "arabseed.cam", "arabseed.ink"]
+EPISODE_PATH = "/مسلسل-العنكبوت-الحلقة-1.html"
+
+class MirrorRegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "mirrors.json")
+        self.registry = bot.MirrorRegistry(MIRRORS, self.path, save_interval=0)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_unknown_domain_is_never_ranked_or_saved(self):
+        for _ in range(3):
+            self.registry.record("arabseed.evil.example", True, 0.01)
+        self.registry.record("arabseed.top", True, 0.5)
+        self.registry.save()
+
+        self.assertNotIn("arabseed.evil.example", self.registry.ranked())
+        candidates = self.registry.candidate_urls("https://arabseed.top" + EPISODE_PATH)
+        self.assertTrue(all("evil" not in candidate for candidate in candidates))
+        with open(self.path, encoding='utf-8') as f:
+            self.assertNotIn("arabseed.evil.example", json.load(f))
+
+    def test_unknown_user_domain_is_tried_for_its_own_request(self):
+        url = "https://arabseed.new" + EPISODE_PATH
+        candidates = self.registry.candidate_urls(url)
+        self.assertEqual(candidates[-1], url)
+        self.assertNotIn("arabseed.new", self.registry.ranked())
+
+    def test_saved_unknown_domains_are_not_loaded(self):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({"arabseed.evil.example": {"successes": 100, "failures": 0,
+                                                 "consecutive_failures": 0, "latency": 0.01}}, f)
+        registry = bot.MirrorRegistry(MIRRORS, self.path, save_interval=0)
+        self.assertEqual(sorted(registry.ranked()), sorted(MIRRORS))
+
+if __name__ == "__main__":
+    unittest.main()
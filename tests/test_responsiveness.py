@@ -0,0 +1,70 @@
+# test_responsiveness.py - التأكد من أن معالجة رابط جارية لا تؤخر ردود الأوامر الأخرى
+import os
+import sys
+import time
+import asyncio
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot
+
+# مدة المعالجة الوهمية، وعدد أوامر /start المتزامنة، وأقصى زمن مقبول للرد
+RESOLUTION_SECONDS = 2.0
+START_USERS = 50
+MAX_REPLY_SECONDS = 0.25
+
+class FakeMessage:
+    def __init__(self, text: str = ""):
+        self.text = text
+        self.replies = []
+        self.edits = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append((time.monotonic(), text))
+        return FakeMessage(text)
+
+    async def edit_text(self, text, **kwargs):
+        self.edits.append((time.monotonic(), text))
+        return self
+
+def fake_update(user_id: int, text: str = "/start") -> SimpleNamespace:
+    message = FakeMessage(text)
+    user = SimpleNamespace(id=user_id, first_name=f"user{user_id}")
+    return SimpleNamespace(effective_user=user, message=message, effective_message=message)
+
+def blocking_discovery(url):
+    """بديل discover_server_links يحجب الخيط كما تفعل requests و time.sleep"""
+    time.sleep(RESOLUTION_SECONDS)
+    return "❌ الحلقة غير موجودة أو الرابط غير صحيح", [], url
+
+def blocking_resolution(url):
+    time.sleep(RESOLUTION_SECONDS)
+    return False, "❌ الحلقة غير موجودة أو الرابط غير صحيح", []
+
+class StartWhileResolvingTest(unittest.IsolatedAsyncioTestCase):
+    async def test_start_replies_not_delayed_by_resolution(self):
+        context = SimpleNamespace(args=[])
+        url = "https://arabseed.example/مسلسل-اختبار-التزامن-الحلقة-1"
+
+        with mock.patch.object(bot, "discover_server_links", blocking_discovery), \
+                mock.patch.object(bot, "process_arabseed_url", blocking_resolution):
+            resolving = asyncio.ensure_future(bot.handle_message(fake_update(1, url), context))
+            # ننتظر حتى تبدأ المعالجة فعلاً في مجموعة الخيوط
+            await asyncio.sleep(0.1)
+            self.assertFalse(resolving.done())
+
+            updates = [fake_update(1000 + i) for i in range(START_USERS)]
+            started = time.monotonic()
+            await asyncio.gather(*(bot.start_command(update, context) for update in updates))
+            latencies = [update.message.replies[0][0] - started for update in updates]
+
+            # كل الردود وصلت بينما المعالجة ما زالت جارية
+            self.assertFalse(resolving.done())
+            self.assertLess(max(latencies), MAX_REPLY_SECONDS)
+            await resolving
+
+if __name__ == "__main__":
+    unittest.main()
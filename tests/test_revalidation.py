@@ -0,0 +1,54 @@
+# test_revalidation.py - إعادة فحص روابط الكاش بنفس الـ Referer ومرة واحدة للطلبات المتزامنة
+import os
+import sys
+import time
+import asyncio
+import threading
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot
+
+URL = "https://arabseed.top/مسلسل-العنكبوت-الحلقة-2.html"
+REFERER = "https://arabseed.top/"
+CONCURRENT_HITS = 10
+
+def cached_result():
+    return (True, "العنكبوت 2", [
+        [{"text": "📥 1080p", "url": "https://cdn.example/1080.mp4", "referer": REFERER}],
+        [{"text": "📥 720p", "url": "https://cdn.example/720.mp4", "referer": REFERER}],
+    ])
+
+class RevalidateCachedTest(unittest.IsolatedAsyncioTestCase):
+    async def test_cached_links_are_probed_once_with_their_referer(self):
+        calls = []
+        calls_lock = threading.Lock()
+
+        def fake_probe(url, referer=None):
+            with calls_lock:
+                calls.append((url, referer))
+            time.sleep(0.1)
+            # مضيف يرفض الطلب بدون Referer كما يفعل مع HEAD و Range
+            alive = referer == REFERER
+            return {"alive": alive, "status": 200 if alive else 403, "size": None, "content_type": ""}
+
+        async def unexpected_resolution(*args, **kwargs):
+            raise AssertionError("cached result should not be resolved again")
+
+        cache = bot.ResultCache(16, 60, 60)
+        key = bot.normalize_episode_url(URL)
+        cache.set(key, cached_result())
+        with mock.patch.object(bot, "link_cache", cache), \
+                mock.patch.object(bot, "VERIFY_LINKS", True), \
+                mock.patch.object(bot, "probe_direct_link", fake_probe), \
+                mock.patch.object(bot, "process_arabseed_url_async", unexpected_resolution):
+            results = await asyncio.gather(*(bot.resolve_episode(URL) for _ in range(CONCURRENT_HITS)))
+
+        self.assertEqual(sorted(calls), sorted((row[0]["url"], REFERER) for row in cached_result()[2]))
+        for result in results:
+            self.assertEqual(result, cached_result())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+# test_season.py - إلغاء الموسم يوقف الحلقات المنتظرة، وعنوان الموسم يُعرض بأمان
+import os
+import sys
+import asyncio
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot
+
+EPISODES = 5
+
+class FakeEditor:
+    def __init__(self):
+        self.edits = []
+
+    async def edit(self, text, reply_markup=None, force=False):
+        self.edits.append(text)
+
+class SeasonCancelTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.started = []
+        self.release = threading.Event()
+        # خيط واحد: الحلقة الأولى تعمل والباقي في طابور المنفذ
+        self.pool = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(self.pool.shutdown, wait=False)
+        self.addCleanup(self.release.set)
+
+        def blocking(url):
+            self.started.append(url)
+            self.release.wait(5)
+            return True, "العنكبوت", []
+
+        async def fake_resolution(url, executor=None, background=False):
+            return await asyncio.get_running_loop().run_in_executor(self.pool, blocking, url)
+
+        for target, value in (
+            ("link_cache", bot.ResultCache(16, 60, 60)),
+            ("series_index", bot.SeriesIndex()),
+            ("resolution_flight", bot.SingleFlight()),
+            ("process_arabseed_url_async", fake_resolution),
+            ("SEASON_CONCURRENCY", EPISODES),
+        ):
+            patcher = mock.patch.object(bot, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def test_cancel_drops_queued_episodes(self):
+        episode_urls = {ep: f"https://arabseed.top/مسلسل-العنكبوت-الحلقة-{ep}" for ep in range(1, EPISODES + 1)}
+        session = SimpleNamespace(batch_task=None)
+        editor = FakeEditor()
+        task = asyncio.ensure_future(bot.run_season(session, editor, "العنكبوت", episode_urls))
+        session.batch_task = task
+        await asyncio.sleep(0.1)
+        self.assertEqual(len(self.started), 1)
+        self.assertEqual(len(bot.resolution_flight), EPISODES)
+
+        task.cancel()
+        await task
+        self.release.set()
+        await asyncio.sleep(0.2)
+
+        # الحلقات التي لم تبدأ سقطت من طابور المنفذ ولم تُنفذ
+        self.assertEqual(len(self.started), 1)
+        self.assertEqual(len(bot.resolution_flight), 0)
+        self.assertIn("⛔", editor.edits[-1])
+        self.assertIsNone(session.batch_task)
+
+    async def test_shared_episode_survives_while_another_waiter_remains(self):
+        url = "https://arabseed.top/مسلسل-العنكبوت-الحلقة-1"
+        season = asyncio.ensure_future(bot.resolve_episode(url))
+        single = asyncio.ensure_future(bot.resolve_episode(url))
+        await asyncio.sleep(0.1)
+        season.cancel()
+        await asyncio.sleep(0.05)
+        self.release.set()
+        self.assertEqual(await single, (True, "العنكبوت", []))
+        self.assertEqual(len(self.started), 1)
+
+class SeasonRenderTest(unittest.TestCase):
+    def test_title_from_url_is_escaped(self):
+        title = "a_b*c [d] `e` <f> & g"
+        text, _ = bot.render_season_progress(title, [1, 2], {}, running=True)
+        self.assertIn("<b>a_b*c [d] `e` &lt;f&gt; &amp; g</b>", text)
+
+if __name__ == "__main__":
+    unittest.main()
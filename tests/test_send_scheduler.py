@@ -0,0 +1,84 @@
+# test_send_scheduler.py - دمج التعديلات المتتالية، وإعادة الجدولة بعد RetryAfter، وأولوية الردود التفاعلية
+import os
+import sys
+import time
+import asyncio
+import unittest
+
+from telegram.error import RetryAfter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot
+
+CHAT_ID = 1001
+
+class SendSchedulerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.sent = []
+
+    async def asyncTearDown(self):
+        await self.scheduler.shutdown()
+
+    async def start(self, global_spec="30:30", chat_spec="1:1", max_retries=2):
+        self.scheduler = bot.SendScheduler(global_spec, chat_spec, "0.33:3", max_retries)
+        await self.scheduler.initialize()
+
+    def request(self, endpoint, text, priority=None, message_id=7, fail_with=None):
+        async def callback():
+            if fail_with:
+                error = fail_with.pop(0)
+                if error is not None:
+                    raise error
+            self.sent.append((endpoint, text, time.monotonic()))
+            return text
+
+        data = {"chat_id": CHAT_ID, "text": text}
+        if endpoint.startswith("edit"):
+            data["message_id"] = message_id
+        rate_limit_args = {"priority": priority} if priority is not None else None
+        return self.scheduler.process_request(callback, (), {}, endpoint, data, rate_limit_args)
+
+    async def test_consecutive_edits_of_one_message_are_merged(self):
+        await self.start()
+        # الأول يأخذ رمز المحادثة، والباقي ينتظرون دورهم ويُستبدلون بالأحدث
+        first = await self.request("editMessageText", "1/5")
+        results = await asyncio.gather(*(self.request("editMessageText", f"{i}/5") for i in range(2, 6)))
+
+        self.assertEqual(first, "1/5")
+        self.assertEqual([text for _, text, _ in self.sent], ["1/5", "5/5"])
+        self.assertEqual(results, ["5/5"] * 4)
+        self.assertEqual(self.scheduler.merged, 3)
+
+    async def test_retry_after_is_rescheduled_instead_of_raised(self):
+        await self.start(chat_spec="30:30")
+        started = time.monotonic()
+        result = await self.request("sendMessage", "مرحبا", fail_with=[RetryAfter(1), None])
+
+        self.assertEqual(result, "مرحبا")
+        self.assertEqual(self.scheduler.retry_after, 1)
+        self.assertGreaterEqual(self.sent[0][2] - started, 1.0)
+
+    async def test_retry_after_gives_up_after_max_retries(self):
+        await self.start(chat_spec="30:30", max_retries=1)
+        with self.assertRaises(RetryAfter):
+            await self.request("sendMessage", "مرحبا", fail_with=[RetryAfter(0), RetryAfter(0)])
+        self.assertEqual(self.sent, [])
+
+    async def test_interactive_replies_go_before_progress_edits(self):
+        await self.start(global_spec="2:1", chat_spec="30:30")
+        # نستهلك رمز الحد الكلي حتى تصطف الطلبات التالية
+        await self.request("sendMessage", "first")
+        progress = [
+            asyncio.ensure_future(self.request("editMessageText", f"progress {i}", bot.SEND_PROGRESS, message_id=i))
+            for i in range(3)
+        ]
+        await asyncio.sleep(0)
+        reply = asyncio.ensure_future(self.request("sendMessage", "reply", bot.SEND_INTERACTIVE))
+        await asyncio.gather(reply, *progress)
+
+        order = [text for _, text, _ in self.sent]
+        self.assertEqual(order[:2], ["first", "reply"])
+
+if __name__ == "__main__":
+    unittest.main()
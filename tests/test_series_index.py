@@ -0,0 +1,47 @@
+# test_series_index.py - فهرسة نتائج المرايا المعتمدة فقط، وفتح قاعدة البيانات عند أول استخدام
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot
+
+BUTTONS = [[{"text": "📥 1080p", "url": "https://cdn.example/video.mp4"}]]
+
+class SeriesIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "series_index.db")
+        self.index = bot.SeriesIndex(self.path)
+
+    def tearDown(self):
+        if self.index._db is not None:
+            self.index._db.close()
+        self.tmp.cleanup()
+
+    def test_database_is_created_lazily(self):
+        self.assertFalse(os.path.exists(self.path))
+        self.index.stats()
+        self.assertTrue(os.path.exists(self.path))
+
+    def test_only_known_mirrors_are_indexed(self):
+        self.index.record("https://arabseed.evil.example/مسلسل-العنكبوت-الحلقة-9", (True, "فخ", BUTTONS))
+        self.assertEqual(self.index.stats(), {"series": 0, "episodes": 0})
+
+        self.index.record("https://arabseed.top/مسلسل-العنكبوت-الحلقة-3.html", (True, "العنكبوت 3", BUTTONS))
+        matches = self.index.search("العنكبوت")
+        self.assertEqual(len(matches), 1)
+        self.assertEqual(matches[0]["latest_episode"], 3)
+        latest = self.index.latest_episode(matches[0]["id"])
+        self.assertEqual(latest["buttons"], BUTTONS)
+
+    def test_index_persists_across_restarts(self):
+        self.index.record("https://arabseed.cam/مسلسل-العنكبوت-الحلقة-4", (True, "العنكبوت 4", BUTTONS))
+        self.index._db.close()
+        self.index = bot.SeriesIndex(self.path)
+        self.assertEqual(self.index.stats(), {"series": 1, "episodes": 1})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+# test_sessions.py - تحميل الجلسات خارج حلقة الأحداث وبعد أي حفظ معلق لنفس المستخدم
+import os
+import sys
+import time
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot
+
+URL = "https://arabseed.top/مسلسل-العنكبوت-الحلقة-5"
+
+class SessionStoreTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "sessions.db")
+        self.store = bot.SessionStore(idle_ttl=0, history_size=5, sweep_interval=3600, db_path=self.path)
+        self.store.open()
+
+    async def asyncTearDown(self):
+        self.store.save_all()
+        self.store._db.close()
+        self.tmp.cleanup()
+
+    async def test_returning_user_sees_the_pending_write(self):
+        real_write = self.store._write
+        sqlite_threads = set()
+
+        def slow_write(session, row):
+            sqlite_threads.add(threading.get_ident())
+            time.sleep(0.2)
+            real_write(session, row)
+
+        with mock.patch.object(self.store, "_write", slow_write):
+            session = await self.store.get(1)
+            session.last_url, session.last_title = URL, "العنكبوت 5"
+            session.history.append({"url": URL})
+            # الإخراج يضع الحفظ في الطابور، والمستخدم يعود قبل انتهائه
+            self.assertEqual(self.store.sweep(time.monotonic() + 1), 1)
+            started = time.monotonic()
+            returned = await self.store.get(1)
+
+        self.assertIsNot(returned, session)
+        self.assertEqual(returned.last_url, URL)
+        self.assertEqual(list(returned.history), [{"url": URL}])
+        self.assertTrue(returned.stored)
+        self.assertNotIn(threading.get_ident(), sqlite_threads)
+        self.assertGreaterEqual(time.monotonic() - started, 0.1)
+
+    async def test_known_users_counts_saved_and_unsaved_sessions(self):
+        first = await self.store.get(1)
+        first.last_url = URL
+        self.store.save(1, first)
+        await self.store.get(2)
+        # القراءة التالية تنتظر انتهاء الحفظ في نفس الخيط
+        await self.store.get(3)
+        self.assertEqual(self.store.known_users(), 3)
+
+        restarted = bot.SessionStore(idle_ttl=0, history_size=5, sweep_interval=3600, db_path=self.path)
+        restarted.open()
+        self.assertEqual(restarted.known_users(), 1)
+        self.assertEqual((await restarted.get(1)).last_url, URL)
+        restarted.save_all()
+        restarted._db.close()
+
+if __name__ == "__main__":
+    unittest.main()
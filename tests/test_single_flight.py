@@ -0,0 +1,64 @@
+# test_single_flight.py - طلبات متزامنة لنفس الحلقة (من أي مرآة معتمدة) تشترك في معالجة واحدة
+import os
+import sys
+import asyncio
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot
+
+USERS = 20
+RESULT = (True, "العنكبوت 3", [[{"text": "📥 1080p", "url": "https://cdn.example/3.mp4"}]])
+
+class SingleFlightTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.calls = []
+        self.release = asyncio.Event()
+
+        async def fake_resolution(url, executor=None, background=False):
+            self.calls.append(url)
+            await self.release.wait()
+            return RESULT
+
+        for target, value in (
+            ("link_cache", bot.ResultCache(16, 60, 60)),
+            ("series_index", bot.SeriesIndex()),
+            ("resolution_flight", bot.SingleFlight()),
+            ("process_arabseed_url_async", fake_resolution),
+        ):
+            patcher = mock.patch.object(bot, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def test_concurrent_requests_share_one_resolution(self):
+        urls = [
+            f"https://{mirror}/مسلسل-العنكبوت-الحلقة-3{suffix}"
+            for mirror, suffix in zip(sorted(bot.KNOWN_MIRRORS) * USERS, [".html", "", "/"] * USERS)
+        ][:USERS]
+        tasks = [asyncio.ensure_future(bot.resolve_episode(url)) for url in urls]
+        await asyncio.sleep(0.05)
+        self.assertEqual(len(bot.resolution_flight), 1)
+        self.release.set()
+        results = await asyncio.gather(*tasks)
+
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(results, [RESULT] * USERS)
+        self.assertEqual(bot.resolution_flight.coalesced, USERS - 1)
+        # النتيجة في الكاش للطلب التالي
+        self.assertEqual(await bot.resolve_episode(urls[0]), RESULT)
+        self.assertEqual(len(self.calls), 1)
+
+    async def test_cancelled_waiter_does_not_cancel_shared_work(self):
+        url = "https://arabseed.top/مسلسل-العنكبوت-الحلقة-3"
+        first = asyncio.ensure_future(bot.resolve_episode(url))
+        second = asyncio.ensure_future(bot.resolve_episode(url))
+        await asyncio.sleep(0.05)
+        first.cancel()
+        self.release.set()
+        self.assertEqual(await second, RESULT)
+        self.assertEqual(len(self.calls), 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+# test_stages.py - توقيت كل مرحلة تحت اسمها الصحيح (صفحة السيرفر ثم صفحة ?r=)
+import os
+import sys
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot
+import bench
+
+R_PAGE_DELAY = 0.3
+
+class StageTimingTest(unittest.TestCase):
+    def test_server_and_r_pages_are_timed_separately(self):
+        server = bench.FixtureServer()
+        real_route = server.route
+
+        def slow_r_page(path, query):
+            # صفحة ?r= وحدها بطيئة
+            if path.startswith("/category/downloadz/"):
+                time.sleep(R_PAGE_DELAY)
+            return real_route(path, query)
+
+        server.route = slow_r_page
+        server.start()
+        durations = {}
+
+        def capture(stage, started):
+            durations[stage] = time.monotonic() - started
+
+        try:
+            with mock.patch.object(bot, "record_stage", capture), \
+                    mock.patch.object(bot, "VERIFY_LINKS", False):
+                info = bot.get_download_info(f"{server.base}/servers/1?quality=720&ep=1", server.base + "/")
+        finally:
+            server.stop()
+
+        self.assertIsNotNone(info)
+        self.assertEqual(
+            [stage for stage in bot.RESOLUTION_STAGES if stage in durations],
+            ["redirect_probe", "server_page_fetch", "r_page_fetch", "final_parse"]
+        )
+        self.assertGreaterEqual(durations["r_page_fetch"], R_PAGE_DELAY)
+        self.assertLess(durations["server_page_fetch"], R_PAGE_DELAY)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+# test_webhook.py - إعادة إرسال تحديث Telegram مسجل إلى خادم webhook المحلي
+import os
+import sys
+import json
+import asyncio
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot
+from telegram.ext import Application
+
+SECRET = "test-secret"
+PATH = "/telegram"
+
+# تحديث مسجل كما يرسله Telegram لرسالة /start
+RECORDED_UPDATE = {
+    "update_id": 912345678,
+    "message": {
+        "message_id": 42,
+        "date": 1760000000,
+        "from": {"id": 1001, "is_bot": False, "first_name": "Test", "language_code": "ar"},
+        "chat": {"id": 1001, "type": "private", "first_name": "Test"},
+        "text": "/start",
+        "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+    },
+}
+
+async def post(port: int, body: bytes, secret=None):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    headers = [f"POST {PATH} HTTP/1.1", "Host: localhost", "Content-Type: application/json",
+               f"Content-Length: {len(body)}", "Connection: close"]
+    if secret is not None:
+        headers.append(f"X-Telegram-Bot-Api-Secret-Token: {secret}")
+    writer.write(("\r\n".join(headers) + "\r\n\r\n").encode("latin-1") + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    status = int(response.split(b" ", 2)[1])
+    return status, json.loads(response.split(b"\r\n\r\n", 1)[1])
+
+class WebhookReplayTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.application = Application.builder().token("123456:TEST").build()
+        self.webhook = bot.WebhookServer(self.application, PATH, SECRET)
+        await self.webhook.http.start("127.0.0.1", 0)
+        self.port = self.webhook.http._server.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        await self.webhook.http.stop()
+
+    async def test_recorded_update_is_queued(self):
+        status, data = await post(self.port, json.dumps(RECORDED_UPDATE).encode("utf-8"), SECRET)
+        self.assertEqual((status, data), (200, {"ok": True}))
+        update = self.application.update_queue.get_nowait()
+        self.assertEqual(update.update_id, RECORDED_UPDATE["update_id"])
+        self.assertEqual(update.message.text, "/start")
+
+    async def test_wrong_or_missing_secret_is_rejected(self):
+        body = json.dumps(RECORDED_UPDATE).encode("utf-8")
+        self.assertEqual((await post(self.port, body, "wrong"))[0], 403)
+        self.assertEqual((await post(self.port, body))[0], 403)
+        self.assertTrue(self.application.update_queue.empty())
+
+    async def test_empty_update_is_rejected(self):
+        self.assertEqual((await post(self.port, b"null", SECRET))[0], 400)
+        self.assertTrue(self.application.update_queue.empty())
+
+    def test_secret_is_required(self):
+        with self.assertRaises(ValueError):
+            bot.WebhookServer(self.application, PATH, "")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+# test_worker_pool.py - فحص العمليات المتوقفة تحت الحمل، وتقسيم حدود المضيف، واستيراد دون فتح قواعد البيانات
+import os
+import sys
+import time
+import subprocess
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import bot
+
+class DeadProcess:
+    exitcode = -9
+
+    def is_alive(self):
+        return False
+
+class BusyResults:
+    """طابور نتائج لا يفرغ أبداً (حمل مستمر)"""
+
+    def get(self, timeout=None):
+        time.sleep(0.01)
+        return ("start", 0, 1, None)
+
+class WorkerLivenessTest(unittest.TestCase):
+    def test_dead_worker_is_restarted_under_steady_load(self):
+        pool = bot.ProcessWorkerPool(2)
+        pool._results = BusyResults()
+        pool._workers = {0: DeadProcess()}
+        pool._running = {0: 7}
+        lost = bot.Future()
+        pool._pending = {7: lost}
+        respawned = threading.Event()
+
+        def fake_spawn(worker_id):
+            pool._workers[worker_id] = mock.Mock(is_alive=lambda: True)
+            respawned.set()
+
+        with mock.patch.object(pool, "_spawn", fake_spawn):
+            collector = threading.Thread(target=pool._collect, daemon=True)
+            collector.start()
+            try:
+                self.assertTrue(respawned.wait(pool.CHECK_INTERVAL * 3))
+            finally:
+                pool._closed = True
+                collector.join(2)
+        self.assertEqual(pool.restarts, 1)
+        self.assertFalse(lost.result()[0])
+
+class HostConcurrencyShareTest(unittest.TestCase):
+    def tearDown(self):
+        bot.scale_host_concurrency(1.0)
+
+    def test_host_semaphores_are_divided_between_processes(self):
+        bot.scale_host_concurrency(1.0 / 4)
+        semaphore = bot.get_host_semaphore("cdn.example")
+        self.assertEqual(semaphore._value, max(bot.PER_HOST_CONCURRENCY // 4, 1))
+        background = bot.get_host_semaphore("cdn.example", background=True)
+        self.assertEqual(background._value, max(bot.PREFETCH_HOST_CONCURRENCY // 4, 1))
+
+class ImportSideEffectsTest(unittest.TestCase):
+    def test_import_opens_no_databases(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ)
+            env.update({
+                "ARABSEED_SESSION_DB": os.path.join(tmp, "sessions.db"),
+                "ARABSEED_CACHE_DB": os.path.join(tmp, "cache.db"),
+                "ARABSEED_INDEX_DB": os.path.join(tmp, "series_index.db"),
+                "ARABSEED_MIRRORS_FILE": "",
+            })
+            subprocess.run([sys.executable, "-c", "import bot"], cwd=ROOT, env=env, check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=60)
+            self.assertEqual(os.listdir(tmp), [])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,147 @@
+# trace_report.py - تلخيص سجل التتبع (ARABSEED_TRACE_LOG) لتحليل الأداء دون اتصال
+import sys
+import json
+import argparse
+from collections import defaultdict
+from typing import Dict, List, Optional, Iterator
+
+# ----------------- قراءة السجل -----------------
+def read_events(paths: List[str]) -> Iterator[Dict]:
+    """قراءة أحداث JSON lines مع تجاهل السطور التالفة (مثل سطر مقطوع عند الإيقاف)"""
+    for path in paths:
+        stream = sys.stdin if path == "-" else open(path, encoding="utf-8")
+        try:
+            for line in stream:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """النسبة المئوية بطريقة أقرب رتبة"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+def latency_summary(values: List[float]) -> Dict:
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values), 1) if values else None,
+        "p50_ms": percentile(values, 50),
+        "p95_ms": percentile(values, 95),
+        "max_ms": max(values) if values else None,
+    }
+
+# ----------------- التجميع -----------------
+def aggregate(events: Iterator[Dict], top: int) -> Dict:
+    host_latencies: Dict[str, List[float]] = defaultdict(list)
+    host_errors: Dict[str, int] = defaultdict(int)
+    host_bytes: Dict[str, int] = defaultdict(int)
+    stage_latencies: Dict[str, List[float]] = defaultdict(list)
+    patterns: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    traces = set()
+    resolutions = 0
+    successes = 0
+
+    for event in events:
+        kind = event.get("event")
+        traces.add(event.get("trace"))
+        if kind == "fetch":
+            host = event.get("host") or "?"
+            host_latencies[host].append(event.get("duration_ms") or 0.0)
+            host_bytes[host] += event.get("bytes") or 0
+            status = event.get("status")
+            if event.get("error") or status is None or status >= 400:
+                host_errors[host] += 1
+        elif kind == "stage":
+            stage_latencies[event.get("stage") or "?"].append(event.get("duration_ms") or 0.0)
+        elif kind == "match":
+            patterns[event.get("step") or "?"][event.get("pattern") or "none"] += 1
+        elif kind == "resolution_end":
+            resolutions += 1
+            successes += bool(event.get("success"))
+
+    hosts = []
+    for host, latencies in host_latencies.items():
+        summary = latency_summary(latencies)
+        summary.update({
+            "host": host,
+            "error_rate": round(host_errors[host] / len(latencies), 4),
+            "bytes": host_bytes[host],
+        })
+        hosts.append(summary)
+    # الأبطأ أولاً حسب p95
+    hosts.sort(key=lambda item: item["p95_ms"] or 0.0, reverse=True)
+
+    pattern_rates = {}
+    for step, counts in patterns.items():
+        total = sum(counts.values())
+        pattern_rates[step] = {
+            name: {"count": count, "rate": round(count / total, 4)}
+            for name, count in sorted(counts.items(), key=lambda item: item[1], reverse=True)
+        }
+
+    return {
+        "traces": len(traces - {None, "-"}),
+        "resolutions": resolutions,
+        "success_rate": round(successes / resolutions, 4) if resolutions else None,
+        "slowest_hosts": hosts[:top],
+        "pattern_hit_rates": pattern_rates,
+        "stage_latency": {stage: latency_summary(values) for stage, values in sorted(stage_latencies.items())},
+    }
+
+# ----------------- العرض -----------------
+def format_ms(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.0f}"
+
+def render_text(report: Dict) -> str:
+    lines = [
+        f"المعالجات: {report['resolutions']} • نسبة النجاح: {report['success_rate']} • معرفات التتبع: {report['traces']}",
+        "",
+        "أبطأ المضيفين (ms):",
+    ]
+    for item in report["slowest_hosts"]:
+        lines.append(
+            f"  {item['host']:<40} n={item['count']:<6} p50={format_ms(item['p50_ms']):>6} "
+            f"p95={format_ms(item['p95_ms']):>6} max={format_ms(item['max_ms']):>6} أخطاء={item['error_rate']:.1%}"
+        )
+    lines.append("")
+    lines.append("نسب الأنماط المطابقة:")
+    for step, counts in report["pattern_hit_rates"].items():
+        lines.append(f"  {step}:")
+        for name, item in counts.items():
+            lines.append(f"    {name:<20} {item['count']:<6} {item['rate']:.1%}")
+    lines.append("")
+    lines.append("زمن المراحل (ms):")
+    for stage, item in report["stage_latency"].items():
+        lines.append(
+            f"  {stage:<18} n={item['count']:<6} mean={format_ms(item['mean_ms']):>6} "
+            f"p50={format_ms(item['p50_ms']):>6} p95={format_ms(item['p95_ms']):>6}"
+        )
+    return "\n".join(lines)
+
+# ----------------- التشغيل -----------------
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="تلخيص سجل تتبع بوت عرب سيد")
+    parser.add_argument("paths", nargs="+", help="ملفات السجل (- للقراءة من stdin)")
+    parser.add_argument("--top", type=int, default=10, help="عدد المضيفين في قائمة الأبطأ")
+    parser.add_argument("--json", action="store_true", help="إخراج التقرير بصيغة JSON")
+    args = parser.parse_args(argv)
+
+    report = aggregate(read_events(args.paths), args.top)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print(render_text(report))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())